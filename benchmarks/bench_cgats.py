@@ -0,0 +1,33 @@
+# usage: python -m benchmarks.bench_cgats
+
+import io
+import time
+import argparse
+import numpy as np
+
+from qdcmdiy import cgats
+from tests.helpers import make_ti3
+
+def timeit(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='compare CGATS parser modes')
+    parser.add_argument('--patches', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'patches':>8} {'tokenizer':>12} {'bulk':>12} {'speedup':>8}")
+    for n in args.patches:
+        content = make_ti3(n)
+        t_tok = timeit(lambda: cgats.read(io.BufferedReader(io.BytesIO(content)), parser='tokenizer'), args.repeat)
+        t_bulk = timeit(lambda: cgats.read(io.BytesIO(content), parser='bulk'), args.repeat)
+        print(f"{n:>8} {t_tok * 1000:>10.1f}ms {t_bulk * 1000:>10.1f}ms {t_tok / t_bulk:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+# usage: python -m benchmarks.bench_hex
+
+import time
+import argparse
+import numpy as np
+
+from qdcmdiy import store_json
+from tests.helpers import legacy_decode_str, legacy_encode
+
+def timeit(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='compare QDCM JSON hex codecs')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[12345, 80000, 400001])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'bytes':>8} {'op':>7} {'legacy':>12} {'numpy':>12} {'speedup':>8}")
+    for size in args.sizes:
+        payload = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+        encoded = store_json.encode(payload)
+        assert encoded == legacy_encode(payload)
+        assert store_json.decode_str(encoded) == legacy_decode_str(encoded) == payload
+        for op, legacy, new, arg in [
+            ('encode', legacy_encode, store_json.encode, payload),
+            ('decode', legacy_decode_str, store_json.decode_str, encoded),
+        ]:
+            t_legacy = timeit(lambda: legacy(arg), args.repeat)
+            t_new = timeit(lambda: new(arg), args.repeat)
+            print(f"{size:>8} {op:>7} {t_legacy * 1000:>10.2f}ms {t_new * 1000:>10.2f}ms {t_legacy / t_new:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
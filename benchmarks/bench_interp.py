@@ -0,0 +1,62 @@
+# usage: python -m benchmarks.bench_interp
+
+import time
+import argparse
+import numpy as np
+import colour
+from colour.algebra.interpolation import table_interpolation_tetrahedral, table_interpolation_trilinear
+
+from qdcmdiy import interp
+
+def timeit(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description='compare qdcmdiy.interp against colour')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=1e-9, help='max abs difference for float64 results')
+    parser.add_argument('--tolerance-float32', type=float, default=1e-4, help='max abs difference for float32 results')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    failed = False
+
+    def report(name, t_colour, t_native, error, tolerance):
+        nonlocal failed
+        ok = error <= tolerance
+        failed = failed or not ok
+        print(f"{name:<40} {t_colour * 1000:>9.2f}ms {t_native * 1000:>9.2f}ms {t_colour / t_native:>7.1f}x  err={error:.1e}{'' if ok else '  FAIL'}")
+
+    print(f"{'case':<40} {'colour':>11} {'native':>11} {'speedup':>8}")
+    for size in (17, 33, 65):
+        table = np.clip(colour.LUT3D.linear_table(size) ** 0.8 + rng.normal(0, 0.01, (size, size, size, 3)), 0, 1)
+        for target in (17, 5):
+            grid = colour.LUT3D.linear_table(target)
+            for method, reference in (('tetrahedral', table_interpolation_tetrahedral), ('trilinear', table_interpolation_trilinear)):
+                t_colour, expected = timeit(lambda: reference(grid, table), args.repeat)
+                t_native, actual = timeit(lambda: interp.apply_lut3d(table, grid, method=method), args.repeat)
+                report(f"{size}^3 -> {target}^3 {method}", t_colour, t_native, np.abs(expected - actual).max(), args.tolerance)
+                t_native, actual = timeit(lambda: interp.apply_lut3d(table, grid, method=method, dtype=np.float32), args.repeat)
+                report(f"{size}^3 -> {target}^3 {method} float32", t_colour, t_native, np.abs(expected - actual).max(), args.tolerance_float32)
+        points = rng.random((1_000_000, 3))
+        t_colour, expected = timeit(lambda: table_interpolation_tetrahedral(points, table), 1)
+        t_native, actual = timeit(lambda: interp.apply_lut3d(table, points), 1)
+        report(f"{size}^3 x 1M points tetrahedral", t_colour, t_native, np.abs(expected - actual).max(), args.tolerance)
+
+    for size in (1024, 4096):
+        lut = colour.LUT3x1D(colour.LUT3x1D.linear_table(size) ** 2.2)
+        for target in (256, 257, 1024):
+            grid = colour.LUT3x1D.linear_table(target)
+            t_colour, expected = timeit(lambda: lut.apply(grid), args.repeat)
+            t_native, actual = timeit(lambda: interp.apply_lut(lut, grid), args.repeat)
+            report(f"1D {size} -> {target}", t_colour, t_native, np.abs(expected - actual).max(), args.tolerance)
+
+    raise SystemExit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
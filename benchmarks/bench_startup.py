@@ -0,0 +1,45 @@
+# usage: python -m benchmarks.bench_startup
+#
+# Runs read-only CLI commands under `python -X importtime` and fails if they
+# import heavy modules or exceed the import time budget.
+
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+
+from tests.helpers import forbidden_modules, make_json_db, make_xml_db, parse_importtime
+
+def measure(argv):
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'qdcmdiy', *argv], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr)
+    return parse_importtime(proc.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='check import cost of read-only commands')
+    parser.add_argument('--budget-ms', type=float, default=400, help='total import time budget per command')
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmpdir:
+        json_db = os.path.join(tmpdir, 'qdcm_calib_data_test.json')
+        xml_db = os.path.join(tmpdir, 'qdcm_calib_data_test.xml')
+        make_json_db(json_db)
+        make_xml_db(xml_db)
+        for argv in (['info', json_db], ['info', xml_db]):
+            modules = measure(argv)
+            total_ms = sum(self_us for self_us, _ in modules.values()) / 1000
+            heavy = sorted(name for name in modules if name.split('.')[0] in forbidden_modules)
+            status = 'ok'
+            if heavy:
+                status = f"FAIL: imports {', '.join(heavy[:5])}"
+            elif total_ms > args.budget_ms:
+                status = f"FAIL: over budget of {args.budget_ms:.0f}ms"
+            failed = failed or status != 'ok'
+            print(f"{' '.join(argv[:1] + [os.path.basename(argv[1])]):<40} {total_ms:>8.1f}ms  {status}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+# usage: python -m benchmarks.suite [--modes N] [--panels N] [--save FILE] [--baseline FILE]
+#
+# Times every CLI path on synthetic data: store load / set_color_pipeline / dump
+# and index scans for XML and JSON databases, CGATS and LUT (.cube, .qlut,
+# .cal) loading, resampling, building a LUT from .ti3 measurements, the hex
+# codecs, and end-to-end patch, batch, merge-lut and deploy (to fake adb
+# devices) runs. Each panel gets its own database file with --modes modes.
+# Results can be saved as JSON and compared against an earlier run; the exit
+# status is 1 if any case regressed.
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import contextlib
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+
+import qdcmdiy
+from qdcmdiy import cgats, characterize, data, index, lutio, store, store_json, store_xml
+from qdcmdiy.pipeline import ColorPipeline
+from tests.fake_adb import make_device
+from tests.helpers import make_ti3
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+srgb_to_linear = os.path.join(root, 'srgb-to-linear.cube')
+linear_to_srgb = os.path.join(root, 'linear-to-srgb.cube')
+
+def json_mode_name(i):
+    return f"gamut {'1' if i % 2 == 0 else '12'} gamma 1 intent {i} Dynamic_range SDR"
+
+def xml_mode_name(i):
+    return f"demo_mode{i}"
+
+def make_json_db(path, panel, num_modes, lut3d, shaper):
+    modes = {}
+    for i in range(num_modes):
+        modes[f"mode{i}"] = {
+            "Applicability": {"ColorPrimaries": 'sRGB' if i % 2 == 0 else 'P3', "GammaTransfer": "sRGB", "RenderIntent": i},
+            "DynamicRange": "SDR",
+            "PostBlendGC": store_json.write_payload('PostBlendGC', shaper),
+            "PostBlendGamut": store_json.write_payload('PostBlendGamut', lut3d),
+            "PostBlendIGC": store_json.write_payload('PostBlendIGC', shaper),
+            "PostBlendPCC": store_json.encode_nested_json(store_json._dummy_pcc),
+        }
+    with open(path, 'w') as f:
+        json.dump({"Copyright": "", "Version": "1", panel: modes}, f, indent=None, separators=(',', ':'))
+
+def make_xml_db(path, panel, num_modes, lut3d, shaper):
+    igc, gamut, gc = store_xml.lut3x1d_to_igc_xml(shaper), store_xml.lut3d_to_xml(lut3d), store_xml.lut3x1d_to_gc_xml(shaper)
+    parts = [f'<?xml version="1.0" encoding="utf-8"?>\n<Calib_Data Version="2">\n  <Disp_Type Name="{panel}"/>\n  <Modes>\n']
+    for i in range(num_modes):
+        parts.append(f'    <Mode Name="{xml_mode_name(i)}" ModeID="{i}">\n')
+        parts.append(f'      <Feature FeatureType="7" Disable="false" DataSize="12300">{igc}</Feature>\n')
+        parts.append(f'      <Feature FeatureType="3" Disable="false" DataSize="117928">{gamut}</Feature>\n')
+        parts.append(f'      <Feature FeatureType="8" Disable="false" DataSize="12300">{gc}</Feature>\n')
+        parts.append(f'      <Feature FeatureType="2" Disable="false" DataSize="272">{"00" * 272}</Feature>\n')
+        parts.append('    </Mode>\n')
+    parts.append('  </Modes>\n</Calib_Data>\n')
+    with open(path, 'w') as f:
+        f.write(''.join(parts))
+
+def timeit(fn, repeat, setup=None):
+    best = float('inf')
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        t0 = time.perf_counter()
+        fn(state)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def clear_payload_memo():
+    data._payload_memo.clear()
+
+def run_cli(*argv, **extra_env):
+    env = {k: v for k, v in os.environ.items() if k != 'QDCMDIY_CACHE_DIR'}
+    env.update(extra_env)
+    subprocess.run([sys.executable, '-m', 'qdcmdiy', *argv], check=True, stdout=subprocess.DEVNULL, env=env, cwd=root)
+
+def build_cases(workdir, args):
+    import colour
+    rng = np.random.default_rng(0)
+    lut3d = colour.LUT3D(np.clip(colour.LUT3D.linear_table(33) ** 0.9 + rng.normal(0, 0.002, (33, 33, 33, 3)), 0, 1))
+    shaper = colour.LUT3x1D(colour.LUT3x1D.linear_table(1024) ** 1.1)
+    cube = os.path.join(workdir, 'lut33.cube')
+    colour.io.write_LUT(lut3d, cube)
+    ti3 = os.path.join(workdir, 'patches.ti3')
+    with open(ti3, 'wb') as f:
+        f.write(make_ti3(args.patches))
+    cal = os.path.join(workdir, 'shaper.cal')
+    with open(cal, 'w') as f:
+        f.write('CAL\n\nKEYWORD "DEVICE_CLASS"\nDEVICE_CLASS "DISPLAY"\nCOLOR_REP "RGB"\n\nNUMBER_OF_FIELDS 4\n'
+                'BEGIN_DATA_FORMAT\nRGB_I RGB_R RGB_G RGB_B\nEND_DATA_FORMAT\n\nNUMBER_OF_SETS 256\nBEGIN_DATA\n')
+        for i in range(256):
+            v = (i / 255) ** 1.05
+            f.write(f'{i / 255:.6f} {v:.6f} {v:.6f} {v:.6f}\n')
+        f.write('END_DATA\n')
+
+    databases = {}
+    for kind, make in (('json', make_json_db), ('xml', make_xml_db)):
+        databases[kind] = []
+        for p in range(args.panels):
+            path = os.path.join(workdir, 'orig', f'qdcm_calib_data_panel{p}.{kind}')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            make(path, f'panel{p}', args.modes, lut3d, shaper)
+            databases[kind].append(path)
+    pipeline = ColorPipeline(data.load_lut3x1d(srgb_to_linear), data.load_lut3d(cube), data.load_lut3x1d(linear_to_srgb))
+    mode_names = {'json': json_mode_name, 'xml': xml_mode_name}
+
+    def work_copy(path):
+        target = os.path.join(workdir, os.path.basename(path))
+        shutil.copyfile(path, target)
+        return target
+
+    cases = {}
+    for kind, paths in databases.items():
+        names = [mode_names[kind](i) for i in range(args.modes)]
+
+        def load_all(_, paths=paths):
+            for path in paths:
+                store.load(path)
+        cases[f'{kind}.load'] = (load_all, None)
+        cases[f'{kind}.index.scan'] = (lambda _, paths=paths: [index.scan_file(path) for path in paths], None)
+
+        def set_all(dbs, names=names):
+            # the XML store reports every feature it finds
+            with contextlib.redirect_stdout(io.StringIO()):
+                for db in dbs:
+                    for name in names:
+                        db.get_mode(name).set_color_pipeline(pipeline)
+        def fresh_dbs(paths=paths):
+            clear_payload_memo()
+            return [store.load(path) for path in paths]
+        cases[f'{kind}.set_color_pipeline'] = (set_all, fresh_dbs)
+
+        def dump_all(dbs):
+            for db in dbs:
+                db.dump(io.StringIO())
+        def patched_dbs(paths=paths, names=names):
+            dbs = fresh_dbs(paths)
+            set_all(dbs, names)
+            return dbs
+        cases[f'{kind}.dump'] = (dump_all, patched_dbs)
+
+        def patch_cli(target, name=names[-1]):
+            run_cli('patch', target, '--mode', name, '--input-shaper', srgb_to_linear, '--3dlut', cube, '--output-shaper', linear_to_srgb)
+        cases[f'{kind}.cli.patch'] = (patch_cli, lambda path=paths[0]: work_copy(path))
+
+        manifest = os.path.join(workdir, f'manifest-{kind}.json')
+        with open(manifest, 'w') as f:
+            stages = {'input-shaper': srgb_to_linear, '3dlut': cube, 'output-shaper': linear_to_srgb}
+            json.dump({'databases': [{'file': [os.path.basename(path) for path in paths], 'modes': {name: stages for name in names}}]}, f)
+        cases[f'{kind}.cli.batch'] = (lambda _, manifest=manifest: run_cli('batch', manifest), lambda paths=paths: [work_copy(path) for path in paths])
+
+    def read_ti3(_):
+        with open(ti3, 'rb') as f:
+            cgats.read(f)
+    cases['cgats.read'] = (read_ti3, None)
+    def read_ti3_mapped(_):
+        with cgats.read_mapped(ti3) as table:
+            table.get_columns(['RGB_R', 'RGB_G', 'RGB_B'])
+    cases['cgats.read_mapped'] = (read_ti3_mapped, None)
+    model = characterize.InverseModel.from_ti3(ti3)
+    cases['characterize.sample_3d'] = (lambda _: (model.sample_3d(17), model.sample_3d(5)), None)
+    cases['data.load_anylut.cube'] = (lambda _: data.load_anylut(cube), None)
+    cases['data.load_anylut.cube_1d'] = (lambda _: data.load_anylut(srgb_to_linear), None)
+    qlut = os.path.join(workdir, 'lut33.qlut')
+    lutio.write_qlut(lut3d, qlut)
+    cases['data.load_anylut.qlut'] = (lambda _: data.load_anylut(qlut), None)
+    cases['data.load_anylut.cal'] = (lambda _: data.load_anylut(cal), None)
+    cases['data.resample_lut'] = (lambda _: data.resample_lut(lut3d, 17), None)
+    payload = rng.integers(0, 256, 400001, dtype=np.uint8).tobytes()
+    encoded = store_json.encode(payload)
+    cases['store_json.encode'] = (lambda _: store_json.encode(payload), None)
+    cases['store_json.decode_str'] = (lambda _: store_json.decode_str(encoded), None)
+    cases['store_xml.lut3d_to_xml'] = (lambda _: store_xml.lut3d_to_xml.__wrapped__(lut3d), None)
+    cases['store_json.gamut_payload'] = (lambda _: store_json.write_payload('PostBlendGamut', lut3d), None)
+    merged = os.path.join(workdir, 'merged.cube')
+    cases['cli.merge-lut'] = (lambda _: run_cli('merge-lut', cube, srgb_to_linear, merged), None)
+
+    # one fake device per JSON database, see tests/fake_adb.py
+    rack = os.path.join(workdir, 'rack')
+    def make_rack():
+        shutil.rmtree(rack, ignore_errors=True)
+        for i, path in enumerate(databases['json']):
+            make_device(rack, f'device{i}', f'panel{i}', path)
+    fake_adb = f'{sys.executable} {os.path.join(root, "tests", "fake_adb.py")}'
+    cases['cli.deploy'] = (lambda _: run_cli('deploy', '--adb', fake_adb, '--mode', json_mode_name(0), '--3dlut', cube, FAKE_ADB_ROOT=rack), make_rack)
+    return cases
+
+def compare(results, baseline, threshold, min_delta):
+    regressions = []
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if seconds > before * threshold and seconds - before > min_delta:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='time every CLI path on synthetic data')
+    parser.add_argument('--modes', type=int, default=8, help='modes per database file')
+    parser.add_argument('--panels', type=int, default=2, help='database files (one per panel) per format')
+    parser.add_argument('--patches', type=int, default=20000, help='patches in the synthetic .ti3 file')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-k', '--filter', default='', metavar='TEXT', help='only run cases whose name contains TEXT')
+    parser.add_argument('--save', metavar='FILE', help='write results to a JSON file')
+    parser.add_argument('--baseline', metavar='FILE', help='compare against results saved by --save')
+    parser.add_argument('--threshold', type=float, default=1.25, help='flag cases slower than baseline by this factor (default: 1.25)')
+    parser.add_argument('--min-delta-ms', type=float, default=2, help='ignore slowdowns smaller than this (default: 2)')
+    args = parser.parse_args()
+
+    import warnings
+    warnings.simplefilter("ignore")
+    from qdcmdiy import cache
+    cache.disable()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        cases = build_cases(workdir, args)
+        print(f"{'case':<32} {'time':>11} {'baseline':>11} {'ratio':>7}")
+        for name, (fn, setup) in cases.items():
+            if args.filter not in name:
+                continue
+            seconds = timeit(fn, args.repeat, setup)
+            results[name] = seconds
+            line = f"{name:<32} {seconds * 1000:>9.2f}ms"
+            if name in baseline:
+                ratio = seconds / baseline[name]
+                flag = '  REGRESSION' if compare({name: seconds}, baseline, args.threshold, args.min_delta_ms / 1000) else ''
+                line += f" {baseline[name] * 1000:>9.2f}ms {ratio:>6.2f}x{flag}"
+            print(line)
+
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms / 1000)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'version': qdcmdiy.__version__,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'params': {'modes': args.modes, 'panels': args.panels, 'patches': args.patches, 'repeat': args.repeat},
+                'results': results,
+            }, f, indent=2)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
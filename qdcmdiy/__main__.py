@@ -1,3 +1,4 @@
+import os
 import sys
 import argparse
 
@@ -8,33 +9,107 @@ def info(filename):
     for mode in db.get_mode_names():
         print(mode)
 
-def patch(filename, mode, input_shaper, lut3d, output_shaper):
+def patch(filename, mode, input_shaper, lut3d, output_shaper, lock):
+    import qdcmdiy.batch
+    job = qdcmdiy.batch.DatabaseJob(filename, [qdcmdiy.batch.ModeSpec(mode, input_shaper, lut3d, output_shaper)])
+    qdcmdiy.batch.run_job(job, qdcmdiy.batch.LutCache(), lock)
+
+def batch(manifest_filename, num_jobs, lock):
+    import qdcmdiy.batch
+    jobs = qdcmdiy.batch.load_manifest(manifest_filename)
+    qdcmdiy.batch.run(jobs, num_jobs, lock)
+
+def index(roots, db_filename, num_jobs, sql):
+    import qdcmdiy.index
+    conn = qdcmdiy.index.connect(db_filename)
+    try:
+        if roots:
+            qdcmdiy.index.update(conn, roots, num_jobs)
+        if sql:
+            qdcmdiy.index.query(conn, sql)
+    finally:
+        conn.close()
+
+def build(manifest_filename, num_jobs, lock, force, watch, poll):
+    import qdcmdiy.build
+    qdcmdiy.build.build(manifest_filename, num_jobs, lock, force)
+    if watch:
+        qdcmdiy.build.watch(manifest_filename, num_jobs, lock, poll)
+
+def simulate(filename, mode, input_shaper, lut3d, output_shaper, bits, step, images, max_error):
     import qdcmdiy.store
-    import qdcmdiy.pipeline
-    import qdcmdiy.data
-    db = qdcmdiy.store.load(filename)
-    mode = db.get_mode(mode)
-    pipeline = qdcmdiy.pipeline.ColorPipeline()
-    if input_shaper is not None:
-        pipeline.degamma = qdcmdiy.data.load_lut3x1d(input_shaper)
-    if lut3d is not None:
-        pipeline.gamut = qdcmdiy.data.load_lut3d(lut3d)
-    if output_shaper is not None:
-        pipeline.gamma = qdcmdiy.data.load_lut3x1d(output_shaper)
-    mode.set_color_pipeline(pipeline)
-    with open(filename, 'w', encoding='utf-8') as f:
-        db.dump(f)
-
-def merge_lut(lut1_filename, lut2_filename, out_filename):
-    import qdcmdiy.data
+    import qdcmdiy.batch
+    import qdcmdiy.simulate
+    decoded = qdcmdiy.store.load(filename).get_mode(mode).get_color_pipeline()
+    device = qdcmdiy.simulate.DevicePipeline(decoded)
+    if input_shaper or lut3d or output_shaper:
+        spec = qdcmdiy.batch.ModeSpec(mode, input_shaper, lut3d, output_shaper)
+        intended = qdcmdiy.batch.LutCache().pipeline(spec)
+    else:
+        # without the source LUTs, measure only the loss between stages
+        intended = decoded
+    reference = qdcmdiy.simulate.float_pipeline(intended)
+    if images:
+        chunks = qdcmdiy.simulate.image_pixels(images, bits)
+    else:
+        chunks = qdcmdiy.simulate.code_value_grid(bits, step)
+    stats = qdcmdiy.simulate.simulate(device, reference, chunks)
+    print(stats.report(bits))
+    if max_error is not None and stats.max.max() > max_error:
+        print(f"max error {stats.max.max():.3f} exceeds {max_error}", file=sys.stderr)
+        sys.exit(1)
+
+def serve(host, port, socket_path):
+    import qdcmdiy.api
+    try:
+        qdcmdiy.api.serve(host, port, socket_path)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+def deploy(mode, input_shaper, lut3d, output_shaper, devices, num_jobs, retries, timeout, adb, remote_path, reboot):
+    import qdcmdiy.deploy
+    try:
+        results = qdcmdiy.deploy.deploy(mode, input_shaper, lut3d, output_shaper, devices, num_jobs, retries, timeout, adb, remote_path, reboot)
+    except qdcmdiy.deploy.NoDevicesError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    if any(result.error is not None for result in results):
+        sys.exit(1)
+
+def write_lut(lut, out_filename, float32=False):
+    import numpy as np
     import colour
+    if out_filename.endswith('.qlut'):
+        import qdcmdiy.lutio
+        qdcmdiy.lutio.write_qlut(lut, out_filename, np.float32 if float32 else np.float64)
+    else:
+        colour.io.write_LUT_IridasCube(lut, out_filename)
+
+def merge_lut(lut1_filename, lut2_filename, out_filename, float32=False):
+    import qdcmdiy.data
+    import qdcmdiy.pipeline
     lut1 = qdcmdiy.data.load_anylut(lut1_filename)
-    lut2 = qdcmdiy.data.load_anylut(lut2_filename)
+    lut2 = qdcmdiy.pipeline.as_transform(qdcmdiy.data.load_anylut(lut2_filename))
     merged = type(lut1)(lut2.apply(lut1.table))
-    colour.io.write_LUT_IridasCube(merged, out_filename)
+    write_lut(merged, out_filename, float32)
+
+def build_lut(measurements, out_filename, source, size, neighbours, float32=False):
+    import colour
+    import qdcmdiy.characterize
+    model = qdcmdiy.characterize.InverseModel.from_ti3(measurements, source=source, neighbours=neighbours)
+    lut = model.sample_3d(size)
+    lut.name = os.path.splitext(os.path.basename(out_filename))[0]
+    print(model.report(colour.LUT3D.linear_table(size), lut.table))
+    write_lut(lut, out_filename, float32)
 
 def main():
     parser = argparse.ArgumentParser()
+    parser.add_argument('--cache', action='store_true', help='cache converted LUT payloads on disk across runs (also enabled by QDCMDIY_CACHE_DIR)')
+    parser.add_argument('--cache-dir', metavar='DIR', help='cache directory (implies --cache)')
+    parser.add_argument('--profile', metavar='FILE', help='write a Chrome trace (JSON) of stage timings and peak RSS, and print a summary')
+    parser.add_argument('--profile-allocations', action='store_true', help='with --profile, also trace Python allocations per stage (slow)')
+    parser.add_argument('--cache-size', type=int, default=512, metavar='MB', help='evict least recently used cache entries above this size (default: 512)')
 
     commands = parser.add_subparsers(dest='command', metavar='command', )
 
@@ -43,18 +118,145 @@ def main():
 
     parser_patch = commands.add_parser('patch', help='replace calibration pipeline in qdcm database file', formatter_class=argparse.RawTextHelpFormatter)
     parser_patch.add_argument('filename', help='qdcm database file')
-    parser_patch.add_argument('--mode', help='the mode to be patched')
-    parser_patch.add_argument('--input-shaper', help='3x1D LUT file for input shaper (8-bit input / 12-bit output)', metavar='FILE')
-    parser_patch.add_argument('--3dlut', help='3D LUT file applied after input shaper (17x17x17 / 12-bit output)', dest='lut3d', metavar='FILE')
-    parser_patch.add_argument('--output-shaper', help='3x1D LUT file applied after 3D LUT (10-bit input / output)', metavar='FILE')
-    parser_patch.epilog = "Unspecified stages will be disabled. Other settings (e.g. game enhancement) is remain unchanged.\n\nSupported file formats:\n    IRIDAS/Resolve .cube\n    ArgyllCMS/DisplayCAL .cal"
+    parser_patch.add_argument('--mode', required=True, help='the mode to be patched')
+    parser_patch.add_argument('--input-shaper', action='append', help='3x1D LUT file for input shaper (8-bit input / 12-bit output)', metavar='FILE')
+    parser_patch.add_argument('--3dlut', action='append', help='3D LUT file applied after input shaper (17x17x17 / 12-bit output)', dest='lut3d', metavar='FILE')
+    parser_patch.add_argument('--output-shaper', action='append', help='3x1D LUT file applied after 3D LUT (10-bit input / output)', metavar='FILE')
+    parser_patch.add_argument('--lock', action='store_true', help='hold a lock on the file while patching, so concurrent runs on the same file do not lose each other\'s changes')
+    parser_patch.epilog = "Unspecified stages will be disabled. Other settings (e.g. game enhancement) is remain unchanged.\n\nRepeat an option to chain several LUT files in that stage, e.g.\n    --3dlut displaycal-output.cube --3dlut srgb-to-linear.cube\nChains are sampled once at the size the calibration file needs, no merge-lut step required.\n\nSupported file formats:\n    IRIDAS/Resolve .cube\n    ArgyllCMS/DisplayCAL .cal\n    qdcmdiy binary LUT .qlut (written by merge-lut), loaded without parsing\n    builtin:<name>, analytic transfer function evaluated without a file:\n        srgb-eotf, pq-eotf, bt1886-eotf, hlg-oetf, gamma-<N>\n        (append -inverse for the inverse, e.g. builtin:srgb-eotf-inverse)"
+
+
+    parser_batch = commands.add_parser('batch', help='patch many modes of many qdcm database files', formatter_class=argparse.RawTextHelpFormatter)
+    parser_batch.add_argument('manifest', help='JSON or YAML manifest file')
+    parser_batch.add_argument('-j', '--jobs', type=int, default=1, metavar='N', help='number of worker processes (0 = number of CPUs)')
+    parser_batch.add_argument('--lock', action='store_true', help='hold a lock on each file while patching it, see patch --help')
+    parser_batch.epilog = """Each database file is loaded and written once, and each LUT file is loaded once.
+A list of LUT files in a stage is chained in order.
+
+Manifest example (YAML), paths are relative to the manifest:
+    databases:
+      - file: qdcm_calib_data_*.xml
+        output: patched/        # optional, default: patch the files in place
+        modes:
+          demo_srgb:
+            input-shaper: srgb-to-linear.cube
+            3dlut: qdcm-3dlut.cube
+            output-shaper: qdcm-output-shaper.cube
+          demo_p3:
+            input-shaper: srgb-to-linear.cube
+            3dlut: [displaycal-p3.cube, srgb-to-linear.cube]
+            output-shaper: [linear-to-srgb.cube, displaycal-p3.cal]"""
+
+    parser_build = commands.add_parser('build', help='patch only what changed since the last build of a batch manifest', formatter_class=argparse.RawTextHelpFormatter)
+    parser_build.add_argument('manifest', help='JSON or YAML manifest file, see batch --help')
+    parser_build.add_argument('-j', '--jobs', type=int, default=1, metavar='N', help='number of worker processes (0 = number of CPUs)')
+    parser_build.add_argument('--lock', action='store_true', help='hold a lock on each file while patching it, see patch --help')
+    parser_build.add_argument('--force', action='store_true', help='rebuild everything')
+    parser_build.add_argument('--watch', action='store_true', help='keep running and rebuild when the manifest or an input file changes')
+    parser_build.add_argument('--poll', action='store_true', help='with --watch, poll for changes instead of using inotify')
+    parser_build.epilog = """The hashes of each mode's LUT files, the source database and the qdcmdiy
+version are kept in .<manifest>.state.json next to the manifest. Only modes
+whose inputs changed are patched again. Set output: in the manifest to keep the
+stock files untouched; they are then patched afresh whenever they change."""
+
+    parser_simulate = commands.add_parser('simulate', help='run code values through a patched mode as the display would', formatter_class=argparse.RawTextHelpFormatter)
+    parser_simulate.add_argument('filename', help='qdcm database file')
+    parser_simulate.add_argument('--mode', required=True, help='the mode to be simulated')
+    parser_simulate.add_argument('--input-shaper', action='append', help='intended input shaper, as for patch', metavar='FILE')
+    parser_simulate.add_argument('--3dlut', action='append', help='intended 3D LUT, as for patch', dest='lut3d', metavar='FILE')
+    parser_simulate.add_argument('--output-shaper', action='append', help='intended output shaper, as for patch', metavar='FILE')
+    parser_simulate.add_argument('--bits', type=int, choices=(8, 10), default=8, help='input code value depth (default: 8)')
+    parser_simulate.add_argument('--step', type=int, default=1, metavar='N', help='use every N-th code value of the grid (default: 1)')
+    parser_simulate.add_argument('--image', action='append', dest='images', metavar='FILE', help='use the pixels of image files instead of the code value grid')
+    parser_simulate.add_argument('--max-error', type=float, metavar='CODES', help='exit with status 1 if the max error exceeds this many 10-bit codes')
+    parser_simulate.epilog = """The mode's IGC, 3D LUT and GC tables are decoded from the file and applied with
+the display's precision: IGC interpolated to 12-bit, 17x17x17 3D LUT (tetrahedral)
+to 12-bit, GC looked up by the 10-bit signal. The result is compared against the
+intended pipeline evaluated in floating point, given with the same stage options
+as patch; without them the decoded tables are used, measuring only the
+quantization between stages."""
+
+    parser_serve = commands.add_parser('serve', help='serve patch requests over local HTTP, keeping LUTs and databases cached', formatter_class=argparse.RawTextHelpFormatter)
+    parser_serve.add_argument('--host', default='127.0.0.1', help='loopback address to listen on (default: 127.0.0.1)')
+    parser_serve.add_argument('--port', type=int, default=8765, help='TCP port (default: 8765)')
+    parser_serve.add_argument('--socket', dest='socket_path', metavar='PATH', help='listen on a Unix socket instead of TCP')
+    parser_serve.epilog = """Requests:
+    POST /patch?mode=NAME&input-shaper=FILE&3dlut=FILE&output-shaper=FILE
+        body: qdcm database file, response: patched database file
+        stage parameters can be repeated to chain LUTs, FILE is a path on the
+        server or builtin:<name>
+    POST /modes    body: qdcm database file, response: JSON list of modes
+    GET  /status   response: JSON with cache statistics
+
+Example:
+    curl --data-binary @qdcm_calib_data.xml -o patched.xml \\
+        'http://127.0.0.1:8765/patch?mode=demo_srgb&3dlut=/luts/qdcm-3dlut.cube'"""
 
+    parser_deploy = commands.add_parser('deploy', help='pull, patch and install the qdcm database file of many devices over adb', formatter_class=argparse.RawTextHelpFormatter)
+    parser_deploy.add_argument('--mode', required=True, help='the mode to be patched')
+    parser_deploy.add_argument('--input-shaper', action='append', help='input shaper, as for patch', metavar='FILE')
+    parser_deploy.add_argument('--3dlut', action='append', help='3D LUT, as for patch', dest='lut3d', metavar='FILE')
+    parser_deploy.add_argument('--output-shaper', action='append', help='output shaper, as for patch', metavar='FILE')
+    parser_deploy.add_argument('-d', '--device', action='append', dest='devices', metavar='SERIAL', help='device serial, can be repeated (default: every device adb lists)')
+    parser_deploy.add_argument('-j', '--jobs', type=int, default=4, metavar='N', help='number of devices handled at a time (default: 4)')
+    parser_deploy.add_argument('--retries', type=int, default=2, metavar='N', help='retries of a failed or timed out adb step (default: 2)')
+    parser_deploy.add_argument('--timeout', type=float, default=60, metavar='SECONDS', help='timeout of each adb command (default: 60)')
+    parser_deploy.add_argument('--adb', default='adb', metavar='COMMAND', help='adb executable or command line (default: adb)')
+    parser_deploy.add_argument('--remote-path', default='/data/adb/modules/qdcm-diy/system{path}', metavar='TEMPLATE',
+                               help='where the patched file is installed; {path} is the stock file path,\n{name} its file name, {panel} the panel name\n(default: /data/adb/modules/qdcm-diy/system{path})')
+    parser_deploy.add_argument('--reboot', action='store_true', help='reboot each device after installing')
+    parser_deploy.epilog = """For each device, the panel name and the stock file
+(/vendor/etc/display/qdcm_calib_data_<panel>.json or /vendor/etc/qdcm_calib_data_<panel>.xml)
+are found as described in the README, and the file is pulled, patched and installed
+with root (su), keeping the SELinux context of the stock file. By default it is
+installed into a Magisk / KernelSU module, which replaces the stock file on the next boot.
+
+The mode names of XML and JSON files differ, deploy to one kind of device at a time.
+
+example:
+    qdcm-diy deploy --mode "gamut 1 gamma 1 intent 0 Dynamic_range SDR" --3dlut srgb.cube -j 8 --reboot"""
+
+    parser_index = commands.add_parser('index', help='index panels, modes and features of many qdcm database files into SQLite', formatter_class=argparse.RawTextHelpFormatter)
+    parser_index.add_argument('roots', nargs='*', metavar='PATH', help='directories to search for qdcm_calib_data_*.xml/json, or database files')
+    parser_index.add_argument('--db', default='qdcm-index.sqlite', metavar='FILE', help='index file (default: qdcm-index.sqlite)')
+    parser_index.add_argument('-j', '--jobs', type=int, default=0, metavar='N', help='number of worker processes (default: 0 = number of CPUs)')
+    parser_index.add_argument('--query', metavar='SQL', help='run a query against the index afterwards and print the rows')
+    parser_index.epilog = """Only files whose size or modification time changed since the last run are scanned,
+and payloads are hashed without being decoded.
+
+Tables: files(path, format, panel, size, mtime_ns, error), modes(file_id, key, name),
+features(mode_id, feature, enabled, size, hash), and the joined view
+inventory(path, panel, mode_key, mode, feature, enabled, size, hash).
+mode is the name patch --mode takes; feature is the JSON key or the XML FeatureType.
+
+example:
+    qdcm-diy index firmware/ --query "SELECT DISTINCT panel FROM inventory
+        WHERE mode = 'demo_srgb' AND feature IN ('PostBlendGamut', '3') AND enabled\""""
+
+    parser_build_lut = commands.add_parser('build-lut', help='build a 3D LUT from display measurements', formatter_class=argparse.RawTextHelpFormatter)
+    parser_build_lut.add_argument('measurements', help='ArgyllCMS .ti3 file with RGB_R/G/B and XYZ_X/Y/Z fields')
+    parser_build_lut.add_argument('out', help='output LUT file, .cube or .qlut')
+    parser_build_lut.add_argument('--source', default='sRGB', metavar='NAME', help='source colourspace, e.g. sRGB, "Display P3", "ITU-R BT.2020" (default: sRGB)')
+    parser_build_lut.add_argument('--size', type=int, default=17, help='LUT size (default: 17)')
+    parser_build_lut.add_argument('--neighbours', type=int, default=16, metavar='K', help='measurements used for each local fit (default: 16)')
+    parser_build_lut.add_argument('--float32', action='store_true', help='store the .qlut table as float32 (default: float64)')
+    parser_build_lut.epilog = """The LUT maps linear RGB in the source colourspace to device RGB, relative
+colorimetric (the source white becomes the measured white), clipping colours
+outside the display gamut. Use it with a linearizing input shaper and no
+output shaper, e.g.
+    qdcm-diy build-lut display.ti3 srgb.cube --source sRGB
+    qdcm-diy patch qdcm_calib_data.xml --mode demo_srgb --input-shaper builtin:srgb-eotf --3dlut srgb.cube
+
+The default size 17 holds the 17x17x17 grid the calibration file stores, and
+the 5x5x5 coarse grid of JSON files is a subset of it, so the model is evaluated
+exactly at the points the device uses."""
 
     parser_merge_lut = commands.add_parser('merge-lut', help='merge two LUT files', formatter_class=argparse.RawTextHelpFormatter)
     parser_merge_lut.add_argument('lut1', help='first LUT file')
     parser_merge_lut.add_argument('lut2', help='second LUT file')
-    parser_merge_lut.add_argument('out', help='output LUT file')
-    parser_merge_lut.epilog = "out(input) = lut2(lut1(input))\n\nmerged LUT will have the same type and size as lut1\n\nSupported file formats:\n    IRIDAS/Resolve .cube\n    ArgyllCMS/DisplayCAL .cal"
+    parser_merge_lut.add_argument('out', help='output LUT file, .cube or .qlut')
+    parser_merge_lut.add_argument('--float32', action='store_true', help='store the .qlut table as float32 (default: float64)')
+    parser_merge_lut.epilog = "out(input) = lut2(lut1(input))\n\nmerged LUT will have the same type and size as lut1, lut2 may be a builtin transfer function\n\nSupported file formats:\n    IRIDAS/Resolve .cube\n    ArgyllCMS/DisplayCAL .cal\n    qdcmdiy binary LUT .qlut (written by merge-lut), loaded without parsing\n    builtin:<name>, analytic transfer function evaluated without a file:\n        srgb-eotf, pq-eotf, bt1886-eotf, hlg-oetf, gamma-<N>\n        (append -inverse for the inverse, e.g. builtin:srgb-eotf-inverse)"
 
 
     args = parser.parse_args()
@@ -62,16 +264,51 @@ def main():
     import warnings
     warnings.simplefilter("ignore")
 
+    cache_dir = args.cache_dir or os.environ.get('QDCMDIY_CACHE_DIR')
+    if args.cache or cache_dir:
+        import qdcmdiy.cache
+        qdcmdiy.cache.enable(cache_dir, args.cache_size * 1024 * 1024)
+
+    import qdcmdiy.instrument
+    tracer = qdcmdiy.instrument.enable(args.profile_allocations) if args.profile else None
+    if tracer is not None and args.command not in (None, 'info', 'index'):
+        # attribute the import cost instead of charging it to the first stage that needs it
+        with tracer.span('import', module='colour'):
+            import colour
+
     # print(args)
     if args.command is None:
         parser.print_help()
         sys.exit(1)
-    elif args.command == 'info':
-        info(args.filename)
-    elif args.command == 'patch':
-        patch(args.filename, args.mode, args.input_shaper, args.lut3d, args.output_shaper)
-    elif args.command == 'merge-lut':
-        merge_lut(args.lut1, args.lut2, args.out)
+    # also when a command exits early, e.g. simulate --max-error or a failed deploy
+    try:
+        with qdcmdiy.instrument.span(args.command):
+            if args.command == 'info':
+                info(args.filename)
+            elif args.command == 'patch':
+                patch(args.filename, args.mode, args.input_shaper, args.lut3d, args.output_shaper, args.lock)
+            elif args.command == 'batch':
+                batch(args.manifest, args.jobs, args.lock)
+            elif args.command == 'build':
+                build(args.manifest, args.jobs, args.lock, args.force, args.watch, args.poll)
+            elif args.command == 'simulate':
+                simulate(args.filename, args.mode, args.input_shaper, args.lut3d, args.output_shaper, args.bits, args.step, args.images, args.max_error)
+            elif args.command == 'serve':
+                serve(args.host, args.port, args.socket_path)
+            elif args.command == 'deploy':
+                deploy(args.mode, args.input_shaper, args.lut3d, args.output_shaper, args.devices, args.jobs, args.retries, args.timeout, args.adb, args.remote_path, args.reboot)
+            elif args.command == 'index':
+                index(args.roots, args.db, args.jobs, args.query)
+            elif args.command == 'build-lut':
+                build_lut(args.measurements, args.out, args.source, args.size, args.neighbours, args.float32)
+            elif args.command == 'merge-lut':
+                merge_lut(args.lut1, args.lut2, args.out, args.float32)
+    finally:
+        if args.cache or cache_dir:
+            print(qdcmdiy.cache.get_active().stats(), file=sys.stderr)
+        if tracer is not None:
+            tracer.write(args.profile)
+            print(tracer.summary(), file=sys.stderr)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,218 @@
+import os
+import copy
+import json
+import hashlib
+import ipaddress
+import threading
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import urlsplit, parse_qs
+
+import qdcmdiy
+from qdcmdiy import store
+from qdcmdiy.batch import LutCache, ModeSpec
+from qdcmdiy.pipeline import ColorPipeline
+from qdcmdiy.transfer import is_builtin
+
+# In-process API for services that patch many databases: parsed databases are
+# kept by content hash and copied per request, LUT files are kept until they
+# change on disk, and converted payloads are memoized as in the CLI.
+
+class UnknownModeError(KeyError):
+    pass
+
+class _FileLutCache(LutCache):
+    def __init__(self, max_luts: int = 64):
+        super().__init__()
+        self.luts = OrderedDict()
+        self.max_luts = max_luts
+
+    def _load(self, loader, filename):
+        # a long running process must notice LUT files being replaced; only the
+        # latest version of each file is kept, and the least recently used files
+        # are dropped beyond max_luts
+        key = (loader.__name__, filename)
+        version = None
+        if not is_builtin(filename):
+            st = os.stat(filename)
+            version = (st.st_mtime_ns, st.st_size)
+        cached = self.luts.get(key)
+        if cached is not None and cached[0] == version:
+            self.luts.move_to_end(key)
+            return cached[1]
+        lut = loader(filename)
+        self.luts[key] = (version, lut)
+        self.luts.move_to_end(key)
+        while len(self.luts) > self.max_luts:
+            self.luts.popitem(last=False)
+        return lut
+
+class Session:
+    def __init__(self, max_databases: int = 16):
+        self.max_databases = max_databases
+        self.databases = OrderedDict()
+        self.luts = _FileLutCache()
+        self.lock = threading.Lock()
+        self.lut_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load_database(self, data: bytes, format: Optional[str] = None) -> store.QdcmDatabase:
+        key = (format, hashlib.sha256(data).hexdigest())
+        with self.lock:
+            template = self.databases.get(key)
+            if template is not None:
+                self.databases.move_to_end(key)
+                self.hits += 1
+        if template is None:
+            template = store.loads(data, format)
+            with self.lock:
+                self.misses += 1
+                self.databases[key] = template
+                if len(self.databases) > self.max_databases:
+                    self.databases.popitem(last=False)
+        # the cached database is never modified, every caller gets its own copy
+        return copy.deepcopy(template)
+
+    def pipeline(self, input_shaper=None, lut3d=None, output_shaper=None) -> ColorPipeline:
+        # stages are LUT file names or builtin:<name>, or lists of them chained in order
+        with self.lut_lock:
+            return self.luts.pipeline(ModeSpec('', input_shaper, lut3d, output_shaper))
+
+    def patch_bytes(self, db_bytes: bytes, mode: str, pipeline: ColorPipeline, format: Optional[str] = None) -> bytes:
+        return self.patch_database(self.load_database(db_bytes, format), mode, pipeline)
+
+    def patch_database(self, db: store.QdcmDatabase, mode: str, pipeline: ColorPipeline) -> bytes:
+        if mode not in db.get_mode_names():
+            raise UnknownModeError(mode)
+        db.get_mode(mode).set_color_pipeline(pipeline)
+        return store.dumps(db)
+
+    def mode_names(self, db_bytes: bytes, format: Optional[str] = None) -> list[str]:
+        return self.load_database(db_bytes, format).get_mode_names()
+
+    def stats(self) -> dict:
+        return {'databases': len(self.databases), 'database_hits': self.hits, 'database_misses': self.misses, 'luts': len(self.luts.luts)}
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+def default_session() -> Session:
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = Session()
+        return _default_session
+
+def patch_bytes(db_bytes: bytes, mode: str, pipeline: ColorPipeline, format: Optional[str] = None) -> bytes:
+    return default_session().patch_bytes(db_bytes, mode, pipeline, format)
+
+def load_pipeline(input_shaper=None, lut3d=None, output_shaper=None) -> ColorPipeline:
+    return default_session().pipeline(input_shaper, lut3d, output_shaper)
+
+# Local server: HTTP over TCP (loopback addresses only, stage parameters name
+# files on the server) or a Unix socket.
+#
+#   POST /patch?mode=<name>&input-shaper=<file>&3dlut=<file>&output-shaper=<file>
+#        body: database file, response: patched database file
+#        stage parameters may be repeated to chain LUTs, and are files on the
+#        server's file system or builtin:<name>
+#   POST /modes    body: database file, response: JSON list of mode names
+#   GET  /status   response: JSON with version and cache statistics
+
+def _make_handler(session: Session):
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def address_string(self):
+            # Unix socket peers have no address
+            return self.client_address[0] if self.client_address else 'local'
+
+        def _reply(self, status, body: bytes, content_type='application/octet-stream'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status, message):
+            self._reply(status, (message + '\n').encode(), 'text/plain; charset=utf-8')
+
+        def do_GET(self):
+            if urlsplit(self.path).path != '/status':
+                return self._error(404, 'not found')
+            status = {'version': qdcmdiy.__version__, **session.stats()}
+            from qdcmdiy import cache
+            disk_cache = cache.get_active()
+            if disk_cache is not None:
+                status['payload_cache_hits'] = disk_cache.hits
+                status['payload_cache_misses'] = disk_cache.misses
+            self._reply(200, json.dumps(status).encode(), 'application/json')
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            params = parse_qs(url.query)
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if url.path not in ('/modes', '/patch'):
+                return self._error(404, 'not found')
+            if url.path == '/patch' and 'mode' not in params:
+                return self._error(400, 'missing mode parameter')
+            try:
+                if url.path == '/patch':
+                    pipeline = session.pipeline(params.get('input-shaper'), params.get('3dlut'), params.get('output-shaper'))
+                try:
+                    db = session.load_database(body)
+                except Exception as e:
+                    # malformed uploads fail in many ways (expat, JSON, missing keys)
+                    return self._error(400, f'cannot parse database: {type(e).__name__}: {e}')
+                if url.path == '/modes':
+                    return self._reply(200, json.dumps(db.get_mode_names()).encode(), 'application/json')
+                self._reply(200, session.patch_database(db, params['mode'][0], pipeline))
+            except UnknownModeError as e:
+                self._error(404, f'unknown mode {e}')
+            except (ValueError, AssertionError, OSError) as e:
+                self._error(400, f'{type(e).__name__}: {e}')
+            except Exception as e:
+                self._error(500, f'{type(e).__name__}: {e}')
+
+    return Handler
+
+def _is_loopback(host: str) -> bool:
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def make_server(session: Session, host: str = '127.0.0.1', port: int = 8765, socket_path: Optional[str] = None):
+    import socketserver
+    from http.server import ThreadingHTTPServer
+    handler = _make_handler(session)
+    if socket_path is None:
+        if not _is_loopback(host):
+            raise ValueError(f"refusing to listen on {host}, requests can read any file the server can; use a loopback address or a Unix socket")
+        return ThreadingHTTPServer((host, port), handler)
+
+    class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    return UnixServer(socket_path, handler)
+
+def serve(host: str = '127.0.0.1', port: int = 8765, socket_path: Optional[str] = None):
+    session = default_session()
+    server = make_server(session, host, port, socket_path)
+    import colour  # imported up front so the first request does not pay for it
+    print(f"serving on {socket_path or f'http://{host}:{server.server_address[1]}'}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.unlink(socket_path)
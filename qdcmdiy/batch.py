@@ -0,0 +1,244 @@
+import os
+import time
+import glob
+import json
+
+from qdcmdiy import instrument
+from qdcmdiy.pipeline import ColorPipeline, Transform, compose
+from qdcmdiy.transfer import is_builtin
+
+# Manifest layout (JSON or YAML), paths are relative to the manifest file:
+#
+#   databases:
+#     - file: qdcm_calib_data_*.xml        # a path, glob, or list of them
+#       output: patched/                    # optional, write patched files to this directory
+#                                           # instead of patching them in place
+#       modes:
+#         demo_srgb:
+#           input-shaper: srgb-to-linear.cube
+#           3dlut: qdcm-3dlut-srgb.cube
+#           output-shaper: qdcm-output-shaper.cube
+#         demo_p3:                          # a list of files is chained in order
+#           input-shaper: srgb-to-linear.cube
+#           3dlut: [displaycal-p3.cube, srgb-to-linear.cube]
+#           output-shaper: [linear-to-srgb.cube, displaycal-p3.cal]
+#         demo_gamma22:                     # analytic curves by name, see qdcmdiy.transfer
+#           input-shaper: builtin:gamma-2.2
+#           output-shaper: builtin:srgb-eotf-inverse
+
+_stage_keys = {'input-shaper', '3dlut', 'output-shaper'}
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    elif isinstance(value, str):
+        return [value]
+    return list(value)
+
+class ModeSpec:
+    # each stage is a file name or a list of file names chained in order
+    def __init__(self, name: str, input_shaper=None, lut3d=None, output_shaper=None):
+        self.name = name
+        self.input_shaper = _as_list(input_shaper)
+        self.lut3d = _as_list(lut3d)
+        self.output_shaper = _as_list(output_shaper)
+
+class DatabaseJob:
+    def __init__(self, filename: str, modes: list[ModeSpec], output: str = None):
+        self.filename = filename
+        self.modes = modes
+        # the patched database is written here, by default over the source
+        self.output = output or filename
+
+def _read_manifest_doc(filename: str):
+    with open(filename, 'r', encoding='utf-8') as f:
+        if filename.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("PyYAML is required for YAML manifests") from None
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def load_manifest(filename: str) -> list[DatabaseJob]:
+    doc = _read_manifest_doc(filename)
+    basedir = os.path.dirname(os.path.abspath(filename))
+
+    def resolve(path):
+        if is_builtin(path):
+            return path
+        return os.path.normpath(os.path.join(basedir, path))
+
+    def resolve_stage(paths):
+        return [resolve(path) for path in _as_list(paths)]
+
+    jobs = {}
+    for entry in doc['databases']:
+        patterns = entry['file']
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        filenames = []
+        for pattern in patterns:
+            matches = sorted(glob.glob(resolve(pattern)))
+            if not matches:
+                raise ValueError(f"No database file matches {pattern!r}")
+            filenames.extend(matches)
+        modes = []
+        for mode_name, stages in entry['modes'].items():
+            stages = stages or {}
+            unknown = set(stages) - _stage_keys
+            if unknown:
+                raise ValueError(f"Unknown stage(s) {', '.join(sorted(unknown))} in mode {mode_name!r}")
+            modes.append(ModeSpec(mode_name, resolve_stage(stages.get('input-shaper')), resolve_stage(stages.get('3dlut')), resolve_stage(stages.get('output-shaper'))))
+        output_dir = entry.get('output')
+        for db_filename in filenames:
+            output = db_filename if output_dir is None else os.path.join(resolve(output_dir), os.path.basename(db_filename))
+            job = jobs.setdefault(output, DatabaseJob(db_filename, [], output))
+            if job.filename != db_filename:
+                raise ValueError(f"{output} is the output of both {job.filename} and {db_filename}")
+            job.modes.extend(modes)
+    return list(jobs.values())
+
+class LutCache:
+    def __init__(self):
+        self.luts = {}
+
+    def _load(self, loader, filename):
+        key = (loader.__name__, filename)
+        lut = self.luts.get(key)
+        if lut is None:
+            lut = loader(filename)
+            self.luts[key] = lut
+        return lut
+
+    def _stage(self, loader, filenames):
+        # chains are evaluated lazily at the grid the backend needs
+        return compose([self._load(loader, filename) for filename in filenames])
+
+    def pipeline(self, spec: ModeSpec) -> ColorPipeline:
+        import qdcmdiy.data
+        # a single 3D LUT must be a 3D LUT file, chains may mix in 3x1D LUTs
+        gamut_loader = qdcmdiy.data.load_lut3d if len(spec.lut3d) == 1 else qdcmdiy.data.load_anylut
+        return ColorPipeline(
+            self._stage(qdcmdiy.data.load_lut3x1d, spec.input_shaper),
+            self._stage(gamut_loader, spec.lut3d),
+            self._stage(qdcmdiy.data.load_lut3x1d, spec.output_shaper),
+        )
+
+class SharedLut:
+    def __init__(self, lut):
+        from multiprocessing import shared_memory
+        table = lut.table
+        self.lut_type = type(lut).__name__
+        self.shape = table.shape
+        self.dtype = table.dtype.str
+        self.domain = lut.domain
+        self.shm = shared_memory.SharedMemory(create=True, size=max(table.nbytes, 1))
+        self.name = self.shm.name
+        _shared_table(self.shm, self.shape, self.dtype)[...] = table
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k != 'shm'}
+
+    def attach(self):
+        import colour
+        from multiprocessing import shared_memory
+        # workers share the parent's resource tracker, so attaching does not take ownership
+        shm = shared_memory.SharedMemory(name=self.name)
+        lut = getattr(colour, self.lut_type)(_shared_table(shm, self.shape, self.dtype), domain=self.domain)
+        return shm, lut
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+def _shared_table(shm, shape, dtype):
+    import numpy as np
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+_worker_luts = None
+_worker_lock = False
+_worker_shms = []
+
+def _init_worker(shared_luts: dict, cache_config, lock: bool):
+    global _worker_luts, _worker_lock
+    _worker_lock = lock
+    from qdcmdiy import cache
+    if cache_config is not None:
+        cache.enable(*cache_config)
+    _worker_luts = LutCache()
+    for key, shared in shared_luts.items():
+        shm, lut = shared.attach()
+        _worker_shms.append(shm)
+        _worker_luts.luts[key] = lut
+
+def _run_job_in_worker(job: DatabaseJob):
+    from qdcmdiy import cache
+    disk_cache = cache.get_active()
+    if disk_cache is None:
+        return timed_run_job(job, _worker_luts, _worker_lock), 0, 0
+    hits, misses = disk_cache.hits, disk_cache.misses
+    elapsed = timed_run_job(job, _worker_luts, _worker_lock)
+    return elapsed, disk_cache.hits - hits, disk_cache.misses - misses
+
+def run_job(job: DatabaseJob, luts: LutCache, lock: bool = False):
+    import contextlib
+    import qdcmdiy.store
+    pipelines = [luts.pipeline(spec) for spec in job.modes]
+    # with lock, other processes patching the same file wait instead of losing their changes
+    if job.output != job.filename:
+        os.makedirs(os.path.dirname(os.path.abspath(job.output)), exist_ok=True)
+    with qdcmdiy.store.locked(job.output) if lock else contextlib.nullcontext():
+        db = qdcmdiy.store.load(job.filename)
+        for spec, pipeline in zip(job.modes, pipelines):
+            with instrument.span('set_color_pipeline', mode=spec.name):
+                db.get_mode(spec.name).set_color_pipeline(pipeline)
+        qdcmdiy.store.save(db, job.output)
+
+def timed_run_job(job: DatabaseJob, luts: LutCache, lock: bool = False):
+    t0 = time.perf_counter()
+    run_job(job, luts, lock)
+    return time.perf_counter() - t0
+
+def _report(job: DatabaseJob, elapsed: float):
+    print(f"patched {job.output} in {elapsed:.2f}s: {', '.join(spec.name for spec in job.modes)}")
+
+def _run_parallel(jobs: list[DatabaseJob], num_jobs: int, lock: bool):
+    from concurrent.futures import ProcessPoolExecutor
+    from qdcmdiy import cache
+    disk_cache = cache.get_active()
+    cache_config = None if disk_cache is None else (disk_cache.directory, disk_cache.max_bytes)
+    # load every LUT once in the parent and hand it to workers as shared memory
+    luts = LutCache()
+    for job in jobs:
+        for spec in job.modes:
+            luts.pipeline(spec)
+    shared_luts = {}
+    try:
+        for key, lut in luts.luts.items():
+            # builtin transfer functions are cheap to rebuild in each worker
+            if not isinstance(lut, Transform):
+                shared_luts[key] = SharedLut(lut)
+        with ProcessPoolExecutor(max_workers=num_jobs, initializer=_init_worker, initargs=(shared_luts, cache_config, lock)) as executor:
+            # map() yields in submission order, so reports are deterministic
+            for job, (elapsed, hits, misses) in zip(jobs, executor.map(_run_job_in_worker, jobs)):
+                _report(job, elapsed)
+                if disk_cache is not None:
+                    disk_cache.hits += hits
+                    disk_cache.misses += misses
+    finally:
+        for shared in shared_luts.values():
+            shared.release()
+
+def run(jobs: list[DatabaseJob], num_jobs: int = 1, lock: bool = False):
+    if num_jobs == 0:
+        num_jobs = os.cpu_count() or 1
+    num_jobs = min(num_jobs, len(jobs))
+    t0 = time.perf_counter()
+    if num_jobs > 1:
+        _run_parallel(jobs, num_jobs, lock)
+    else:
+        luts = LutCache()
+        for job in jobs:
+            _report(job, timed_run_job(job, luts, lock))
+    print(f"patched {len(jobs)} file(s) in {time.perf_counter() - t0:.2f}s")
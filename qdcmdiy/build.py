@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+from typing import Optional
+
+import qdcmdiy
+from qdcmdiy import batch
+from qdcmdiy.transfer import is_builtin
+
+# Incremental builds of a batch manifest. A state file next to the manifest
+# records, for every output database, the hashes of the source database it was
+# built from and of the file written, and for every mode a key over the
+# qdcmdiy version and the contents of its stage files. A build patches only
+# the modes whose key changed, into the previous output while it is intact;
+# otherwise (source changed, output edited or missing, modes dropped from the
+# manifest) the output is rebuilt from the source.
+#
+# File hashes are cached in the state by size and mtime, except for files
+# modified in the last couple of seconds, whose mtime may not change again on
+# the next write.
+
+state_version = 1
+_racy_seconds = 2
+_hash_chunk_size = 1 << 20
+
+def state_filename(manifest: str) -> str:
+    manifest = os.path.abspath(manifest)
+    return os.path.join(os.path.dirname(manifest), f".{os.path.basename(manifest)}.state.json")
+
+class BuildState:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.files = {}
+        self.outputs = {}
+        # set when records change without a rebuild, so the state is saved anyway
+        self.changed = False
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                doc = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            # a damaged state only costs a full rebuild
+            return
+        if doc.get('version') == state_version:
+            self.files = doc.get('files', {})
+            self.outputs = doc.get('outputs', {})
+
+    def file_hash(self, path: str) -> Optional[str]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        cached = self.files.get(path)
+        if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(_hash_chunk_size):
+                h.update(chunk)
+        digest = h.hexdigest()
+        if time.time() - st.st_mtime > _racy_seconds:
+            self.files[path] = [st.st_size, st.st_mtime_ns, digest]
+        else:
+            self.files.pop(path, None)
+        return digest
+
+    def save(self):
+        # forget files that no longer exist
+        used = {path for path in self.files if os.path.exists(path)}
+        doc = {'version': state_version, 'files': {path: self.files[path] for path in sorted(used)}, 'outputs': self.outputs}
+        dirname = os.path.dirname(self.filename)
+        fd, tmp_filename = tempfile.mkstemp(dir=dirname, prefix=os.path.basename(self.filename) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(doc, f, indent=1, sort_keys=True)
+            os.replace(tmp_filename, self.filename)
+        except BaseException:
+            os.unlink(tmp_filename)
+            raise
+
+def mode_key(state: BuildState, spec: batch.ModeSpec) -> str:
+    h = hashlib.sha256(f"{qdcmdiy.__version__}\0{spec.name}".encode())
+    for stage, filenames in (('input-shaper', spec.input_shaper), ('3dlut', spec.lut3d), ('output-shaper', spec.output_shaper)):
+        h.update(f"\0{stage}".encode())
+        for filename in filenames:
+            content = filename if is_builtin(filename) else (state.file_hash(filename) or 'missing')
+            h.update(f"\0{filename}\0{content}".encode())
+    return h.hexdigest()
+
+class PlannedJob:
+    def __init__(self, job: batch.DatabaseJob, keys: dict, source_hash: Optional[str], full: bool):
+        self.job = job
+        self.keys = keys
+        self.source_hash = source_hash
+        self.full = full
+
+def plan(jobs: list[batch.DatabaseJob], state: BuildState, force: bool = False) -> list[PlannedJob]:
+    planned = []
+    for job in jobs:
+        record = state.outputs.get(job.output)
+        keys = {spec.name: mode_key(state, spec) for spec in job.modes}
+        in_place = job.output == job.filename
+        source_hash = None if in_place else state.file_hash(job.filename)
+        if in_place and record is not None:
+            # a file patched in place cannot be rebuilt from its source, so modes
+            # dropped from the manifest keep their tables; stop tracking them
+            dropped = sorted(set(record['modes']) - set(keys))
+            if dropped:
+                print(f"warning: {job.output}: {', '.join(dropped)} no longer in the manifest, their patched tables stay in the file", file=sys.stderr)
+                for name in dropped:
+                    del record['modes'][name]
+                state.changed = True
+        intact = (
+            not force and record is not None
+            and state.file_hash(job.output) == record['hash']
+            and (in_place or (source_hash == record['source'] and set(record['modes']) <= set(keys)))
+        )
+        if not intact:
+            # patched in place, the file is its own source, so this only re-applies every mode
+            planned.append(PlannedJob(job, keys, source_hash, True))
+            continue
+        stale = [spec for spec in job.modes if record['modes'].get(spec.name) != keys[spec.name]]
+        if stale:
+            planned.append(PlannedJob(batch.DatabaseJob(job.output, stale, job.output), keys, source_hash, False))
+    return planned
+
+def build(manifest: str, num_jobs: int = 1, lock: bool = False, force: bool = False, quiet: bool = False) -> int:
+    jobs = batch.load_manifest(manifest)
+    state = BuildState(state_filename(manifest))
+    planned = plan(jobs, state, force)
+    if not planned:
+        if state.changed:
+            state.save()
+        if not quiet:
+            print(f"{len(jobs)} database file(s) up to date")
+        return 0
+    batch.run([item.job for item in planned], num_jobs, lock)
+    for item in planned:
+        output = item.job.output
+        record = state.outputs.get(output)
+        if item.full or record is None:
+            record = state.outputs[output] = {'modes': {}}
+        record['modes'].update({spec.name: item.keys[spec.name] for spec in item.job.modes})
+        record['source'] = item.source_hash
+        record['hash'] = state.file_hash(output)
+    state.save()
+    return len(planned)
+
+def inputs(manifest: str) -> set[str]:
+    # every file a build of the manifest reads
+    paths = {os.path.abspath(manifest)}
+    for job in batch.load_manifest(manifest):
+        paths.add(job.filename)
+        for spec in job.modes:
+            paths.update(filename for filename in spec.input_shaper + spec.lut3d + spec.output_shaper if not is_builtin(filename))
+    return paths
+
+def watch(manifest: str, num_jobs: int = 1, lock: bool = False, poll: bool = False):
+    import colour  # imported up front so the first rebuild does not pay for it
+    from qdcmdiy.watch import make_watcher
+    watcher = make_watcher(poll)
+    print(f"watching {manifest} and its inputs ({type(watcher).__name__}), press Ctrl+C to stop", flush=True)
+    try:
+        while True:
+            try:
+                watcher.update(inputs(manifest))
+            except (ValueError, KeyError, OSError) as e:
+                # keep watching the manifest until it is fixed
+                print(f"cannot load {manifest}: {e}", file=sys.stderr, flush=True)
+                watcher.update([manifest])
+            changed = watcher.wait()
+            print(f"changed: {', '.join(sorted(changed))}", flush=True)
+            try:
+                build(manifest, num_jobs, lock, quiet=True)
+            except Exception as e:
+                print(f"build failed: {type(e).__name__}: {e}", file=sys.stderr, flush=True)
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
@@ -0,0 +1,117 @@
+import os
+import sys
+import hashlib
+import tempfile
+from typing import Optional
+
+import qdcmdiy
+
+default_max_bytes = 512 * 1024 * 1024
+# part of every key: bump whenever a converter can produce different payload
+# bytes for the same LUT (encoders, quantization, sampling), so entries written
+# by an older tree are not served
+payload_format_version = 1
+
+def default_cache_dir() -> str:
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'qdcm-diy')
+
+class PayloadCache:
+    def __init__(self, directory: str, max_bytes: int = default_max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = None
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(converter: str, lut_digest: str) -> str:
+        return hashlib.sha256(f"{qdcmdiy.__version__}:{payload_format_version}:{converter}:{lut_digest}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + '.payload')
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read().decode('utf-8')
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        try:
+            # mtime doubles as the LRU timestamp
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: str):
+        path = self._path(key)
+        data = value.encode('utf-8')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            try:
+                replaced_bytes = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced_bytes = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, _, size in self._entries())
+        else:
+            self._total_bytes += len(data) - replaced_bytes
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.payload'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_mtime, st.st_size
+
+    def evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total_bytes = total
+
+    def stats(self) -> str:
+        return f"cache: {self.hits} hit(s), {self.misses} miss(es)"
+
+_active_cache: Optional[PayloadCache] = None
+
+def enable(directory: Optional[str] = None, max_bytes: int = default_max_bytes) -> PayloadCache:
+    global _active_cache
+    _active_cache = PayloadCache(directory or default_cache_dir(), max_bytes)
+    return _active_cache
+
+def disable():
+    global _active_cache
+    _active_cache = None
+
+def get_active() -> Optional[PayloadCache]:
+    return _active_cache
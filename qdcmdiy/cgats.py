@@ -1,6 +1,12 @@
-import pandas as pd
+from __future__ import annotations
+import numpy as np
 import io
-from typing import BinaryIO
+import re
+import mmap
+from typing import BinaryIO, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 class CGATSTable:
     def __init__(self, dataframe: pd.DataFrame, metadata: dict[str, str], signature='CGATS.17'):
@@ -8,6 +14,9 @@ class CGATSTable:
         self.metadata = metadata
         self.signature = signature
 
+    def get_columns(self, names: list[str]) -> np.ndarray:
+        return np.asarray(self.dataframe[names])
+
 def _read_number(f: io.BufferedReader):
     buffer = bytearray()
     state = 'integer'
@@ -169,7 +178,7 @@ def _read_line(f: io.BufferedReader):
         buffer.extend(ch)
     return buffer
 
-def read(f: BinaryIO):
+def _read_tokenized(f: io.BufferedReader):
     sig = None
     state = 'start'
     metadata = {}
@@ -325,6 +334,194 @@ def read(f: BinaryIO):
     except Exception as e:
         raise ValueError(f"Error while parsing CGATS file at position {f.tell()}") from e
 
+    return sig, metadata, fields, data
+
+def _read_with_tokenizer(f: BinaryIO):
+    if not isinstance(f, io.BufferedReader):
+        f = io.BufferedReader(f)
+    result = _read_tokenized(f)
+    if result is None:
+        return None
+    sig, metadata, fields, data = result
+    import pandas as pd
     df = pd.DataFrame(data, columns=fields)
     df.set_index([fields[0]], inplace=True)
     return CGATSTable(df, metadata, sig)
+
+_begin_data_re = re.compile(rb'^[ \t]*BEGIN_DATA[ \t]*(?:#[^\r\n]*)?\r?$', re.MULTILINE)
+_end_data_re = re.compile(rb'^[ \t]*END_DATA[ \t]*(?:#[^\r\n]*)?\r?$', re.MULTILINE)
+
+def _find_data_block(content: bytes):
+    begin = _begin_data_re.search(content)
+    if begin is None:
+        return None
+    end = _end_data_re.search(content, begin.end())
+    if end is None:
+        raise ValueError("Missing END_DATA")
+    return begin.start(), begin.end(), end.start()
+
+def _read_header(header: bytes):
+    # run the tokenizer over the (small) header with an empty data block appended
+    result = _read_tokenized(io.BufferedReader(io.BytesIO(header + b'BEGIN_DATA\nEND_DATA\n')))
+    if result is None:
+        raise ValueError("Missing CGATS signature")
+    sig, metadata, fields, _ = result
+    if not fields:
+        raise ValueError("Missing data format")
+    return sig, metadata, fields
+
+def _parse_column(tokens: np.ndarray):
+    try:
+        return tokens.astype(np.int64)
+    except ValueError:
+        pass
+    return tokens.astype(np.float64)
+
+def _parse_data_block(block: bytes, num_fields: int):
+    if b'"' in block or b'#' in block:
+        # quoted strings and comments need the tokenizer
+        return None
+    tokens = block.split()
+    if len(tokens) % num_fields != 0:
+        return None
+    table = np.array(tokens, dtype=np.bytes_).reshape(-1, num_fields)
+    try:
+        return [_parse_column(table[:, i]) for i in range(num_fields)]
+    except ValueError:
+        # non-numeric identifiers in data rows
+        return None
+
+def _read_bulk(f: BinaryIO):
+    content = f.read()
+    span = _find_data_block(content)
+    if span is None:
+        return _read_with_tokenizer(io.BytesIO(content))
+    header_end, data_start, data_end = span
+    sig, metadata, fields = _read_header(content[:header_end])
+    columns = _parse_data_block(content[data_start:data_end], len(fields))
+    if columns is None:
+        return _read_with_tokenizer(io.BytesIO(content))
+    import pandas as pd
+    df = pd.DataFrame(dict(enumerate(columns)))
+    df.columns = fields
+    df.set_index([fields[0]], inplace=True)
+    return CGATSTable(df, metadata, sig)
+
+def read(f: BinaryIO, parser: str = 'bulk'):
+    if parser == 'bulk':
+        return _read_bulk(f)
+    elif parser == 'tokenizer':
+        return _read_with_tokenizer(f)
+    else:
+        raise ValueError("Unknown parser " + repr(parser))
+
+
+class MappedCGATSTable(CGATSTable):
+    decode_chunk_rows = 65536
+
+    def __init__(self, filename: str):
+        self._file = open(filename, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self._columns = {}
+        self._dataframe = None
+        self._eager = None
+        self._buf = None
+        try:
+            self._index()
+        except Exception:
+            self.close()
+            raise
+
+    def _index(self):
+        mm = self._mmap
+        span = _find_data_block(mm)
+        if span is None:
+            raise ValueError("Missing BEGIN_DATA")
+        header_end, data_start, data_end = span
+        self.signature, self.metadata, self.fields = _read_header(mm[:header_end])
+        if mm.find(b'"', data_start, data_end) != -1 or mm.find(b'#', data_start, data_end) != -1:
+            # quoted strings and comments need the tokenizer
+            self._eager = _read_with_tokenizer(io.BytesIO(mm[:]))
+            self.row_offsets = None
+            return
+        self._buf = np.frombuffer(mm, dtype=np.uint8, count=data_end - data_start, offset=data_start)
+        nonws = self._buf > 0x20
+        edges = np.diff(nonws.view(np.int8), prepend=0, append=0)
+        index_dtype = np.uint32 if len(self._buf) < 2**32 else np.int64
+        self._starts = np.flatnonzero(edges == 1).astype(index_dtype)
+        self._ends = np.flatnonzero(edges == -1).astype(index_dtype)
+        del nonws, edges
+        if len(self._starts) % len(self.fields) != 0:
+            raise ValueError("Number of values in data block is not a multiple of number of fields")
+        self.row_offsets = self._starts[::len(self.fields)].astype(np.int64) + data_start
+
+    def __len__(self):
+        if self._eager is not None:
+            return len(self._eager.dataframe)
+        return len(self._starts) // len(self.fields)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._buf = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def _decode_column(self, field_index: int):
+        num_fields = len(self.fields)
+        starts = self._starts[field_index::num_fields]
+        ends = self._ends[field_index::num_fields]
+        parts = []
+        for pos in range(0, len(starts), self.decode_chunk_rows):
+            s = starts[pos:pos+self.decode_chunk_rows].astype(np.int64)
+            lengths = ends[pos:pos+self.decode_chunk_rows].astype(np.int64) - s
+            width = int(lengths.max())
+            offsets = np.arange(width)
+            chars = self._buf[np.minimum(s[:, None] + offsets, len(self._buf) - 1)]
+            chars[offsets >= lengths[:, None]] = 0
+            parts.append(chars.view(f'S{width}').ravel())
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        tokens = np.concatenate(parts)
+        try:
+            return _parse_column(tokens)
+        except ValueError:
+            return tokens
+
+    def get_column(self, name: str) -> np.ndarray:
+        if self._eager is not None:
+            df = self._eager.dataframe
+            return np.asarray(df.index if name == df.index.name else df[name])
+        column = self._columns.get(name)
+        if column is None:
+            column = self._decode_column(self.fields.index(name))
+            self._columns[name] = column
+        return column
+
+    def get_columns(self, names: list[str]) -> np.ndarray:
+        return np.stack([self.get_column(name) for name in names], axis=1)
+
+    @property
+    def dataframe(self) -> pd.DataFrame:
+        if self._eager is not None:
+            return self._eager.dataframe
+        if self._dataframe is None:
+            import pandas as pd
+            df = pd.DataFrame({i: self.get_column(name) for i, name in enumerate(self.fields)})
+            df.columns = self.fields
+            df.set_index([self.fields[0]], inplace=True)
+            self._dataframe = df
+        return self._dataframe
+
+def read_mapped(filename: str) -> MappedCGATSTable:
+    return MappedCGATSTable(filename)
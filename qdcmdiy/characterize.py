@@ -0,0 +1,140 @@
+from __future__ import annotations
+import hashlib
+import numpy as np
+from typing import TYPE_CHECKING
+
+from qdcmdiy import instrument
+from qdcmdiy.pipeline import Transform
+
+if TYPE_CHECKING:
+    from scipy.spatial import cKDTree
+
+# Display model built from measurements (ArgyllCMS .ti3, device RGB -> XYZ).
+#
+# Forward: XYZ at any device RGB is a weighted (tricube) local linear fit over
+# the k nearest measured patches, found with a KD-tree; the fit also gives the
+# Jacobian. Inverse: a start point from the same fit over the patches nearest
+# in CIELAB, then Gauss-Newton steps on the forward model, clipped to the
+# device gamut. Everything is vectorized over the evaluated points and the
+# KD-tree queries run on all CPUs.
+#
+# As a pipeline stage, InverseModel takes linear RGB in a source colourspace
+# and returns device RGB (relative colorimetric: the source white maps to the
+# measured white, adapted with Bradford).
+
+default_neighbours = 16
+default_iterations = 8
+default_chunk_size = 1 << 16
+
+def read_ti3(filename: str) -> tuple[np.ndarray, np.ndarray]:
+    from qdcmdiy import cgats
+    with open(filename, 'rb') as f:
+        table = cgats.read(f)
+    if table is None:
+        raise ValueError(f"{filename} is not a CGATS file")
+    fields = set(table.dataframe.columns)
+    rgb_fields, xyz_fields = ['RGB_R', 'RGB_G', 'RGB_B'], ['XYZ_X', 'XYZ_Y', 'XYZ_Z']
+    if not fields.issuperset(rgb_fields + xyz_fields):
+        raise ValueError(f"{filename} must have RGB_R/G/B and XYZ_X/Y/Z fields")
+    rgb = table.get_columns(rgb_fields).astype(np.float64) / 100
+    xyz = table.get_columns(xyz_fields).astype(np.float64)
+    return rgb, xyz
+
+def _tricube_fit(tree: cKDTree, values: np.ndarray, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    # local linear regression of values around each query point; returns the
+    # fitted value and its gradient (d value / d position, [n, 3, 3])
+    distances, index = tree.query(queries, k, workers=-1)
+    bandwidth = distances[:, -1:] * 1.01 + 1e-12
+    weights = (1 - (distances / bandwidth) ** 3) ** 3
+    offsets = tree.data[index] - queries[:, np.newaxis, :]
+    design = np.concatenate([np.ones(offsets.shape[:2] + (1,)), offsets], axis=-1)
+    weighted = design * weights[..., np.newaxis]
+    normal = np.einsum('nki,nkj->nij', weighted, design)
+    # a little ridge on the slopes keeps degenerate neighbourhoods (e.g. patches on a plane) solvable
+    ridge = 1e-9 * weights.sum(axis=1)
+    normal[:, 1:, 1:] += ridge[:, np.newaxis, np.newaxis] * np.eye(3)
+    coefficients = np.linalg.solve(normal, np.einsum('nki,nkj->nij', weighted, values[index]))
+    return coefficients[:, 0, :], coefficients[:, 1:, :].transpose(0, 2, 1)
+
+class InverseModel(Transform):
+    per_channel = False
+
+    def __init__(self, rgb: np.ndarray, xyz: np.ndarray, source: str = 'sRGB',
+                 neighbours: int = default_neighbours, iterations: int = default_iterations):
+        import colour
+        from scipy.spatial import cKDTree
+        if source not in colour.RGB_COLOURSPACES:
+            raise ValueError(f"Unknown colourspace {source!r}")
+        if len(rgb) < neighbours:
+            raise ValueError(f"need at least {neighbours} measurements, got {len(rgb)}")
+        self.rgb = np.ascontiguousarray(rgb, dtype=np.float64)
+        self.source = source
+        self.neighbours = neighbours
+        self.iterations = iterations
+        self.rgb_tree = cKDTree(self.rgb)
+        # normalize to the measured white, Y = 1
+        white, _ = _tricube_fit(self.rgb_tree, np.asarray(xyz, dtype=np.float64), np.ones((1, 3)), neighbours)
+        self.xyz = np.asarray(xyz, dtype=np.float64) / white[0, 1]
+        self.white = white[0] / white[0, 1]
+        self.white_xy = colour.XYZ_to_xy(self.white)
+        self.lab_tree = cKDTree(colour.XYZ_to_Lab(self.xyz, self.white_xy))
+        colourspace = colour.RGB_COLOURSPACES[source]
+        source_white = colourspace.matrix_RGB_to_XYZ @ np.ones(3)
+        adaptation = colour.adaptation.matrix_chromatic_adaptation_VonKries(source_white, self.white, 'Bradford')
+        self.matrix = adaptation @ colourspace.matrix_RGB_to_XYZ
+        self._digest = None
+
+    @classmethod
+    def from_ti3(cls, filename: str, **kwargs) -> InverseModel:
+        return cls(*read_ti3(filename), **kwargs)
+
+    def forward(self, rgb: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return _tricube_fit(self.rgb_tree, self.xyz, rgb, self.neighbours)
+
+    def inverse_xyz(self, xyz: np.ndarray) -> np.ndarray:
+        import colour
+        lab = colour.XYZ_to_Lab(xyz, self.white_xy)
+        rgb, _ = _tricube_fit(self.lab_tree, self.rgb, lab, self.neighbours)
+        rgb = np.clip(rgb, 0, 1)
+        for _ in range(self.iterations):
+            fitted, jacobian = self.forward(rgb)
+            # least squares step, well defined even where the Jacobian is near singular
+            jt = jacobian.transpose(0, 2, 1)
+            step = np.linalg.solve(jt @ jacobian + 1e-9 * np.eye(3), (jt @ (xyz - fitted)[..., np.newaxis]))[..., 0]
+            rgb = np.clip(rgb + step, 0, 1)
+        return rgb
+
+    @instrument.traced('inverse_model')
+    def apply(self, rgb):
+        rgb = np.asarray(rgb, dtype=np.float64)
+        flat = rgb.reshape((-1, 3))
+        out = np.empty_like(flat)
+        for pos in range(0, len(flat), default_chunk_size):
+            chunk = flat[pos:pos + default_chunk_size]
+            out[pos:pos + len(chunk)] = self.inverse_xyz(chunk @ self.matrix.T)
+        return out.reshape(rgb.shape)
+
+    def digest(self):
+        if self._digest is None:
+            h = hashlib.sha256(f"inverse:{self.source}:{self.neighbours}:{self.iterations}:".encode())
+            h.update(self.rgb.tobytes())
+            h.update(np.ascontiguousarray(self.xyz).tobytes())
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def report(self, rgb: np.ndarray, device_rgb: np.ndarray) -> str:
+        # colour difference between what the source asks for and what the
+        # model predicts the display shows with the inverted values
+        import colour
+        target = rgb.reshape((-1, 3)) @ self.matrix.T
+        shown, _ = self.forward(device_rgb.reshape((-1, 3)))
+        delta = colour.delta_E(colour.XYZ_to_Lab(target, self.white_xy), colour.XYZ_to_Lab(shown, self.white_xy))
+        fit, _ = self.forward(self.rgb)
+        fit_delta = colour.delta_E(colour.XYZ_to_Lab(self.xyz, self.white_xy), colour.XYZ_to_Lab(fit, self.white_xy))
+        in_gamut = delta < 1
+        lines = [
+            f"{len(self.rgb)} patches, white xy {self.white_xy[0]:.4f} {self.white_xy[1]:.4f}",
+            f"forward fit dE2000: mean {fit_delta.mean():.3f} max {fit_delta.max():.3f}",
+            f"{self.source} grid: {in_gamut.sum()} of {len(delta)} points within dE2000 1, mean {delta.mean():.3f} max {delta.max():.3f}",
+        ]
+        return '\n'.join(lines)
@@ -1,37 +1,115 @@
-import colour
 import numpy as np
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
 
-def resample_lut(lut3d, size):
-    return colour.LUT3D(lut3d.apply(colour.LUT3D.linear_table(size), interpolator=colour.algebra.interpolation.table_interpolation_tetrahedral))
+from qdcmdiy import instrument
+from qdcmdiy.pipeline import Trc
 
+def lut_digest(lut) -> str:
+    if hasattr(lut, "digest"):
+        return lut.digest()
+    h = hashlib.sha256()
+    table = np.ascontiguousarray(lut.table, dtype=np.float64)
+    h.update(f"{type(lut).__name__}:{table.shape}:".encode())
+    h.update(np.ascontiguousarray(lut.domain, dtype=np.float64).tobytes())
+    h.update(table.tobytes())
+    return h.hexdigest()
+
+_payload_memo = OrderedDict()
+_payload_memo_size = 64
+_payload_memo_lock = threading.Lock()
+
+def memoize_payload(fn):
+    # conversions keyed by LUT content, so LUTs shared by many modes/files are converted once,
+    # and across runs when the on-disk cache is enabled
+    key_prefix = f"{fn.__module__}.{fn.__qualname__}"
+    @functools.wraps(fn)
+    def wrapper(lut):
+        from qdcmdiy import cache
+        key = (key_prefix, lut_digest(lut))
+        with _payload_memo_lock:
+            try:
+                _payload_memo.move_to_end(key)
+                return _payload_memo[key]
+            except KeyError:
+                pass
+        disk_cache = cache.get_active()
+        result = None
+        if disk_cache is not None:
+            disk_key = disk_cache.make_key(*key)
+            result = disk_cache.get(disk_key)
+        if result is None:
+            with instrument.span('convert', converter=fn.__name__):
+                result = fn(lut)
+            if disk_cache is not None:
+                disk_cache.put(disk_key, result)
+        with _payload_memo_lock:
+            _payload_memo[key] = result
+            if len(_payload_memo) > _payload_memo_size:
+                _payload_memo.popitem(last=False)
+        return result
+    return wrapper
+
+@instrument.traced('resample')
+def resample_lut(lut3d, size, dtype=np.float64):
+    import colour
+    from qdcmdiy import interp
+    return colour.LUT3D(interp.apply_lut3d(lut3d.table, colour.LUT3D.linear_table(size), dtype=dtype))
+
+@instrument.traced('quantize')
 def to_12bit(a):
     return np.uint32(np.clip(a, 0, 1) * 4095 + 0.5)
 
+@instrument.traced('quantize')
 def to_4096(a):
     return np.uint32(np.clip(a, 0, 1) * 4096 + 0.5)
 
+@instrument.traced('quantize')
 def to_10bit(a):
     return np.uint32(np.clip(a, 0, 1) * 1023 + 0.5)
 
 def load_argyll_cal(filename):
+    import colour
     from . import cgats
-    with open(filename, "rb") as f:
-        cal = cgats.read(f)
-    return colour.LUT3x1D(np.asarray(cal.dataframe[['RGB_R', 'RGB_G', 'RGB_B']]))
+    with cgats.read_mapped(filename) as cal:
+        table = cal.get_columns(['RGB_R', 'RGB_G', 'RGB_B'])
+    return colour.LUT3x1D(table)
+
+def _read_lut(filename: str):
+    import colour
+    from qdcmdiy import lutio
+    if filename.endswith(".cube"):
+        return lutio.read_cube(filename)
+    elif filename.endswith(".qlut"):
+        return lutio.read_qlut(filename)
+    return colour.io.read_LUT(filename)
 
+@instrument.traced('read_lut')
 def load_anylut(filename: str):
+    import colour
+    from qdcmdiy import transfer
+    if transfer.is_builtin(filename):
+        return transfer.builtin(filename)
     if filename.endswith(".cal"):
         return load_argyll_cal(filename)
-    lut = colour.io.read_LUT(filename)
+    lut = _read_lut(filename)
     assert np.all(lut.domain == np.array([[0,0,0],[1,1,1]])), "LUT domain must be [0,0,0]-[1,1,1]"
     return lut
 
 def load_lut3x1d(filename: str):
+    import colour
     lut = load_anylut(filename)
-    assert isinstance(lut, colour.LUT3x1D)
+    assert isinstance(lut, (colour.LUT3x1D, Trc))
     return lut
 
+@instrument.traced('read_lut')
 def load_lut3d(filename: str):
-    lut = colour.io.read_LUT(filename)
+    import colour
+    from qdcmdiy import transfer
+    if transfer.is_builtin(filename):
+        return transfer.builtin(filename)
+    lut = _read_lut(filename)
     assert isinstance(lut, colour.LUT3D)
     return lut
\ No newline at end of file
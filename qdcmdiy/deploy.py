@@ -0,0 +1,223 @@
+import os
+import sys
+import time
+import shlex
+import asyncio
+import hashlib
+import tempfile
+from typing import Optional
+
+import qdcmdiy
+from qdcmdiy.api import Session, UnknownModeError
+from qdcmdiy.pipeline import ColorPipeline
+
+# Pushes a patched calibration file to many devices at once: for each device
+# the panel name and stock file are found as in the README, the file is pulled,
+# patched in-process (in a worker thread, so other devices keep transferring)
+# and installed as root, by default into a Magisk / KernelSU module that
+# overlays the stock file after a reboot. At most --jobs devices are handled
+# at a time; adb commands time out and are retried with backoff.
+#
+# The transport is any object with the coroutines of AdbTransport, which runs
+# the adb executable (or a stand-in given with --adb).
+
+module_dir = '/data/adb/modules/qdcm-diy'
+default_remote_path = module_dir + '/system{path}'
+remote_tmp_dir = '/data/local/tmp'
+
+_panel_script = """
+panel_node="$(tr ' ' '\\n' < /proc/cmdline | grep msm_drm.dsi_display0= | cut -d= -f2 | cut -d: -f1)"
+panel_name_path="$(echo /sys/firmware/devicetree/base/soc/qcom,mdss_mdp@*/"$panel_node"/qcom,mdss-dsi-panel-name)"
+tr ' ' _ < "$panel_name_path"
+"""
+
+_module_prop = f"""id=qdcm-diy
+name=QDCM-DIY calibration
+version={qdcmdiy.__version__}
+versionCode=1
+author=qdcm-diy
+description=Patched QDCM calibration data
+"""
+
+class NoDevicesError(ValueError):
+    pass
+
+class AdbTransport:
+    def __init__(self, adb: str = 'adb', timeout: float = 60):
+        # adb may be a command line, e.g. a stand-in script run by an interpreter
+        self.adb = shlex.split(adb)
+        self.timeout = timeout
+
+    async def _run(self, *args) -> bytes:
+        proc = await asyncio.create_subprocess_exec(*self.adb, *args, stdin=asyncio.subprocess.DEVNULL,
+                                                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        command = args[2] if args[0] == '-s' else args[0]
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise TimeoutError(f"adb {command} timed out after {self.timeout}s") from None
+        if proc.returncode != 0:
+            lines = (stderr or stdout).decode('utf-8', 'replace').strip().splitlines()
+            message = lines[-1] if lines else ''
+            raise OSError(f"adb {command} failed ({proc.returncode}): {message}")
+        return stdout
+
+    async def devices(self) -> list[str]:
+        out = await self._run('devices')
+        serials = []
+        for line in out.decode('utf-8', 'replace').splitlines()[1:]:
+            fields = line.split()
+            if len(fields) >= 2 and fields[1] == 'device':
+                serials.append(fields[0])
+        return serials
+
+    async def shell(self, serial: str, command: str) -> bytes:
+        return await self._run('-s', serial, 'shell', command)
+
+    async def pull(self, serial: str, remote: str) -> bytes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            local = os.path.join(tmpdir, os.path.basename(remote))
+            await self._run('-s', serial, 'pull', remote, local)
+            with open(local, 'rb') as f:
+                return f.read()
+
+    async def push(self, serial: str, data: bytes, remote: str):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            local = os.path.join(tmpdir, os.path.basename(remote))
+            with open(local, 'wb') as f:
+                f.write(data)
+            await self._run('-s', serial, 'push', local, remote)
+
+    async def reboot(self, serial: str):
+        await self._run('-s', serial, 'reboot')
+
+def _su(script: str) -> str:
+    return 'su -c ' + shlex.quote(script)
+
+class DeviceResult:
+    def __init__(self, serial: str):
+        self.serial = serial
+        self.panel = None
+        self.stock_path = None
+        self.remote_path = None
+        self.error = None
+        self.retries = 0
+        self.timings = {}
+
+    def report(self) -> str:
+        # stage times include the failed attempts, not the waits between them
+        total = sum(self.timings.values())
+        stages = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in self.timings.items())
+        retries = f", {self.retries} retries" if self.retries else ''
+        if self.error is not None:
+            return f"{self.serial}: failed in {total:.2f}s{retries}: {self.error}"
+        return f"{self.serial}: deployed {self.remote_path} ({self.panel}) in {total:.2f}s: {stages}{retries}"
+
+class Deployer:
+    def __init__(self, transport, session: Session, mode: str, pipeline: ColorPipeline,
+                 remote_path: str = default_remote_path, retries: int = 2, backoff: float = 1, reboot: bool = False):
+        self.transport = transport
+        self.session = session
+        self.mode = mode
+        self.pipeline = pipeline
+        self.remote_path = remote_path
+        self.retries = retries
+        self.backoff = backoff
+        self.reboot = reboot
+
+    async def _stage(self, result: DeviceResult, name: str, fn):
+        # transport failures are retried, anything else fails the device at once
+        for attempt in range(self.retries + 1):
+            t0 = time.perf_counter()
+            try:
+                return await fn()
+            except (OSError, TimeoutError) as e:
+                if attempt == self.retries:
+                    raise
+                print(f"{result.serial}: {name} failed, retrying: {e}", file=sys.stderr, flush=True)
+            finally:
+                result.timings[name] = result.timings.get(name, 0) + time.perf_counter() - t0
+            result.retries += 1
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def _probe(self, serial: str) -> tuple[str, str]:
+        panel = (await self.transport.shell(serial, _su(_panel_script))).decode('utf-8', 'replace').strip('\0 \r\n')
+        if not panel:
+            raise ValueError("cannot read the panel name")
+        candidates = [f"/vendor/etc/display/qdcm_calib_data_{panel}.json", f"/vendor/etc/qdcm_calib_data_{panel}.xml"]
+        script = f'for f in {" ".join(map(shlex.quote, candidates))}; do if [ -f "$f" ]; then echo "$f"; exit 0; fi; done; exit 1'
+        try:
+            path = (await self.transport.shell(serial, _su(script))).decode('utf-8', 'replace').strip()
+        except OSError:
+            raise ValueError(f"no calibration file for panel {panel}") from None
+        return panel, path
+
+    async def _install(self, serial: str, data: bytes, stock_path: str, remote_path: str):
+        tmp_path = f"{remote_tmp_dir}/qdcm-diy.{os.path.basename(remote_path)}"
+        await self.transport.push(serial, data, tmp_path)
+        lines = ['set -e', f'mkdir -p {shlex.quote(os.path.dirname(remote_path))}']
+        if remote_path.startswith(module_dir + '/'):
+            lines.append(f'printf %s {shlex.quote(_module_prop)} > {module_dir}/module.prop')
+        lines += [
+            f'cp {shlex.quote(tmp_path)} {shlex.quote(remote_path)}',
+            f'chmod 644 {shlex.quote(remote_path)}',
+            # hwcomposer can only read the file with the stock file's SELinux context
+            f'chcon "$(stat -c %C {shlex.quote(stock_path)})" {shlex.quote(remote_path)}',
+            f'rm -f {shlex.quote(tmp_path)}',
+            f'sha256sum {shlex.quote(remote_path)}',
+        ]
+        out = await self.transport.shell(serial, _su('\n'.join(lines)))
+        digest = out.decode('utf-8', 'replace').split()[:1]
+        if digest != [hashlib.sha256(data).hexdigest()]:
+            raise OSError(f"{remote_path} does not match the patched file after install")
+
+    async def deploy(self, serial: str) -> DeviceResult:
+        result = DeviceResult(serial)
+        try:
+            result.panel, result.stock_path = await self._stage(result, 'probe', lambda: self._probe(serial))
+            result.remote_path = self.remote_path.format(path=result.stock_path, name=os.path.basename(result.stock_path), panel=result.panel)
+            stock = await self._stage(result, 'pull', lambda: self.transport.pull(serial, result.stock_path))
+            t0 = time.perf_counter()
+            patched = await asyncio.to_thread(self.session.patch_bytes, stock, self.mode, self.pipeline)
+            result.timings['patch'] = time.perf_counter() - t0
+            await self._stage(result, 'push', lambda: self._install(serial, patched, result.stock_path, result.remote_path))
+            if self.reboot:
+                await self._stage(result, 'reboot', lambda: self.transport.reboot(serial))
+        except UnknownModeError as e:
+            result.error = f"unknown mode {e}"
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        return result
+
+    async def run(self, serials: list[str], num_jobs: int = 4) -> list[DeviceResult]:
+        semaphore = asyncio.Semaphore(num_jobs)
+
+        async def bounded(serial):
+            async with semaphore:
+                result = await self.deploy(serial)
+            print(result.report(), flush=True)
+            return result
+
+        return await asyncio.gather(*(bounded(serial) for serial in serials))
+
+async def _deploy(transport, serials: Optional[list[str]], deployer: Deployer, num_jobs: int) -> list[DeviceResult]:
+    if not serials:
+        serials = await transport.devices()
+        if not serials:
+            raise NoDevicesError("no devices connected")
+    return await deployer.run(serials, num_jobs)
+
+def deploy(mode: str, input_shaper=None, lut3d=None, output_shaper=None, serials: Optional[list[str]] = None,
+           num_jobs: int = 4, retries: int = 2, timeout: float = 60, adb: str = 'adb',
+           remote_path: str = default_remote_path, reboot: bool = False, transport=None) -> list[DeviceResult]:
+    session = Session()
+    pipeline = session.pipeline(input_shaper, lut3d, output_shaper)
+    transport = transport or AdbTransport(adb, timeout)
+    deployer = Deployer(transport, session, mode, pipeline, remote_path, retries, reboot=reboot)
+    t0 = time.perf_counter()
+    results = asyncio.run(_deploy(transport, serials, deployer, num_jobs))
+    succeeded = sum(result.error is None for result in results)
+    print(f"deployed to {succeeded} of {len(results)} device(s) in {time.perf_counter() - t0:.2f}s")
+    return results
@@ -0,0 +1,198 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import hashlib
+from typing import NamedTuple, Optional
+
+# Fleet inventory: panel keys, modes, features, enable flags and payload hashes
+# of many QDCM databases in one SQLite file. Files are scanned in parallel
+# without decoding payloads, and only files whose size or mtime changed since
+# the last run are scanned again.
+#
+# Mode names are the ones patch --mode takes (NULL for JSON modes this tool
+# cannot address); features are the JSON keys (e.g. PostBlendGamut) or the XML
+# FeatureType numbers. Hashes are SHA-256 of the payload text as stored in the
+# file, so they only compare within one format.
+
+schema_version = 1
+
+_schema = """
+CREATE TABLE files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    format TEXT NOT NULL,
+    panel TEXT,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE modes (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    name TEXT
+);
+CREATE TABLE features (
+    mode_id INTEGER NOT NULL REFERENCES modes(id) ON DELETE CASCADE,
+    feature TEXT NOT NULL,
+    enabled INTEGER,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE INDEX modes_file ON modes (file_id);
+CREATE INDEX modes_name ON modes (name);
+CREATE INDEX features_mode ON features (mode_id);
+CREATE INDEX features_feature ON features (feature, enabled);
+CREATE VIEW inventory AS
+    SELECT files.path, files.panel, modes.key AS mode_key, modes.name AS mode,
+           features.feature, features.enabled, features.size, features.hash
+    FROM features
+    JOIN modes ON modes.id = features.mode_id
+    JOIN files ON files.id = modes.file_id;
+"""
+
+_database_re = re.compile(r'^qdcm_calib_data_.*\.(xml|json)$')
+
+class ScannedFile(NamedTuple):
+    path: str
+    format: str
+    panel: Optional[str]
+    # (key, name, [(feature, enabled, size, hash)])
+    modes: list
+    error: Optional[str]
+
+def _hash(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _scan_json(path: str, data: bytes) -> ScannedFile:
+    from qdcmdiy import store_json
+    text = data.decode('utf-8')
+    # payload offsets are character offsets, they index the raw bytes only if the file is ASCII
+    view = memoryview(data) if len(text) == len(data) else None
+    jdoc = store_json.scan_header(text)
+    panel = store_json.panel_key(jdoc)
+    modes = []
+    for key, mode_obj in jdoc[panel].items():
+        if not isinstance(mode_obj, dict):
+            continue
+        try:
+            name = store_json.mode_name(mode_obj)
+        except (KeyError, TypeError):
+            name = None
+        features = []
+        for feature, value in mode_obj.items():
+            if not isinstance(value, store_json.PayloadSpan):
+                continue
+            payload = view[value.start:value.end] if view is not None else text[value.start:value.end].encode('utf-8')
+            try:
+                enabled = store_json.payload_enabled(text, value)
+            except ValueError:
+                enabled = None
+            features.append((feature, enabled, (value.end - value.start) // 2, _hash(payload)))
+        modes.append((key, name, features))
+    return ScannedFile(path, 'json', panel, modes, None)
+
+def _scan_xml(path: str, data: bytes) -> ScannedFile:
+    from qdcmdiy.store_xml import QdcmDatabaseXml
+    db = QdcmDatabaseXml(source=data)
+    view = memoryview(db.source)
+    modes = []
+    for mode in db.mode_list:
+        features = []
+        for feature in mode.features:
+            payload = view[feature.start_tag_end:feature.end_tag_start]
+            enabled = feature.get_attribute("Disable") != "true"
+            features.append((feature.get_attribute("FeatureType"), enabled, len(payload) // 2, _hash(payload)))
+        modes.append((mode.element.get_attribute("ModeID"), mode.element.get_attribute("Name"), features))
+    return ScannedFile(path, 'xml', db.panel_name, modes, None)
+
+def scan_file(path: str) -> ScannedFile:
+    format = 'xml' if path.endswith('.xml') else 'json'
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if format == 'xml':
+            return _scan_xml(path, data)
+        return _scan_json(path, data)
+    except Exception as e:
+        # a broken file is recorded with its error and skipped until it changes
+        return ScannedFile(path, format, None, [], f'{type(e).__name__}: {e}')
+
+def find_databases(roots: list[str]) -> list[str]:
+    found = []
+    for root in roots:
+        if os.path.isfile(root):
+            found.append(os.path.abspath(root))
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            found.extend(os.path.abspath(os.path.join(dirpath, name)) for name in sorted(filenames) if _database_re.match(name))
+    return found
+
+def connect(filename: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(filename)
+    conn.execute('PRAGMA foreign_keys = ON')
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version != schema_version:
+        # the index only mirrors the files, rebuild it from scratch
+        with conn:
+            for kind, name in conn.execute("SELECT type, name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'").fetchall():
+                conn.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+            conn.executescript(_schema)
+            conn.execute(f'PRAGMA user_version = {schema_version}')
+    return conn
+
+def _store(conn: sqlite3.Connection, scanned: ScannedFile, st: os.stat_result):
+    conn.execute('DELETE FROM files WHERE path = ?', (scanned.path,))
+    file_id = conn.execute('INSERT INTO files (path, format, panel, size, mtime_ns, error) VALUES (?, ?, ?, ?, ?, ?)',
+                           (scanned.path, scanned.format, scanned.panel, st.st_size, st.st_mtime_ns, scanned.error)).lastrowid
+    for key, name, features in scanned.modes:
+        mode_id = conn.execute('INSERT INTO modes (file_id, key, name) VALUES (?, ?, ?)', (file_id, key, name)).lastrowid
+        conn.executemany('INSERT INTO features (mode_id, feature, enabled, size, hash) VALUES (?, ?, ?, ?, ?)',
+                         [(mode_id, feature, enabled, size, digest) for feature, enabled, size, digest in features])
+
+def _under(path: str, roots: list[str]) -> bool:
+    for root in roots:
+        root = os.path.abspath(root)
+        if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+            return True
+    return False
+
+def update(conn: sqlite3.Connection, roots: list[str], num_jobs: int = 0):
+    t0 = time.perf_counter()
+    paths = find_databases(roots)
+    known = {path: (size, mtime_ns) for path, size, mtime_ns in conn.execute('SELECT path, size, mtime_ns FROM files')}
+    # stat before reading, so a file changed during the scan is scanned again next time
+    stats = {path: os.stat(path) for path in paths}
+    changed = [path for path in paths if known.get(path) != (stats[path].st_size, stats[path].st_mtime_ns)]
+    removed = [path for path in known if path not in stats and _under(path, roots)]
+
+    if num_jobs == 0:
+        num_jobs = os.cpu_count() or 1
+    num_jobs = min(num_jobs, len(changed))
+    if num_jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=num_jobs)
+        results = executor.map(scan_file, changed, chunksize=max(1, len(changed) // (num_jobs * 4)))
+    else:
+        executor = None
+        results = map(scan_file, changed)
+    try:
+        with conn:
+            conn.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in removed])
+            for scanned in results:
+                if scanned.error is not None:
+                    print(f"{scanned.path}: {scanned.error}", file=sys.stderr)
+                _store(conn, scanned, stats[scanned.path])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    print(f"indexed {len(changed)} file(s), {len(paths) - len(changed)} unchanged, {len(removed)} removed in {time.perf_counter() - t0:.2f}s")
+
+def query(conn: sqlite3.Connection, sql: str, params=()):
+    cursor = conn.execute(sql, params)
+    print('\t'.join(column[0] for column in cursor.description))
+    for row in cursor:
+        print('\t'.join('' if value is None else str(value) for value in row))
@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import time
+import functools
+import threading
+from typing import Optional
+
+# Stage timing hook used by store, data and pipeline. Spans are no-ops until a
+# Tracer is enabled; the recorded spans can be written as a Chrome trace
+# (chrome://tracing, Perfetto) and summarized per stage name. Allocation
+# tracking uses tracemalloc, which slows Python code down considerably, so it
+# is opt-in.
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def _peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class _Span:
+    def __init__(self, tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.peak = 0
+
+    def __enter__(self):
+        self.tracer._begin(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._end(self)
+        return False
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_null_span = _NullSpan()
+
+class Tracer:
+    def __init__(self, allocations: bool = False):
+        self.allocations = allocations
+        self.events = []
+        self.pid = os.getpid()
+        self._local = threading.local()
+        self._t0 = time.perf_counter()
+        if allocations:
+            import tracemalloc
+            self._tracemalloc = tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        else:
+            self._tracemalloc = None
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _fold_peak(self, stack):
+        # tracemalloc has a single peak counter, fold it into the open spans before resetting it
+        current, peak = self._tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, peak)
+        self._tracemalloc.reset_peak()
+        return current
+
+    def _begin(self, span: _Span):
+        stack = self._stack()
+        if self._tracemalloc is not None:
+            span.start_bytes = self._fold_peak(stack)
+            span.peak = span.start_bytes
+        stack.append(span)
+        span.start = time.perf_counter()
+
+    def _end(self, span: _Span):
+        end = time.perf_counter()
+        stack = self._stack()
+        stack.pop()
+        args = dict(span.args)
+        if self._tracemalloc is not None:
+            current, peak = self._tracemalloc.get_traced_memory()
+            span.peak = max(span.peak, peak)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, span.peak)
+            self._tracemalloc.reset_peak()
+            args['alloc_bytes'] = current - span.start_bytes
+            args['peak_alloc_bytes'] = span.peak - span.start_bytes
+        rss = _peak_rss_bytes()
+        if rss is not None:
+            args['peak_rss_bytes'] = rss
+        self.events.append({
+            'name': span.name,
+            'ph': 'X',
+            'ts': (span.start - self._t0) * 1e6,
+            'dur': (end - span.start) * 1e6,
+            'pid': self.pid,
+            'tid': threading.get_ident(),
+            'args': args,
+        })
+
+    def span(self, name: str, **args) -> _Span:
+        return _Span(self, name, args)
+
+    def write(self, filename: str):
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+    def summary(self) -> str:
+        stages = {}
+        for event in self.events:
+            count, total, peak = stages.get(event['name'], (0, 0, 0))
+            stages[event['name']] = (count + 1, total + event['dur'], max(peak, event['args'].get('peak_alloc_bytes', 0)))
+        lines = [f"{'stage':<24} {'calls':>6} {'total':>11}" + (f" {'peak alloc':>12}" if self.allocations else '')]
+        for name, (count, total, peak) in sorted(stages.items(), key=lambda item: -item[1][1]):
+            line = f"{name:<24} {count:>6} {total / 1000:>9.1f}ms"
+            if self.allocations:
+                line += f" {peak / 1024 / 1024:>10.1f}MB"
+            lines.append(line)
+        rss = _peak_rss_bytes()
+        if rss is not None:
+            lines.append(f"peak RSS {rss / 1024 / 1024:.1f}MB")
+        return '\n'.join(lines)
+
+_active_tracer: Optional[Tracer] = None
+
+def enable(allocations: bool = False) -> Tracer:
+    global _active_tracer
+    _active_tracer = Tracer(allocations)
+    return _active_tracer
+
+def disable():
+    global _active_tracer
+    if _active_tracer is not None and _active_tracer._tracemalloc is not None:
+        _active_tracer._tracemalloc.stop()
+    _active_tracer = None
+
+def get_active() -> Optional[Tracer]:
+    return _active_tracer
+
+def span(name: str, **args):
+    if _active_tracer is None:
+        return _null_span
+    return _active_tracer.span(name, **args)
+
+def traced(name: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active_tracer is None:
+                return fn(*args, **kwargs)
+            with _active_tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,91 @@
+from __future__ import annotations
+import numpy as np
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import colour
+
+# Interpolation kernels for LUTs with the unit domain [0, 1]. Inputs are
+# processed in chunks so temporaries stay bounded regardless of input size.
+
+default_chunk_size = 1 << 16
+
+def _chunked(fn, values, dtype, chunk_size):
+    values = np.asarray(values)
+    shape = values.shape
+    flat = values.reshape((-1, 3))
+    out = np.empty(flat.shape, dtype=dtype)
+    for pos in range(0, len(flat), chunk_size):
+        out[pos:pos+chunk_size] = fn(flat[pos:pos+chunk_size].astype(dtype, copy=False))
+    return out.reshape(shape)
+
+def _gather(table, index):
+    return table[index[:, 0], index[:, 1], index[:, 2]]
+
+def _lut3d_tetrahedral(table, rgb):
+    size = table.shape[0]
+    x = np.clip(rgb, 0, 1) * (size - 1)
+    i = np.minimum(x.astype(np.intp), size - 2)
+    f = x - i
+    # walk from the lower corner to the upper corner along axes ordered by
+    # decreasing fraction; the four visited vertices span the tetrahedron
+    order = np.argsort(-f, axis=1, kind='stable')
+    f_sorted = np.take_along_axis(f, order, axis=1)
+    unit = np.eye(3, dtype=np.intp)
+    i1 = i + unit[order[:, 0]]
+    i2 = i1 + unit[order[:, 1]]
+    return (
+        (1 - f_sorted[:, 0:1]) * _gather(table, i) +
+        (f_sorted[:, 0:1] - f_sorted[:, 1:2]) * _gather(table, i1) +
+        (f_sorted[:, 1:2] - f_sorted[:, 2:3]) * _gather(table, i2) +
+        f_sorted[:, 2:3] * _gather(table, i + 1)
+    )
+
+def _lut3d_trilinear(table, rgb):
+    size = table.shape[0]
+    x = np.clip(rgb, 0, 1) * (size - 1)
+    i = np.minimum(x.astype(np.intp), size - 2)
+    f = x - i
+    out = np.zeros_like(rgb)
+    for corner in range(8):
+        bits = np.array([(corner >> 2) & 1, (corner >> 1) & 1, corner & 1])
+        weight = np.prod(np.where(bits, f, 1 - f), axis=1, keepdims=True)
+        out += weight * _gather(table, i + bits)
+    return out
+
+def apply_lut3d(table: np.ndarray, rgb: np.ndarray, method: str = 'tetrahedral', dtype=np.float64, chunk_size: int = default_chunk_size) -> np.ndarray:
+    size = table.shape[0]
+    assert table.shape == (size, size, size, 3) and size >= 2, "3D LUT table must have shape (N, N, N, 3) with N >= 2"
+    if method == 'tetrahedral':
+        kernel = _lut3d_tetrahedral
+    elif method == 'trilinear':
+        kernel = _lut3d_trilinear
+    else:
+        raise ValueError("Unknown interpolation method " + repr(method))
+    table = np.asarray(table).astype(dtype, copy=False)
+    return _chunked(lambda rgb: kernel(table, rgb), rgb, dtype, chunk_size)
+
+def apply_lut3x1d(table: np.ndarray, rgb: np.ndarray, dtype=np.float64, chunk_size: int = default_chunk_size) -> np.ndarray:
+    size = table.shape[0]
+    assert table.shape == (size, 3) and size >= 2, "3x1D LUT table must have shape (N, 3) with N >= 2"
+    table = np.ascontiguousarray(table, dtype=dtype)
+    channels = np.arange(3)
+
+    def kernel(rgb):
+        # linear interpolation, extrapolating along the end segments
+        x = rgb * (size - 1)
+        i = np.clip(np.floor(x), 0, size - 2).astype(np.intp)
+        lower = table[i, channels]
+        return lower + (x - i) * (table[i + 1, channels] - lower)
+
+    return _chunked(kernel, rgb, dtype, chunk_size)
+
+def apply_lut(lut: colour.LUT3x1D | colour.LUT3D, rgb: np.ndarray, **kwargs) -> np.ndarray:
+    import colour
+    assert np.all(lut.domain == np.array([[0, 0, 0], [1, 1, 1]])), "LUT domain must be [0,0,0]-[1,1,1]"
+    if isinstance(lut, colour.LUT3D):
+        return apply_lut3d(lut.table, rgb, **kwargs)
+    elif isinstance(lut, colour.LUT3x1D):
+        return apply_lut3x1d(lut.table, rgb, **kwargs)
+    else:
+        raise ValueError("Unsupported LUT type " + type(lut).__name__)
@@ -0,0 +1,113 @@
+from __future__ import annotations
+import os
+import struct
+import numpy as np
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import colour
+
+# IRIDAS .cube files are parsed in bulk with NumPy; anything this reader does
+# not understand (Resolve shaper+3D files, comments inside the table) goes to
+# colour's parser instead.
+#
+# .qlut is a native binary container that loads without parsing:
+#
+#   offset  size
+#        0     8  magic b'QDCMLUT\0'
+#        8     4  version (1), little-endian uint32
+#       12     4  dimensions, 1 for 3x1D or 3 for 3D
+#       16     4  size
+#       20     4  table dtype, b'<f4\0' or b'<f8\0'
+#       24    48  domain min and max, 6 little-endian float64
+#       72    56  reserved
+#      128        table, C order ([size, 3] or [size, size, size, 3])
+#
+# float64 tables are memory-mapped and used in place.
+
+qlut_magic = b'QDCMLUT\0'
+qlut_version = 1
+_qlut_header = struct.Struct('<8sIII4s6d')
+_qlut_header_size = 128
+_qlut_dtypes = {b'<f4\0': np.dtype('<f4'), b'<f8\0': np.dtype('<f8')}
+
+_cube_keywords = (b'TITLE', b'DOMAIN_MIN', b'DOMAIN_MAX', b'LUT_1D_SIZE', b'LUT_3D_SIZE')
+
+def _make_lut(dimensions: int, table: np.ndarray, name: str, domain: np.ndarray):
+    import colour
+    if dimensions == 1:
+        return colour.LUT3x1D(table, name, domain)
+    return colour.LUT3D(table, name, domain)
+
+def read_cube(filename: str) -> colour.LUT3x1D | colour.LUT3D:
+    with open(filename, 'rb') as f:
+        content = f.read()
+    title = os.path.splitext(os.path.basename(filename))[0]
+    domain = np.array([[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]])
+    dimensions, size = 3, 2
+    pos = 0
+    while pos < len(content):
+        end = content.find(b'\n', pos)
+        end = len(content) if end < 0 else end + 1
+        line = content[pos:end].strip()
+        if line and not line.startswith(b'#'):
+            keyword, _, value = line.replace(b'\t', b' ').partition(b' ')
+            if keyword[:1].isdigit() or keyword[:1] in b'-+.':
+                break
+            if keyword not in _cube_keywords:
+                return _read_with_colour(filename)
+            value = value.strip()
+            if keyword == b'TITLE':
+                title = value[1:-1].decode('utf-8', 'replace')
+            elif keyword == b'DOMAIN_MIN':
+                domain[0] = np.array(value.split(), dtype=np.float64)
+            elif keyword == b'DOMAIN_MAX':
+                domain[1] = np.array(value.split(), dtype=np.float64)
+            elif keyword == b'LUT_1D_SIZE':
+                dimensions, size = 1, int(value)
+            elif keyword == b'LUT_3D_SIZE':
+                dimensions, size = 3, int(value)
+        pos = end
+    count = size * 3 if dimensions == 1 else size ** 3 * 3
+    data = content[pos:]
+    if b'#' in data:
+        return _read_with_colour(filename)
+    values = np.fromstring(data.decode('ascii', 'replace'), dtype=np.float64, sep=' ')
+    if values.size != count:
+        return _read_with_colour(filename)
+    if dimensions == 1:
+        table = values.reshape((size, 3))
+    else:
+        # red changes fastest in the file
+        table = np.ascontiguousarray(values.reshape((size, size, size, 3)).transpose(2, 1, 0, 3))
+    return _make_lut(dimensions, table, title, domain)
+
+def _read_with_colour(filename: str):
+    import colour
+    return colour.io.read_LUT(filename)
+
+def read_qlut(filename: str) -> colour.LUT3x1D | colour.LUT3D:
+    with open(filename, 'rb') as f:
+        header = f.read(_qlut_header_size)
+    if len(header) < _qlut_header_size or header[:8] != qlut_magic:
+        raise ValueError(f"{filename} is not a qlut file")
+    magic, version, dimensions, size, dtype, *domain = _qlut_header.unpack_from(header)
+    if version != qlut_version or dimensions not in (1, 3) or dtype not in _qlut_dtypes:
+        raise ValueError(f"Unsupported qlut file {filename}")
+    shape = (size, 3) if dimensions == 1 else (size, size, size, 3)
+    table = np.memmap(filename, dtype=_qlut_dtypes[dtype], mode='r', offset=_qlut_header_size, shape=shape)
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return _make_lut(dimensions, table, name, np.array(domain).reshape((2, 3)))
+
+def write_qlut(lut: colour.LUT3x1D | colour.LUT3D, filename: str, dtype=np.float64):
+    import colour
+    dtype = np.dtype(dtype).newbyteorder('<')
+    dtype_code = dtype.str.encode() + b'\0'
+    assert dtype_code in _qlut_dtypes, "qlut tables must be float32 or float64"
+    dimensions = 1 if isinstance(lut, colour.LUT3x1D) else 3
+    table = np.ascontiguousarray(lut.table, dtype=dtype)
+    domain = np.asarray(lut.domain, dtype=np.float64).reshape(6)
+    header = _qlut_header.pack(qlut_magic, qlut_version, dimensions, table.shape[0], dtype_code, *domain)
+    with open(filename, 'wb') as f:
+        f.write(header.ljust(_qlut_header_size, b'\0'))
+        f.write(table.tobytes())
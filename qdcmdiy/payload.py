@@ -0,0 +1,114 @@
+import threading
+import functools
+import numpy as np
+
+# Writes feature payloads straight from quantized arrays into their final
+# text form: decimal JSON numbers are formatted with NumPy into a reusable
+# byte buffer, and hex encoding (with the QDCM byte-pair swap for JSON) is a
+# single table lookup into another one. Buffers are per thread, so concurrent
+# conversions never share them.
+
+_local = threading.local()
+
+def _buffer(name: str, size: int) -> np.ndarray:
+    buffers = getattr(_local, 'buffers', None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    buf = buffers.get(name)
+    if buf is None or len(buf) < size:
+        buf = buffers[name] = np.empty(size, dtype=np.uint8)
+    return buf[:size]
+
+def words(name: str, count: int) -> np.ndarray:
+    # zeroed little-endian 32-bit words in a reusable buffer
+    buf = _buffer(name, 4 * count).view('<u4')
+    buf[:] = 0
+    return buf
+
+@functools.lru_cache(maxsize=None)
+def _hex_table() -> np.ndarray:
+    # two uppercase hex digits per byte value
+    digits = np.frombuffer(b'0123456789ABCDEF', dtype=np.uint8)
+    values = np.arange(256)
+    return np.stack([digits[values >> 4], digits[values & 15]], axis=-1)
+
+@functools.lru_cache(maxsize=None)
+def _swapped_hex_table() -> np.ndarray:
+    # four hex digits per little-endian byte pair, second byte first
+    table = _hex_table()
+    values = np.arange(65536)
+    return np.concatenate([table[values >> 8], table[values & 255]], axis=-1)
+
+def hex_upper(data) -> str:
+    src = np.frombuffer(data, dtype=np.uint8)
+    out = _buffer('hex', 2 * len(src)).reshape((-1, 2))
+    np.take(_hex_table(), src, axis=0, out=out)
+    return out.tobytes().decode('ascii')
+
+def hex_swapped(data) -> str:
+    # QDCM JSON payloads swap every pair of bytes, with an odd leading byte left as-is
+    src = np.frombuffer(data, dtype=np.uint8)
+    head = len(src) % 2
+    out = _buffer('hex', 2 * len(src))
+    if head:
+        out[:2] = _hex_table()[src[0]]
+    pairs = src[head:].view('<u2')
+    np.take(_swapped_hex_table(), pairs, axis=0, out=out[2 * head:].reshape((-1, 4)))
+    return out.tobytes().decode('ascii')
+
+class JsonWriter:
+    # builds a compact JSON document (as json.dumps(..., separators=(',', ':'))
+    # would) in a reusable buffer
+    def __init__(self, name: str, capacity: int = 1 << 16):
+        self.name = name
+        _buffer(name, capacity)
+        self.buf = _local.buffers[name]
+        self.size = 0
+
+    def _reserve(self, size: int) -> np.ndarray:
+        end = self.size + size
+        if end > len(self.buf):
+            grown = np.empty(max(end, 2 * len(self.buf)), dtype=np.uint8)
+            grown[:self.size] = self.buf[:self.size]
+            # keep the larger buffer for the next payload
+            self.buf = _local.buffers[self.name] = grown
+        view = self.buf[self.size:end]
+        self.size = end
+        return view
+
+    def write(self, text: bytes):
+        self._reserve(len(text))[:] = np.frombuffer(text, dtype=np.uint8)
+
+    def write_ints(self, values: np.ndarray, inner: bytes = b',', between: bytes = b','):
+        # non-negative integers, rows joined with `between` and columns with `inner`
+        values = np.asarray(values)
+        if values.ndim == 1:
+            values = values[:, np.newaxis]
+        cols = values.shape[1]
+        flat = values.astype(np.int64).ravel()
+        if flat.size == 0:
+            return
+        assert flat.min() >= 0, "only non-negative integers are supported"
+        max_digits = len(str(int(flat.max())))
+        num_digits = np.ones(flat.size, dtype=np.int64)
+        for k in range(1, max_digits):
+            num_digits += flat >= 10 ** k
+        last_col = np.zeros(flat.size, dtype=bool)
+        last_col[cols - 1::cols] = True
+        inner_mask = ~last_col
+        between_mask = last_col.copy()
+        between_mask[-1] = False
+        widths = num_digits + np.where(inner_mask, len(inner), 0) + np.where(between_mask, len(between), 0)
+        starts = np.cumsum(widths) - widths
+        out = self._reserve(int(starts[-1] + widths[-1]))
+        for k in range(max_digits):
+            mask = num_digits > k
+            out[starts[mask] + num_digits[mask] - 1 - k] = 48 + (flat[mask] // 10 ** k) % 10
+        ends = starts + num_digits
+        for sep, mask in ((inner, inner_mask), (between, between_mask)):
+            positions = ends[mask]
+            for j, byte in enumerate(sep):
+                out[positions + j] = byte
+
+    def getvalue(self) -> memoryview:
+        return memoryview(self.buf[:self.size])
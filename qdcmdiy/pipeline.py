@@ -1,8 +1,163 @@
-import colour
-from typing import Optional
+from __future__ import annotations
+import abc
+import hashlib
+import numpy as np
+from typing import Optional, Union, Callable, TYPE_CHECKING
+
+from qdcmdiy import instrument
+
+if TYPE_CHECKING:
+    import colour
+
+# A stage of the pipeline is a chain of transforms that is only evaluated when
+# a backend asks for it at the grid it needs, e.g. 257 entries for JSON IGC or
+# 17^3 + 5^3 for JSON 3D LUTs. Adjacent matrices are fused algebraically;
+# everything else is evaluated point-wise at the target samples, so no
+# intermediate LUT is ever resampled.
+
+class Transform(abc.ABC):
+    per_channel = True
+
+    @abc.abstractmethod
+    def apply(self, rgb: np.ndarray) -> np.ndarray:
+        ...
+
+    @abc.abstractmethod
+    def digest(self) -> str:
+        ...
+
+    def then(self, other: Transform) -> Transform:
+        return Chain([self, other])
+
+    @instrument.traced('sample')
+    def sample_3x1d(self, size: int) -> colour.LUT3x1D:
+        import colour
+        assert self.per_channel, "stage mixes channels and cannot be sampled as a 3x1D LUT"
+        return colour.LUT3x1D(self.apply(colour.LUT3x1D.linear_table(size)))
+
+    @instrument.traced('sample')
+    def sample_3d(self, size: int) -> colour.LUT3D:
+        import colour
+        return colour.LUT3D(self.apply(colour.LUT3D.linear_table(size)))
+
+class Lut1D(Transform):
+    def __init__(self, lut: colour.LUT3x1D):
+        self.lut = lut
+
+    def apply(self, rgb):
+        from qdcmdiy import interp
+        return interp.apply_lut(self.lut, rgb)
+
+    def digest(self):
+        from qdcmdiy.data import lut_digest
+        return lut_digest(self.lut)
+
+    @instrument.traced('sample')
+    def sample_3x1d(self, size):
+        import colour
+        if self.lut.size == size:
+            return self.lut
+        return colour.LUT3x1D(self.lut.apply(colour.LUT3x1D.linear_table(size)))
+
+class Lut3D(Transform):
+    per_channel = False
+
+    def __init__(self, lut: colour.LUT3D):
+        self.lut = lut
+
+    def apply(self, rgb):
+        from qdcmdiy import interp
+        return interp.apply_lut(self.lut, rgb)
+
+    def digest(self):
+        from qdcmdiy.data import lut_digest
+        return lut_digest(self.lut)
+
+    @instrument.traced('sample')
+    def sample_3d(self, size):
+        from qdcmdiy.data import resample_lut
+        if self.lut.size == size:
+            return self.lut
+        return resample_lut(self.lut, size)
+
+class Matrix(Transform):
+    per_channel = False
+
+    def __init__(self, matrix, offset=None):
+        self.matrix = np.asarray(matrix, dtype=np.float64).reshape((3, 3))
+        self.offset = np.zeros(3) if offset is None else np.asarray(offset, dtype=np.float64).reshape(3)
+
+    def apply(self, rgb):
+        return np.asarray(rgb) @ self.matrix.T + self.offset
+
+    def digest(self):
+        return hashlib.sha256(b"matrix:" + self.matrix.tobytes() + self.offset.tobytes()).hexdigest()
+
+    def then(self, other):
+        if isinstance(other, Matrix):
+            return Matrix(other.matrix @ self.matrix, other.matrix @ self.offset + other.offset)
+        return super().then(other)
+
+class Trc(Transform):
+    def __init__(self, name: str, function: Callable[[np.ndarray], np.ndarray]):
+        self.name = name
+        self.function = function
+
+    def apply(self, rgb):
+        return self.function(np.asarray(rgb, dtype=np.float64))
+
+    def digest(self):
+        return hashlib.sha256(b"trc:" + self.name.encode()).hexdigest()
+
+class Chain(Transform):
+    def __init__(self, transforms: list[Transform]):
+        fused = []
+        for transform in transforms:
+            for item in (transform.transforms if isinstance(transform, Chain) else [transform]):
+                if fused and isinstance(fused[-1], Matrix) and isinstance(item, Matrix):
+                    fused[-1] = fused[-1].then(item)
+                else:
+                    fused.append(item)
+        self.transforms = fused
+        self.per_channel = all(transform.per_channel for transform in fused)
+
+    def apply(self, rgb):
+        for transform in self.transforms:
+            rgb = transform.apply(rgb)
+        return rgb
+
+    def digest(self):
+        h = hashlib.sha256(b"chain")
+        for transform in self.transforms:
+            h.update(transform.digest().encode())
+        return h.hexdigest()
+
+    def then(self, other):
+        return Chain([self, other])
+
+def as_transform(stage) -> Transform:
+    import colour
+    if isinstance(stage, Transform):
+        return stage
+    elif isinstance(stage, colour.LUT3x1D):
+        return Lut1D(stage)
+    elif isinstance(stage, colour.LUT3D):
+        return Lut3D(stage)
+    else:
+        raise ValueError("Unsupported pipeline stage " + type(stage).__name__)
+
+def compose(stages: list) -> Optional[Transform]:
+    transforms = [as_transform(stage) for stage in stages]
+    if not transforms:
+        return None
+    if len(transforms) == 1:
+        return transforms[0]
+    return Chain(transforms)
+
+Stage = Union["colour.LUT3x1D", "colour.LUT3D", Transform]
 
 class ColorPipeline:
-    def __init__(self, degamma: Optional[colour.LUT3x1D] = None, gamut: Optional[colour.LUT3D] = None, gamma: Optional[colour.LUT3x1D] = None):
+    def __init__(self, degamma: Optional[Stage] = None, gamut: Optional[Stage] = None, gamma: Optional[Stage] = None):
         self.degamma = degamma
         self.gamut = gamut
         self.gamma = gamma
@@ -0,0 +1,114 @@
+from __future__ import annotations
+import numpy as np
+from typing import Iterable, Iterator, Optional
+
+from qdcmdiy import interp
+from qdcmdiy.pipeline import ColorPipeline, Transform, compose
+
+# Model of the display hardware running a patched mode, fed with the tables
+# decoded back from the database (so it sees exactly what store_xml/store_json
+# encoded): IGC 3x1D LUT (linear interpolation, 12-bit output), 17^3 3D LUT
+# (tetrahedral interpolation, output on the 0-4096 scale its entries are
+# stored on, see data.to_4096), GC 1024-entry lookup indexed by
+# the 10-bit signal (10-bit output). Disabled stages are bypassed.
+
+default_chunk_size = 1 << 18
+
+def quantize_scale(x: np.ndarray, scale: int) -> np.ndarray:
+    return np.round(np.clip(x, 0, 1) * scale) / scale
+
+def quantize(x: np.ndarray, bits: int) -> np.ndarray:
+    return quantize_scale(x, (1 << bits) - 1)
+
+class DevicePipeline:
+    def __init__(self, pipeline: ColorPipeline):
+        self.igc = None if pipeline.degamma is None else np.ascontiguousarray(pipeline.degamma.table)
+        self.lut3d = None if pipeline.gamut is None else np.ascontiguousarray(pipeline.gamut.table)
+        self.gc = None if pipeline.gamma is None else np.ascontiguousarray(pipeline.gamma.table)
+        if self.gc is not None:
+            assert self.gc.shape == (1024, 3), "GC table must have 1024 entries"
+
+    def apply(self, rgb: np.ndarray) -> np.ndarray:
+        if self.igc is not None:
+            rgb = interp.apply_lut3x1d(self.igc, rgb)
+        rgb = quantize(rgb, 12)
+        if self.lut3d is not None:
+            rgb = quantize_scale(interp.apply_lut3d(self.lut3d, rgb), 4096)
+        index = np.round(rgb * 1023).astype(np.intp)
+        if self.gc is None:
+            return index / 1023
+        return quantize(self.gc[index, np.arange(3)], 10)
+
+def float_pipeline(pipeline: ColorPipeline) -> Optional[Transform]:
+    return compose([stage for stage in (pipeline.degamma, pipeline.gamut, pipeline.gamma) if stage is not None])
+
+def code_value_grid(bits: int, step: int = 1, chunk_size: int = default_chunk_size) -> Iterator[np.ndarray]:
+    # every step-th code value of each channel, including the maximum
+    scale = (1 << bits) - 1
+    codes = np.unique(np.append(np.arange(0, scale + 1, step), scale))
+    n = len(codes)
+    for pos in range(0, n ** 3, chunk_size):
+        index = np.arange(pos, min(pos + chunk_size, n ** 3))
+        yield np.stack([codes[index // (n * n)], codes[index // n % n], codes[index % n]], axis=-1) / scale
+
+def image_pixels(filenames: Iterable[str], bits: int, chunk_size: int = default_chunk_size) -> Iterator[np.ndarray]:
+    import colour
+    for filename in filenames:
+        image = np.asarray(colour.io.read_image(filename), dtype=np.float64)
+        if image.ndim == 2:
+            image = np.repeat(image[..., np.newaxis], 3, axis=-1)
+        pixels = quantize(image[..., :3].reshape((-1, 3)), bits)
+        for pos in range(0, len(pixels), chunk_size):
+            yield pixels[pos:pos+chunk_size]
+
+class ErrorStats:
+    # errors are accumulated in 10-bit output code values, the histogram has
+    # 1/16 code resolution for percentiles
+    bins_per_code = 16
+
+    def __init__(self):
+        self.count = 0
+        self.max = np.zeros(3)
+        self.sum = np.zeros(3)
+        self.sum_sq = np.zeros(3)
+        self.worst_input = np.zeros((3, 3))
+        self.histogram = np.zeros(1024 * self.bins_per_code + 1, dtype=np.int64)
+
+    def update(self, rgb: np.ndarray, actual: np.ndarray, expected: np.ndarray):
+        error = np.abs(actual - np.clip(expected, 0, 1)) * 1023
+        self.count += len(error)
+        self.sum += error.sum(axis=0)
+        self.sum_sq += (error ** 2).sum(axis=0)
+        worst = error.argmax(axis=0)
+        for channel in range(3):
+            if error[worst[channel], channel] > self.max[channel]:
+                self.max[channel] = error[worst[channel], channel]
+                self.worst_input[channel] = rgb[worst[channel]]
+        bins = np.minimum(np.round(error.max(axis=1) * self.bins_per_code).astype(np.intp), len(self.histogram) - 1)
+        self.histogram += np.bincount(bins, minlength=len(self.histogram))
+
+    def percentile(self, q: float) -> float:
+        rank = np.searchsorted(np.cumsum(self.histogram), q / 100 * self.count)
+        return rank / self.bins_per_code
+
+    def above(self, codes: float) -> int:
+        return int(self.histogram[int(codes * self.bins_per_code) + 1:].sum())
+
+    def report(self, input_bits: int) -> str:
+        scale = (1 << input_bits) - 1
+        mean = self.sum / max(self.count, 1)
+        rms = np.sqrt(self.sum_sq / max(self.count, 1))
+        lines = [f"{self.count} samples, error in 10-bit output code values"]
+        lines.append(f"{'':<8} {'max':>8} {'mean':>8} {'rms':>8}  worst input ({input_bits}-bit)")
+        for channel, name in enumerate('RGB'):
+            worst = ' '.join(str(int(v)) for v in np.round(self.worst_input[channel] * scale))
+            lines.append(f"{name:<8} {self.max[channel]:>8.3f} {mean[channel]:>8.3f} {rms[channel]:>8.3f}  {worst}")
+        lines.append(f"worst channel p99 {self.percentile(99):.3f}, p99.9 {self.percentile(99.9):.3f}, {self.above(1)} sample(s) off by more than 1 code")
+        return '\n'.join(lines)
+
+def simulate(device: DevicePipeline, reference: Optional[Transform], chunks: Iterable[np.ndarray]) -> ErrorStats:
+    stats = ErrorStats()
+    for rgb in chunks:
+        expected = rgb if reference is None else reference.apply(rgb)
+        stats.update(rgb, device.apply(rgb), expected)
+    return stats
@@ -1,8 +1,17 @@
-from typing import Protocol
+import io
+import os
+import stat
+import errno
+import tempfile
+import contextlib
+from typing import Optional, Protocol
 
+from qdcmdiy import instrument
 from qdcmdiy.pipeline import ColorPipeline
 
 class QdcmMode(Protocol):
+    def get_color_pipeline(self) -> ColorPipeline:
+        ...
     def set_color_pipeline(self, pipeline: ColorPipeline):
         ...
 
@@ -15,11 +24,115 @@ class QdcmDatabase(Protocol):
         ...
 
 def load(filename: str) -> QdcmDatabase:
-    if filename.endswith(".xml"):
-        from qdcmdiy.store_xml import QdcmDatabaseXml
-        return QdcmDatabaseXml(filename)
-    elif filename.endswith(".json"):
-        from qdcmdiy.store_json import QdcmDatabaseJson
-        return QdcmDatabaseJson(filename)
+    with instrument.span('load', file=os.path.basename(filename)):
+        if filename.endswith(".xml"):
+            from qdcmdiy.store_xml import QdcmDatabaseXml
+            return QdcmDatabaseXml(filename)
+        elif filename.endswith(".json"):
+            from qdcmdiy.store_json import QdcmDatabaseJson
+            return QdcmDatabaseJson(filename)
+        else:
+            raise ValueError("Unknown file type")
+
+def sniff_format(data: bytes) -> str:
+    head = data[:64].lstrip(b'\xef\xbb\xbf \t\r\n')
+    if head.startswith(b'<'):
+        return 'xml'
+    elif head.startswith(b'{'):
+        return 'json'
     else:
         raise ValueError("Unknown file type")
+
+def loads(data: bytes, format: Optional[str] = None) -> QdcmDatabase:
+    if format is None:
+        format = sniff_format(data)
+    with instrument.span('load'):
+        if format == 'xml':
+            from qdcmdiy.store_xml import QdcmDatabaseXml
+            return QdcmDatabaseXml(source=data)
+        elif format == 'json':
+            from qdcmdiy.store_json import QdcmDatabaseJson
+            return QdcmDatabaseJson(text=data.decode('utf-8'))
+        else:
+            raise ValueError("Unknown file type")
+
+def dumps(db: QdcmDatabase) -> bytes:
+    with instrument.span('dump'):
+        buf = io.StringIO()
+        db.dump(buf)
+        return buf.getvalue().encode('utf-8')
+
+write_chunk_size = 1 << 20
+
+def write_range(io, text: str, start: int = 0, end: Optional[int] = None):
+    # copy a region of a large document out in bounded pieces instead of one big slice
+    end = len(text) if end is None else end
+    for pos in range(start, end, write_chunk_size):
+        io.write(text[pos:min(pos + write_chunk_size, end)])
+
+def _fsync_dir(dirname: str):
+    try:
+        fd = os.open(dirname, os.O_RDONLY)
+    except OSError:
+        # directories cannot be opened on Windows, the rename is durable there anyway
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+@contextlib.contextmanager
+def locked(filename: str):
+    # serializes load-modify-save of one database across processes; the lock is
+    # held on a sidecar file because save() replaces the database file itself
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    fd = os.open(os.path.join(dirname, f".{basename}.lock"), os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        try:
+            import fcntl
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except ImportError:
+            import msvcrt
+            # LK_LOCK gives up after 10 attempts a second apart, keep waiting as flock does
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError as e:
+                    if e.errno != errno.EDEADLOCK:
+                        raise
+        yield
+    finally:
+        # closing the descriptor releases the lock
+        os.close(fd)
+
+@instrument.traced('dump')
+def save(db: QdcmDatabase, filename: str, fsync: bool = True):
+    # write next to the target, flush it to disk and rename over it, so readers
+    # never see a partial file, even after a crash
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_filename = tempfile.mkstemp(dir=dirname, prefix=f".{os.path.basename(filename)}.", suffix=".tmp")
+    try:
+        try:
+            os.chmod(tmp_filename, stat.S_IMODE(os.stat(filename).st_mode))
+        except FileNotFoundError:
+            # a new file gets the permissions open() would have given it
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_filename, 0o666 & ~umask)
+        with os.fdopen(fd, 'w', encoding='utf-8', buffering=write_chunk_size) as f:
+            db.dump(f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_filename, filename)
+        if fsync:
+            _fsync_dir(dirname)
+    except BaseException:
+        try:
+            os.unlink(tmp_filename)
+        except FileNotFoundError:
+            pass
+        raise
@@ -1,8 +1,16 @@
+from __future__ import annotations
+import re
 import json
+import functools
 import numpy as np
-import colour
-from qdcmdiy.data import resample_lut, to_12bit, to_10bit, to_4096
-from qdcmdiy.pipeline import ColorPipeline
+from typing import NamedTuple, Optional, TYPE_CHECKING
+from qdcmdiy import instrument
+from qdcmdiy.data import to_12bit, to_10bit, to_4096, memoize_payload
+from qdcmdiy.payload import JsonWriter, hex_swapped
+from qdcmdiy.pipeline import ColorPipeline, Stage, Lut3D, as_transform
+
+if TYPE_CHECKING:
+    import colour
 
 
 _gamut_map = {
@@ -59,131 +67,341 @@ _dummy_pcc = {
     "enable": False
 }
 
-_linear_igc = {
-    "displayID": 0,
-    "ditherEnable": True,
-    "ditherStrength": 4,
-    "enable": False,
-    "lutB": [int(x) for x in to_12bit(np.arange(257) / 256)],
-    "lutG": [int(x) for x in to_12bit(np.arange(257) / 256)],
-    "lutR": [int(x) for x in to_12bit(np.arange(257) / 256)],
-}
+@functools.lru_cache(maxsize=None)
+def _linear_igc_payload():
+    lut = [int(x) for x in to_12bit(np.arange(257) / 256)]
+    return encode_nested_json({
+        "displayID": 0,
+        "ditherEnable": True,
+        "ditherStrength": 4,
+        "enable": False,
+        "lutB": lut,
+        "lutG": lut,
+        "lutR": lut,
+    })
 
-_linear_gc = {
-    "bitsRounding": 10,
-    "displayID": 0,
-    "enable": False,
-    "lutB": list(range(1024)),
-    "lutG": list(range(1024)),
-    "lutR": list(range(1024)),
-}
+@functools.lru_cache(maxsize=None)
+def _linear_gc_payload():
+    return encode_nested_json({
+        "bitsRounding": 10,
+        "displayID": 0,
+        "enable": False,
+        "lutB": list(range(1024)),
+        "lutG": list(range(1024)),
+        "lutR": list(range(1024)),
+    })
+
+def _swap_byte_pairs(b):
+    # QDCM payloads swap every pair of bytes, with an odd leading byte left as-is
+    arr = np.frombuffer(b, dtype=np.uint8)
+    head = len(arr) % 2
+    return arr[:head].tobytes() + arr[head:].reshape(-1, 2)[:, ::-1].tobytes()
 
 def decode_str(s: str):
     assert len(s) % 2 == 0
-    size = len(s) // 2
-    buf = bytearray(size)
-    pos = 0
-    if size % 2 == 1:
-        buf[0] = int(s[0:2], 16)
-        pos = 2
-    for i in range(pos, len(s), 4):
-        byte0 = int(s[i:i+2], 16)
-        byte1 = int(s[i+2:i+4], 16)
-        pos = i // 2
-        buf[pos] = byte1
-        buf[pos+1] = byte0
-    return buf
-
-class NioStyleBuffer:
-    def __init__(self, size):
-        self.buffer = bytearray(size)
-        self.pos = 0
-    def write(self, s):
-        view = memoryview(self.buffer)
-        view[self.pos:self.pos+len(s)] = s
-        self.pos += len(s)
+    return bytearray(_swap_byte_pairs(bytes.fromhex(s)))
 
 def encode(b):
-    buffer = NioStyleBuffer(len(b) * 2)
-    offset = 0
-    if len(b) % 2 == 1:
-        buffer.write("{:02X}".format(b[0]).encode())
-        offset = 1
-    for i in range(offset, len(b), 2):
-        buffer.write("{:02X}{:02X}".format(b[i+1], b[i]).encode())
-    return buffer.buffer.decode()
+    return _swap_byte_pairs(b).hex().upper()
 
+@instrument.traced('encode')
 def encode_nested_json(jdoc):
     s = json.dumps(jdoc, indent=None, separators=(',', ':'))
     return encode(s.encode())
 
+def decode_nested_json(s: str):
+    return json.loads(decode_str(s))
 
-def lut3x1d_to_igc_json(lut: colour.LUT3x1D):
-    if lut.size != 257:
-        lut = colour.LUT3x1D(lut.apply(colour.LUT3x1D.linear_table(257)))
-    return {
-        "displayID": 0,
-        "ditherEnable": True,
-        "ditherStrength": 4,
-        "enable": True,
-        "lutB": [int(x) for x in to_12bit(lut.table[:, 2].ravel())],
-        "lutG": [int(x) for x in to_12bit(lut.table[:, 1].ravel())],
-        "lutR": [int(x) for x in to_12bit(lut.table[:, 0].ravel())],
-    }
 
+def _sample_gamut(lut: Stage):
+    stage = as_transform(lut)
+    if isinstance(stage, Lut3D):
+        assert stage.lut.size >= 17, "LUT3D size must be at least 17"
+    return stage.sample_3d(17), stage.sample_3d(5)
+
+# Payloads are written straight into their JSON text (keys sorted, as
+# encode_nested_json() would write them) and hex encoded in one pass.
+
+@instrument.traced('encode')
+def _encode_writer(writer: JsonWriter):
+    return hex_swapped(writer.getvalue())
+
+def _write_shaper_luts(writer: JsonWriter, table):
+    writer.write(b'"lutB":[')
+    writer.write_ints(table[:, 2])
+    writer.write(b'],"lutG":[')
+    writer.write_ints(table[:, 1])
+    writer.write(b'],"lutR":[')
+    writer.write_ints(table[:, 0])
+    writer.write(b']}')
+
+def _write_gamut_map(writer: JsonWriter, lut3d):
+    # entries are stored with red varying fastest
+    writer.write_ints(to_4096(lut3d.table.transpose(2, 1, 0, 3)).reshape((-1, 3)), b',', b'","')
+
+def _write_igc_payload(lut: Stage):
+    lut = as_transform(lut).sample_3x1d(257)
+    writer = JsonWriter('json.igc')
+    writer.write(b'{"displayID":0,"ditherEnable":true,"ditherStrength":4,"enable":true,')
+    _write_shaper_luts(writer, to_12bit(lut.table))
+    return _encode_writer(writer)
+
+
+def _write_gamut_payload(lut: Stage, enable: bool = True):
+    fine, coarse = _sample_gamut(lut)
+    writer = JsonWriter('json.gamut')
+    writer.write(b'{"displayID":0,"enable":' + (b'true' if enable else b'false') + b',"mapCoarse":["')
+    _write_gamut_map(writer, coarse)
+    writer.write(b'"],"mapFine":["')
+    _write_gamut_map(writer, fine)
+    writer.write(b'"]}')
+    return _encode_writer(writer)
+
+def _write_gc_payload(lut: Stage):
+    lut = as_transform(lut).sample_3x1d(1024)
+    writer = JsonWriter('json.gc')
+    writer.write(b'{"bitsRounding":10,"displayID":0,"enable":true,')
+    _write_shaper_luts(writer, to_10bit(lut.table))
+    return _encode_writer(writer)
+
+_payload_writers = {
+    "PostBlendIGC": _write_igc_payload,
+    "PostBlendGamut": _write_gamut_payload,
+    "PostBlendGC": _write_gc_payload,
+}
+
+def write_payload(feature: str, lut: Stage) -> str:
+    # the hex payload of one feature, always converted (not memoized or cached)
+    if feature not in _payload_writers:
+        raise ValueError(f"Unknown feature {feature!r}")
+    return _payload_writers[feature](lut)
+
+@memoize_payload
+def _igc_payload(lut: Stage):
+    return _write_igc_payload(lut)
+
+@memoize_payload
+def _gamut_payload(lut: Stage):
+    return _write_gamut_payload(lut)
+
+@memoize_payload
+def _gc_payload(lut: Stage):
+    return _write_gc_payload(lut)
 
-def lut3x1d_to_gc_json(lut: colour.LUT3x1D):
-    if lut.size != 1024:
-        lut = colour.LUT3x1D(lut.apply(colour.LUT3x1D.linear_table(1024)))
-    return {
-        "bitsRounding": 10,
-        "displayID": 0,
-        "enable": True,
-        "lutB": [int(x) for x in to_10bit(lut.table[:, 2].ravel())],
-        "lutG": [int(x) for x in to_10bit(lut.table[:, 1].ravel())],
-        "lutR": [int(x) for x in to_10bit(lut.table[:, 0].ravel())],
-    }
-
-
-def lut3d_to_json(lut: colour.LUT3D):
-    
-    def convert_to_qdcmjson(lut3d):
-        table = lut3d.table
-        size = lut3d.size
-        return [",".join(str(x) for x in to_4096(table[r, g, b])) for b in range(size) for g in range(size) for r in range(size)]
-
-    assert lut.size >= 17, "LUT3D size must be at least 17"
-    if lut.size > 17:
-        fine = resample_lut(lut, 17)
-    else:
-        fine = lut
-    coarse = resample_lut(lut, 5)
-    return {
-        "displayID": 0,
-        "enable": True,
-        "mapCoarse": convert_to_qdcmjson(coarse),
-        "mapFine": convert_to_qdcmjson(fine),
-    }
 
-_linear_3dlut = lut3d_to_json(colour.LUT3D(size=17))
-_linear_3dlut["enable"] = False
+def igc_json_to_lut3x1d(jdoc):
+    import colour
+    if not jdoc.get("enable", True):
+        return None
+    table = np.array([jdoc["lutR"], jdoc["lutG"], jdoc["lutB"]], dtype=np.float64).T / 4095
+    return colour.LUT3x1D(table)
+
+
+def gc_json_to_lut3x1d(jdoc):
+    import colour
+    if not jdoc.get("enable", True):
+        return None
+    table = np.array([jdoc["lutR"], jdoc["lutG"], jdoc["lutB"]], dtype=np.float64).T / 1023
+    return colour.LUT3x1D(table)
+
+
+def json_to_lut3d(jdoc):
+    import colour
+    if not jdoc.get("enable", True):
+        return None
+    entries = jdoc["mapFine"]
+    size = round(len(entries) ** (1 / 3))
+    assert size ** 3 == len(entries), "mapFine must have size^3 entries"
+    values = np.fromstring(",".join(entries), dtype=np.float64, sep=",")
+    assert values.size == size ** 3 * 3, "mapFine entries must have 3 components"
+    # entries are stored with red varying fastest
+    table = values.reshape((size, size, size, 3)).transpose(2, 1, 0, 3) / 4096
+    return colour.LUT3D(np.ascontiguousarray(table))
+
+@functools.lru_cache(maxsize=None)
+def _linear_3dlut_payload():
+    import colour
+    return _write_gamut_payload(colour.LUT3D(size=17), enable=False)
+
+_json_ws_re = re.compile(r'[ \t\n\r]*')
+_json_decoder = json.JSONDecoder()
+
+def panel_key(jdoc: dict) -> str:
+    keys = set(jdoc.keys()) - {"Copyright", "Version"}
+    if not keys:
+        raise ValueError("No panel object in JSON database")
+    return next(iter(keys))
+
+def mode_name(mode_obj: dict) -> str:
+    # raises KeyError for modes this tool cannot address
+    return (
+        f"gamut {_gamut_map[mode_obj['Applicability']['ColorPrimaries']]}" +
+        f" gamma {_transfer_map[mode_obj['Applicability']['GammaTransfer']]}" +
+        f" intent {mode_obj['Applicability']['RenderIntent']}" +
+        f" Dynamic_range {mode_obj['DynamicRange']}"
+    )
+
+# Header scan for the index: parses the document like json.loads, except that
+# string values inside mode objects long enough to be feature payloads are
+# returned as PayloadSpan(start, end) offsets into the text and never decoded.
+
+_payload_min_length = 256
+
+class PayloadSpan(NamedTuple):
+    start: int
+    end: int
+
+def scan_header(text: str) -> dict:
+    jdoc, pos = _scan_value(text, _skip_ws(text, 0), 0)
+    if _skip_ws(text, pos) != len(text):
+        raise ValueError("Extra data after JSON document")
+    return jdoc
+
+def _skip_ws(text, pos):
+    return _json_ws_re.match(text, pos).end()
+
+def _scan_value(text, pos, depth):
+    if depth < 3 and text[pos] == '{':
+        return _scan_object(text, pos, depth)
+    if depth == 3 and text[pos] == '"':
+        end = text.find('"', pos + 1)
+        if end - pos - 1 >= _payload_min_length and text[end - 1] != '\\':
+            return PayloadSpan(pos + 1, end), end + 1
+    return _json_decoder.scan_once(text, pos)
+
+def _scan_object(text, pos, depth):
+    obj = {}
+    pos = _skip_ws(text, pos + 1)
+    if text[pos] == '}':
+        return obj, pos + 1
+    while True:
+        if text[pos] != '"':
+            raise ValueError(f"Expecting property name at position {pos}")
+        key, pos = json.decoder.scanstring(text, pos + 1)
+        pos = _skip_ws(text, pos)
+        if text[pos] != ':':
+            raise ValueError(f"Expecting ':' at position {pos}")
+        obj[key], pos = _scan_value(text, _skip_ws(text, pos + 1), depth + 1)
+        pos = _skip_ws(text, pos)
+        if text[pos] == '}':
+            return obj, pos + 1
+        if text[pos] != ',':
+            raise ValueError(f"Expecting ',' delimiter at position {pos}")
+        pos = _skip_ws(text, pos + 1)
+
+_enable_re = re.compile(rb'"enable":(true|false)')
+
+def payload_enabled(text: str, span: PayloadSpan) -> Optional[bool]:
+    # the "enable" flag is near the start of IGC, GC and gamut payloads, so only
+    # a prefix is decoded unless it is not there
+    length = (span.end - span.start) // 2
+    prefix = min(length, 256 + length % 2)
+    match = _enable_re.search(_swap_byte_pairs(bytes.fromhex(text[span.start:span.start + 2 * prefix])))
+    if match is not None:
+        return match.group(1) == b'true'
+    if prefix == length:
+        return None
+    jdoc = decode_nested_json(text[span.start:span.end])
+    return jdoc.get("enable") if isinstance(jdoc, dict) else None
+
+def _dumps(value):
+    return json.dumps(value, indent=None, separators=(',', ':'))
+
+class _ObjectSpans:
+    def __init__(self):
+        self.keys = []
+        self.close = None
+        self.values = {}
+        self.spans = {}
+
+class _SpanScanner:
+    # Parses the document like json.loads, recording the byte spans of the values
+    # inside each mode object (depth 2) and whether the text is exactly what
+    # json.dump(..., separators=(',', ':')) would produce.
+    def __init__(self, text: str):
+        self.text = text
+        self.canonical = True
+        self.tree = {}
+
+    def scan(self):
+        pos = self._skip_ws(0)
+        jdoc, pos = self._parse_object(pos, 0, self.tree)
+        if self._skip_ws(pos) != len(self.text):
+            raise ValueError("Extra data after JSON document")
+        return jdoc
+
+    def _skip_ws(self, pos):
+        end = _json_ws_re.match(self.text, pos).end()
+        if end != pos:
+            self.canonical = False
+        return end
+
+    def _check_canonical(self, value, start, end):
+        if not self.canonical:
+            return
+        raw = self.text[start:end]
+        if isinstance(value, str) and '\\' not in raw and raw.isascii():
+            return
+        if _dumps(value) != raw:
+            self.canonical = False
+
+    def _parse_object(self, pos, depth, spans):
+        text = self.text
+        if text[pos] != '{':
+            raise ValueError(f"Expecting object at position {pos}")
+        obj = {}
+        pos = self._skip_ws(pos + 1)
+        if text[pos] == '}':
+            return obj, pos + 1
+        while True:
+            if text[pos] != '"':
+                raise ValueError(f"Expecting property name at position {pos}")
+            key, end = json.decoder.scanstring(text, pos + 1)
+            self._check_canonical(key, pos, end)
+            pos = self._skip_ws(end)
+            if text[pos] != ':':
+                raise ValueError(f"Expecting ':' at position {pos}")
+            pos = self._skip_ws(pos + 1)
+            if depth < 2 and text[pos] == '{':
+                child = {} if depth == 0 else _ObjectSpans()
+                value, end = self._parse_object(pos, depth + 1, child)
+                if depth == 1:
+                    child.close = end - 1
+                spans[key] = child
+            else:
+                value, end = _json_decoder.scan_once(text, pos)
+                self._check_canonical(value, pos, end)
+                if depth == 2:
+                    spans.spans[key] = (pos, end)
+                    spans.values[key] = value
+                else:
+                    spans[key] = (pos, end, value)
+            if depth == 2:
+                spans.keys.append(key)
+            obj[key] = value
+            pos = self._skip_ws(end)
+            if text[pos] == '}':
+                return obj, pos + 1
+            if text[pos] != ',':
+                raise ValueError(f"Expecting ',' delimiter at position {pos}")
+            pos = self._skip_ws(pos + 1)
 
 class QdcmDatabaseJson:
-    def __init__(self, filename: str):
-        with open(filename, 'r') as f:
-            jdoc = json.load(f)
+    def __init__(self, filename: Optional[str] = None, text: Optional[str] = None):
+        if text is None:
+            with open(filename, 'r', encoding='utf-8') as f:
+                text = f.read()
+        self.text = text
+        scanner = _SpanScanner(self.text)
+        jdoc = scanner.scan()
+        self.canonical = scanner.canonical
+        self.spans = scanner.tree
         self.jdoc = jdoc
         modes = {}
-        panel_key = next(iter(set(jdoc.keys()) - {"Copyright", "Version"}))
-        for mode_name, mode_obj in jdoc[panel_key].items():
+        self.panel_key = panel_key(jdoc)
+        for mode_obj in jdoc[self.panel_key].values():
             try:
-                modename2 = (
-                    f"gamut {_gamut_map[mode_obj['Applicability']['ColorPrimaries']]}" +
-                    f" gamma {_transfer_map[mode_obj['Applicability']['GammaTransfer']]}" +
-                    f" intent {mode_obj['Applicability']['RenderIntent']}" +
-                    f" Dynamic_range {mode_obj['DynamicRange']}"
-                )
-                modes[modename2] = QdcmModeJson(mode_obj)
+                modes[mode_name(mode_obj)] = QdcmModeJson(mode_obj)
             except KeyError:
                 pass
         self.modes = modes
@@ -193,25 +411,92 @@ class QdcmDatabaseJson:
 
     def get_mode(self, name):
         return self.modes[name]
-    
+
+    def _unchanged(self, value, start, end, original):
+        # strings cannot be modified in place, anything else is compared with its source text
+        if isinstance(value, str) and isinstance(original, str):
+            return value == original
+        return _dumps(value) == self.text[start:end]
+
+    def _splices(self):
+        # yields (start, end, replacement) for every changed mode field, or raises
+        # LookupError if the document changed in a way splicing cannot express
+        if list(self.jdoc.keys()) != list(self.spans.keys()):
+            raise LookupError
+        for panel_key, panel_spans in self.spans.items():
+            panel = self.jdoc[panel_key]
+            if isinstance(panel_spans, tuple):
+                if not self._unchanged(panel, *panel_spans):
+                    raise LookupError
+                continue
+            if not isinstance(panel, dict) or list(panel.keys()) != list(panel_spans.keys()):
+                raise LookupError
+            for mode_key, mode_spans in panel_spans.items():
+                mode_obj = panel[mode_key]
+                if isinstance(mode_spans, tuple):
+                    if not self._unchanged(mode_obj, *mode_spans):
+                        raise LookupError
+                    continue
+                if not isinstance(mode_obj, dict):
+                    raise LookupError
+                keys = list(mode_obj.keys())
+                if keys[:len(mode_spans.keys)] != mode_spans.keys:
+                    raise LookupError
+                for key in mode_spans.keys:
+                    start, end = mode_spans.spans[key]
+                    if not self._unchanged(mode_obj[key], start, end, mode_spans.values[key]):
+                        yield start, end, _dumps(mode_obj[key])
+                added = keys[len(mode_spans.keys):]
+                if added:
+                    members = [_dumps(key) + ':' + _dumps(mode_obj[key]) for key in added]
+                    prefix = ',' if mode_spans.keys else ''
+                    yield mode_spans.close, mode_spans.close, prefix + ','.join(members)
+
     def dump(self, io):
-        json.dump(self.jdoc, io, indent=None, separators=(',', ':'))
-        
+        splices = None
+        if self.canonical:
+            try:
+                splices = list(self._splices())
+            except LookupError:
+                pass
+        if splices is None:
+            json.dump(self.jdoc, io, indent=None, separators=(',', ':'))
+            return
+        # the source is already in json.dump form, so only changed fields are re-emitted
+        from qdcmdiy.store import write_range
+        pos = 0
+        for start, end, replacement in splices:
+            write_range(io, self.text, pos, start)
+            io.write(replacement)
+            pos = end
+        write_range(io, self.text, pos)
+
 class QdcmModeJson:
     def __init__(self, objref: dict):
         self.objref = objref
+    def get_color_pipeline(self) -> ColorPipeline:
+        def decode(key, converter):
+            payload = self.objref.get(key)
+            if not payload:
+                return None
+            return converter(decode_nested_json(payload))
+        return ColorPipeline(
+            degamma=decode("PostBlendIGC", igc_json_to_lut3x1d),
+            gamut=decode("PostBlendGamut", json_to_lut3d),
+            gamma=decode("PostBlendGC", gc_json_to_lut3x1d),
+        )
     def set_color_pipeline(self, pipeline: ColorPipeline):
         assert pipeline is not None
         if pipeline.degamma is not None:
-            self.objref["PostBlendIGC"] = encode_nested_json(lut3x1d_to_igc_json(pipeline.degamma))
+            self.objref["PostBlendIGC"] = _igc_payload(pipeline.degamma)
         else:
-            self.objref["PostBlendIGC"] = encode_nested_json(_linear_igc)
+            self.objref["PostBlendIGC"] = _linear_igc_payload()
         if pipeline.gamut is not None:
-            self.objref["PostBlendGamut"] = encode_nested_json(lut3d_to_json(pipeline.gamut))
+            self.objref["PostBlendGamut"] = _gamut_payload(pipeline.gamut)
         else:
-            self.objref["PostBlendGamut"] = encode_nested_json(_linear_3dlut)
+            self.objref["PostBlendGamut"] = _linear_3dlut_payload()
         if pipeline.gamma is not None:
-            self.objref["PostBlendGC"] = encode_nested_json(lut3x1d_to_gc_json(pipeline.gamma))
+            self.objref["PostBlendGC"] = _gc_payload(pipeline.gamma)
         else:
-            self.objref["PostBlendGC"] = encode_nested_json(_linear_gc)
+            self.objref["PostBlendGC"] = _linear_gc_payload()
         self.objref["PostBlendPCC"] = encode_nested_json(_dummy_pcc)
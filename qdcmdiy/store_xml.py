@@ -1,132 +1,311 @@
-import xml.dom.minidom
-import colour
+from __future__ import annotations
+import re
+import sys
+import codecs
+import functools
+import xml.parsers.expat
+from xml.sax.saxutils import escape, quoteattr
 import numpy as np
+from typing import Optional, TYPE_CHECKING
 
-from qdcmdiy.pipeline import ColorPipeline
-from .data import resample_lut, to_10bit, to_12bit, to_4096
+from qdcmdiy import instrument
+from qdcmdiy.pipeline import ColorPipeline, Stage, as_transform
+from .data import to_10bit, to_12bit, to_4096, memoize_payload
+from .payload import hex_upper, words
 
-def lut3x1d_to_igc_xml(lut: colour.LUT3x1D):
-    if lut.size != 256:
-        lut = colour.LUT3x1D(lut.apply(colour.LUT3x1D.linear_table(256)))
-    buf = np.zeros(1024*3+3, dtype="<u4")
+if TYPE_CHECKING:
+    import colour
+
+@instrument.traced('encode')
+def _encode_words(buf):
+    return hex_upper(buf)
+
+@memoize_payload
+def lut3x1d_to_igc_xml(lut: Stage):
+    lut = as_transform(lut).sample_3x1d(256)
+    buf = words("xml.igc", 1024*3+3)
     buf[0] = 0
     buf[1] = 256
     buf[2] = 6
     buf[3:256+3] = to_10bit(lut.table[:, 0].ravel())
     buf[1024+3:1024+3+256] = to_10bit(lut.table[:, 1].ravel())
     buf[2048+3:2048+3+256] = to_10bit(lut.table[:, 2].ravel())
-    return buf.tobytes().hex().upper()
+    return _encode_words(buf)
 
-def lut3x1d_to_gc_xml(lut: colour.LUT3x1D):
-    if lut.size != 1024:
-        lut = colour.LUT3x1D(lut.apply(colour.LUT3x1D.linear_table(1024)))
-    buf = np.zeros(1024*3+3, dtype="<u4")
+@memoize_payload
+def lut3x1d_to_gc_xml(lut: Stage):
+    lut = as_transform(lut).sample_3x1d(1024)
+    buf = words("xml.gc", 1024*3+3)
     buf[0] = 1
     buf[1] = 1024
     buf[2] = 6
     buf[3:1024+3] = to_10bit(lut.table[:, 0].ravel())
     buf[1024+3:1024+3+1024] = to_10bit(lut.table[:, 1].ravel())
     buf[2048+3:2048+3+1024] = to_10bit(lut.table[:, 2].ravel())
-    return buf.tobytes().hex().upper()
+    return _encode_words(buf)
+
+@functools.lru_cache(maxsize=None)
+def _lut3d_inputs():
+    import colour
+    return to_4096(colour.LUT3D.linear_table(17).transpose(2, 1, 0, 3))
 
-def lut3d_to_xml(lut: colour.LUT3D):
-    linear17 = colour.LUT3D.linear_table(17)
-    if lut.size != 17:
-        lut = resample_lut(lut, 17)
-    buf = np.zeros(17*17*17*6+4, dtype="<u4")
+@memoize_payload
+def lut3d_to_xml(lut: Stage):
+    lut = as_transform(lut).sample_3d(17)
+    buf = words("xml.gamut", 17*17*17*6+4)
     buf[3] = 4913
+    # entries are stored with red varying fastest, each as (input, output)
     lutview = buf[4:].reshape((17, 17, 17, 2, 3))
-    i = 4
-    for b in range(17):
-        for g in range(17):
-            for r in range(17):
-                lutview[b, g, r, 0, :] = to_4096(linear17[r, g, b])
-                lutview[b, g, r, 1, :] = to_4096(lut.table[r, g, b])
-    return buf.tobytes().hex().upper()
-
-def set_inner_text(node, text):
-    for child in node.childNodes:
-        node.removeChild(child)
-    node.appendChild(node.ownerDocument.createTextNode(text))
+    lutview[:, :, :, 0, :] = _lut3d_inputs()
+    lutview[:, :, :, 1, :] = to_4096(lut.table.transpose(2, 1, 0, 3))
+    return _encode_words(buf)
+
+def _feature_words(text: str):
+    return np.frombuffer(bytes.fromhex(text.strip()), dtype="<u4")
+
+def igc_xml_to_lut3x1d(text: str):
+    import colour
+    buf = _feature_words(text)
+    size = int(buf[1])
+    table = buf[3:1024*3+3].reshape((3, 1024))[:, :size].T / 1023
+    return colour.LUT3x1D(np.ascontiguousarray(table))
+
+def gc_xml_to_lut3x1d(text: str):
+    return igc_xml_to_lut3x1d(text)
+
+def xml_to_lut3d(text: str):
+    import colour
+    buf = _feature_words(text)
+    size = round(int(buf[3]) ** (1 / 3))
+    lutview = buf[4:4+size**3*6].reshape((size, size, size, 2, 3))
+    # entries are stored with red varying fastest, each as (input, output)
+    table = lutview[:, :, :, 1, :].transpose(2, 1, 0, 3) / 4096
+    return colour.LUT3D(np.ascontiguousarray(table))
+
+_tag_re = re.compile(rb'<[^>"\']*(?:(?:"[^"]*"|\'[^\']*\')[^>"\']*)*>')
+_encoding_re = re.compile(rb'<\?xml[^>]*encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+
+class XmlElement:
+    def __init__(self, source: bytes, name: str, attrs: dict, start: int):
+        self.source = source
+        self.name = name
+        self.attrs = attrs
+        self.start = start
+        self.start_tag_end = _tag_re.match(source, start).end()
+        self.self_closing = source[self.start_tag_end-2:self.start_tag_end] == b'/>'
+        self.end_tag_start = self.start_tag_end
+        self.end = self.start_tag_end
+        self.changed_attrs = {}
+        self.new_text = None
+
+    def close(self, end_tag_start: int):
+        if not self.self_closing:
+            self.end_tag_start = end_tag_start
+            self.end = self.source.index(b'>', end_tag_start) + 1
+
+    def get_attribute(self, name):
+        return self.changed_attrs.get(name, self.attrs.get(name, ""))
+
+    def set_attribute(self, name, value):
+        self.changed_attrs[name] = value
+
+    def get_text(self, encoding):
+        if self.new_text is not None:
+            return self.new_text
+        return self.source[self.start_tag_end:self.end_tag_start].decode(encoding)
+
+    def set_text(self, text):
+        self.new_text = text
+
+    def is_modified(self):
+        return bool(self.changed_attrs) or self.new_text is not None
+
+    def render_start_tag(self, encoding):
+        tag = self.source[self.start:self.start_tag_end]
+        for name, value in self.changed_attrs.items():
+            quoted = quoteattr(value).encode(encoding)
+            attr_re = re.compile(rb'(\s' + re.escape(name.encode(encoding)) + rb'\s*=\s*)("[^"]*"|\'[^\']*\')')
+            tag, count = attr_re.subn(lambda m: m.group(1) + quoted, tag, count=1)
+            if count == 0:
+                insert_at = len(tag) - (2 if self.self_closing else 1)
+                tag = tag[:insert_at].rstrip() + b' ' + name.encode(encoding) + b'=' + quoted + tag[insert_at:]
+        if self.self_closing and self.new_text is not None:
+            tag = tag[:-2].rstrip() + b'>'
+        return tag
+
+def render_element(name, attrs, text):
+    attr_text = "".join(f" {key}={quoteattr(value)}" for key, value in attrs.items())
+    return f"<{name}{attr_text}>{escape(text)}</{name}>"
 
 class QdcmDatabaseXml:
-    def __init__(self, filename):
-        self.dom = xml.dom.minidom.parse(filename)
-        modes = {}
-        for mode in self.dom.getElementsByTagName("Mode"):
-            modes[mode.getAttribute("Name")] = QdcmModeXml(mode)
-        self.modes = modes
+    def __init__(self, filename: Optional[str] = None, source: Optional[bytes] = None):
+        if source is None:
+            with open(filename, 'rb') as f:
+                source = f.read()
+        self.source = bytes(source)
+        match = _encoding_re.match(self.source)
+        self.encoding = match.group(1).decode() if match else 'utf-8'
+        self.modes = {}
+        # every mode in document order, modes sharing a Name are only reachable here
+        self.mode_list = []
+        self.panel_name = None
+        self._index()
+
+    def _index(self):
+        # single expat pass recording byte offsets of Mode and Feature elements;
+        # character data is never materialized
+        parser = xml.parsers.expat.ParserCreate()
+        current_mode = None
+        open_elements = []
+
+        def start_element(name, attrs):
+            nonlocal current_mode
+            if name == "Mode":
+                element = XmlElement(self.source, name, attrs, parser.CurrentByteIndex)
+                current_mode = QdcmModeXml(self, element)
+                open_elements.append(element)
+            elif name == "Disp_Type":
+                self.panel_name = attrs.get("Name")
+                open_elements.append(None)
+            elif name == "Feature" and current_mode is not None:
+                element = XmlElement(self.source, name, attrs, parser.CurrentByteIndex)
+                current_mode.features.append(element)
+                open_elements.append(element)
+            else:
+                open_elements.append(None)
+
+        def end_element(name):
+            nonlocal current_mode
+            element = open_elements.pop()
+            if element is None:
+                return
+            element.close(parser.CurrentByteIndex)
+            if name == "Mode":
+                self.modes[element.attrs.get("Name", "")] = current_mode
+                self.mode_list.append(current_mode)
+                current_mode = None
+
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.Parse(self.source, True)
+
     def get_mode(self, name):
         return self.modes[name]
     def get_mode_names(self):
         return list(self.modes.keys())
+
+    def _splices(self):
+        for mode in self.mode_list:
+            for feature in mode.features:
+                if not feature.is_modified():
+                    continue
+                start_tag = feature.render_start_tag(self.encoding)
+                if feature.new_text is None:
+                    yield feature.start, feature.start_tag_end, start_tag
+                else:
+                    text = escape(feature.new_text).encode(self.encoding)
+                    if feature.self_closing:
+                        yield feature.start, feature.end, start_tag + text + b'</Feature>'
+                    else:
+                        yield feature.start, feature.start_tag_end, start_tag
+                        yield feature.start_tag_end, feature.end_tag_start, text
+            if mode.new_features:
+                pos = mode.element.end_tag_start
+                yield pos, pos, "".join(render_element("Feature", attrs, text) for attrs, text in mode.new_features).encode(self.encoding)
+
     def dump(self, io):
-        self.dom.writexml(io)
+        # untouched regions are copied through byte-for-byte
+        pos = 0
+        for start, end, replacement in sorted(self._splices(), key=lambda splice: splice[0]):
+            self._write_source(io, pos, start)
+            io.write(replacement.decode(self.encoding))
+            pos = end
+        self._write_source(io, pos, len(self.source))
+
+    def _write_source(self, io, start, end):
+        from qdcmdiy.store import write_chunk_size
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        view = memoryview(self.source)
+        for pos in range(start, end, write_chunk_size):
+            io.write(decoder.decode(view[pos:min(pos + write_chunk_size, end)]))
+        io.write(decoder.decode(b'', final=True))
 
 class QdcmModeXml:
-    def __init__(self, dom_node: xml.dom.minidom.Element):
-        self.dom_node = dom_node
+    def __init__(self, db: QdcmDatabaseXml, element: XmlElement):
+        self.db = db
+        self.element = element
+        self.features = []
+        self.new_features = []
+
+    def _find_feature(self, feature_type):
+        for feature in self.features:
+            if feature.get_attribute("FeatureType") == feature_type:
+                return feature
+        return None
+
+    def _append_feature(self, feature_type, data_size, text):
+        self.new_features.append(({"FeatureType": feature_type, "Disable": "false", "DataSize": data_size}, text))
+
+    def get_color_pipeline(self) -> ColorPipeline:
+        def decode(feature_type, converter):
+            feature = self._find_feature(feature_type)
+            if feature is None:
+                text = next((text for attrs, text in self.new_features if attrs["FeatureType"] == feature_type), "")
+            elif feature.get_attribute("Disable") == "true":
+                return None
+            else:
+                text = feature.get_text(self.db.encoding)
+            if not text.strip():
+                return None
+            return converter(text)
+        return ColorPipeline(
+            degamma=decode("7", igc_xml_to_lut3x1d),
+            gamut=decode("3", xml_to_lut3d),
+            gamma=decode("8", gc_xml_to_lut3x1d),
+        )
 
     def set_color_pipeline(self, pipeline: ColorPipeline):
-        def find_feature(feature_type):
-            for feature in self.dom_node.getElementsByTagName("Feature"):
-                if feature.getAttribute("FeatureType") == feature_type:
-                    return feature
-            return None
-        
+        find_feature = self._find_feature
+
         igc_feature = find_feature("7")
         gc_feature = find_feature("8")
         gamut_feature = find_feature("3")
         mixer_gc_feature = find_feature("6")
         pcc_feature = find_feature("2")
+        self.new_features.clear()
 
         if igc_feature is not None:
-            print("found igc feature")
+            print("found igc feature", file=sys.stderr)
             if pipeline.degamma is not None:
-                set_inner_text(igc_feature, lut3x1d_to_igc_xml(pipeline.degamma))
-                igc_feature.setAttribute("Disable", "false")
+                igc_feature.set_text(lut3x1d_to_igc_xml(pipeline.degamma))
+                igc_feature.set_attribute("Disable", "false")
             else:
-                igc_feature.setAttribute("Disable", "true")
+                igc_feature.set_attribute("Disable", "true")
         elif pipeline.degamma is not None:
-            igc_feature = self.dom_node.ownerDocument.createElement("Feature")
-            igc_feature.setAttribute("FeatureType", "7")
-            igc_feature.setAttribute("Disable", "false")
-            igc_feature.setAttribute("DataSize", "12300")
-            igc_feature.appendChild(self.dom_node.ownerDocument.createTextNode(lut3x1d_to_igc_xml(pipeline.degamma)))
-            self.dom_node.appendChild(igc_feature)
+            self._append_feature("7", "12300", lut3x1d_to_igc_xml(pipeline.degamma))
 
         if gc_feature is not None:
-            print("found gc feature")
-            if pipeline.degamma is not None:
-                set_inner_text(gc_feature, lut3x1d_to_igc_xml(pipeline.gamma))
-                gc_feature.setAttribute("Disable", "false")
+            print("found gc feature", file=sys.stderr)
+            if pipeline.gamma is not None:
+                gc_feature.set_text(lut3x1d_to_gc_xml(pipeline.gamma))
+                gc_feature.set_attribute("Disable", "false")
             else:
-                gc_feature.setAttribute("Disable", "true")
+                gc_feature.set_attribute("Disable", "true")
         elif pipeline.gamma is not None:
-            gc_feature = self.dom_node.ownerDocument.createElement("Feature")
-            gc_feature.setAttribute("FeatureType", "8")
-            gc_feature.setAttribute("Disable", "false")
-            gc_feature.setAttribute("DataSize", "12300")
-            igc_feature.appendChild(self.dom_node.ownerDocument.createTextNode(lut3x1d_to_gc_xml(pipeline.gamma)))
-            self.dom_node.appendChild(gc_feature)
+            self._append_feature("8", "12300", lut3x1d_to_gc_xml(pipeline.gamma))
 
         if gamut_feature is not None:
-            print("found gamut feature")
+            print("found gamut feature", file=sys.stderr)
             if pipeline.gamut is not None:
-                set_inner_text(gamut_feature, lut3d_to_xml(pipeline.gamut))
-                gamut_feature.setAttribute("Disable", "false")
+                gamut_feature.set_text(lut3d_to_xml(pipeline.gamut))
+                gamut_feature.set_attribute("Disable", "false")
             else:
-                gamut_feature.setAttribute("Disable", "true")
-        elif pipeline.gamma is not None:
-            gamut_feature = self.dom_node.ownerDocument.createElement("Feature")
-            gamut_feature.setAttribute("FeatureType", "3")
-            gamut_feature.setAttribute("Disable", "false")
-            gamut_feature.setAttribute("DataSize", "117928")
-            igc_feature.appendChild(self.dom_node.ownerDocument.createTextNode(lut3d_to_xml(pipeline.gamut)))
-            self.dom_node.appendChild(gamut_feature)
+                gamut_feature.set_attribute("Disable", "true")
+        elif pipeline.gamut is not None:
+            self._append_feature("3", "117928", lut3d_to_xml(pipeline.gamut))
 
         if mixer_gc_feature is not None:
-            mixer_gc_feature.setAttribute("Disable", "true")
+            mixer_gc_feature.set_attribute("Disable", "true")
 
         if pcc_feature is not None:
-            pcc_feature.setAttribute("Disable", "true")
+            pcc_feature.set_attribute("Disable", "true")
@@ -0,0 +1,82 @@
+import functools
+import numpy as np
+
+from qdcmdiy.pipeline import Trc
+
+# Analytic transfer functions on normalized [0, 1] signals, usable as pipeline
+# stages by name (e.g. "builtin:srgb-eotf"). They are evaluated directly at the
+# sample points the backend needs, no LUT file is read or interpolated.
+#
+# PQ is normalized to 10000 cd/m^2, BT.1886 assumes a zero black level.
+
+builtin_prefix = 'builtin:'
+
+def srgb_eotf(x):
+    return np.where(x <= 0.04045, x / 12.92, ((np.maximum(x, 0.04045) + 0.055) / 1.055) ** 2.4)
+
+def srgb_eotf_inverse(y):
+    return np.where(y <= 0.0031308, y * 12.92, 1.055 * np.maximum(y, 0.0031308) ** (1 / 2.4) - 0.055)
+
+def gamma(x, exponent):
+    return np.sign(x) * np.abs(x) ** exponent
+
+_pq_m1 = 2610 / 16384
+_pq_m2 = 2523 / 4096 * 128
+_pq_c1 = 3424 / 4096
+_pq_c2 = 2413 / 4096 * 32
+_pq_c3 = 2392 / 4096 * 32
+
+def pq_eotf(x):
+    p = np.clip(x, 0, 1) ** (1 / _pq_m2)
+    return (np.maximum(p - _pq_c1, 0) / (_pq_c2 - _pq_c3 * p)) ** (1 / _pq_m1)
+
+def pq_eotf_inverse(y):
+    p = np.clip(y, 0, 1) ** _pq_m1
+    return ((_pq_c1 + _pq_c2 * p) / (1 + _pq_c3 * p)) ** _pq_m2
+
+_hlg_a = 0.17883277
+_hlg_b = 1 - 4 * _hlg_a
+_hlg_c = 0.5 - _hlg_a * np.log(4 * _hlg_a)
+
+def hlg_oetf(y):
+    y = np.maximum(y, 0)
+    return np.where(y <= 1 / 12, np.sqrt(3 * y), _hlg_a * np.log(np.maximum(12 * y - _hlg_b, 1e-12)) + _hlg_c)
+
+def hlg_oetf_inverse(x):
+    x = np.maximum(x, 0)
+    return np.where(x <= 0.5, x * x / 3, (np.exp((x - _hlg_c) / _hlg_a) + _hlg_b) / 12)
+
+_builtins = {
+    'srgb-eotf': srgb_eotf,
+    'srgb-eotf-inverse': srgb_eotf_inverse,
+    'pq-eotf': pq_eotf,
+    'pq-eotf-inverse': pq_eotf_inverse,
+    'hlg-oetf': hlg_oetf,
+    'hlg-oetf-inverse': hlg_oetf_inverse,
+    'bt1886-eotf': functools.partial(gamma, exponent=2.4),
+    'bt1886-eotf-inverse': functools.partial(gamma, exponent=1 / 2.4),
+}
+
+builtin_names = sorted(_builtins) + ['gamma-<N>', 'gamma-<N>-inverse']
+
+def is_builtin(filename: str) -> bool:
+    return filename.startswith(builtin_prefix)
+
+def builtin(name: str) -> Trc:
+    if name.startswith(builtin_prefix):
+        name = name[len(builtin_prefix):]
+    function = _builtins.get(name)
+    if function is None and name.startswith('gamma-'):
+        value = name[len('gamma-'):]
+        inverse = value.endswith('-inverse')
+        if inverse:
+            value = value[:-len('-inverse')]
+        try:
+            exponent = float(value)
+        except ValueError:
+            exponent = 0
+        if exponent > 0:
+            function = functools.partial(gamma, exponent=1 / exponent if inverse else exponent)
+    if function is None:
+        raise ValueError(f"Unknown builtin transfer function {name!r}, available: {', '.join(builtin_names)}")
+    return Trc(builtin_prefix + name, function)
@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+import select
+import struct
+from typing import Iterable
+
+# File change notification for build --watch: inotify on Linux (through
+# ctypes, no extra dependency), polling os.stat() everywhere else. Watchers
+# watch the directories of the given files, so files replaced by rename (as
+# editors and qdcmdiy.store.save do) are noticed too, and report a burst of
+# changes once it has settled.
+
+settle_time = 0.1
+poll_interval = 0.5
+
+class PollingWatcher:
+    def __init__(self):
+        self.paths = {}
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns, st.st_ino
+
+    def update(self, paths: Iterable[str]):
+        self.paths = {path: self.paths.get(path, self._stat(path)) for path in map(os.path.abspath, paths)}
+
+    def _changed(self) -> set[str]:
+        changed = set()
+        for path, before in self.paths.items():
+            now = self._stat(path)
+            if now != before:
+                self.paths[path] = now
+                changed.add(path)
+        return changed
+
+    def wait(self) -> set[str]:
+        while True:
+            changed = self._changed()
+            if changed:
+                time.sleep(settle_time)
+                return changed | self._changed()
+            time.sleep(poll_interval)
+
+    def close(self):
+        pass
+
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_DELETE = 0x200
+_IN_CLOEXEC = 0o2000000
+_watch_mask = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_DELETE
+_event_header = struct.Struct('iIII')
+
+class InotifyWatcher:
+    def __init__(self):
+        import ctypes
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(_IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs = {}
+        self.paths = set()
+
+    def update(self, paths: Iterable[str]):
+        import ctypes
+        self.paths = set(map(os.path.abspath, paths))
+        for dirname in {os.path.dirname(path) for path in self.paths}:
+            if dirname in self.dirs.values():
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirname), _watch_mask)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f'cannot watch {dirname}')
+            self.dirs[wd] = dirname
+
+    def _read(self, timeout) -> set[str]:
+        changed = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed
+        data = os.read(self.fd, 65536)
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, length = _event_header.unpack_from(data, pos)
+            name = data[pos + _event_header.size:pos + _event_header.size + length].rstrip(b'\0')
+            pos += _event_header.size + length
+            dirname = self.dirs.get(wd)
+            if dirname is not None:
+                path = os.path.join(dirname, os.fsdecode(name))
+                if path in self.paths:
+                    changed.add(path)
+        return changed
+
+    def wait(self) -> set[str]:
+        changed = set()
+        while not changed:
+            changed = self._read(None)
+        # collect the rest of the burst, e.g. several LUT files written by one export
+        while True:
+            more = self._read(settle_time)
+            if not more:
+                return changed
+            changed |= more
+
+    def close(self):
+        os.close(self.fd)
+
+def make_watcher(poll: bool = False):
+    if not poll and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# run against the checkout, as ./qdcm-diy does, with or without python -m pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
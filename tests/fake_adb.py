@@ -0,0 +1,88 @@
+# usage: python -m qdcmdiy deploy --adb "python tests/fake_adb.py" ...
+#
+# Stands in for adb with no hardware: every directory under $FAKE_ADB_ROOT is
+# a device (named by its serial) holding the part of the device file system
+# deploy touches. Shell commands run in the local sh with absolute device paths
+# moved under the device directory (and back in the output), su running them
+# directly and chcon doing nothing. $FAKE_ADB_LATENCY adds a delay (seconds) to
+# every command, and the first push to each serial in $FAKE_ADB_FLAKY (comma
+# separated) fails.
+#
+# make_device() creates a device whose panel is found as described in the
+# README, with the given stock database file.
+
+import os
+import re
+import sys
+import time
+import shutil
+import subprocess
+
+_device_path_re = re.compile(r'(?<![\w.@-])/(?=(proc|sys|vendor|data|mnt)/)')
+
+def make_device(root, serial, panel, database):
+    device = os.path.join(root, serial)
+    node = 'qcom,mdss_dsi_' + panel.lower().replace(' ', '_')
+    with open(_mkfile(device, 'proc/cmdline'), 'w') as f:
+        f.write(f'console=ttyMSM0 msm_drm.dsi_display0={node}:config0 androidboot.hardware=qcom\n')
+    with open(_mkfile(device, f'sys/firmware/devicetree/base/soc/qcom,mdss_mdp@ae00000/{node}/qcom,mdss-dsi-panel-name'), 'wb') as f:
+        f.write(panel.encode() + b'\0')
+    ext = os.path.splitext(database)[1]
+    subdir = 'vendor/etc/display' if ext == '.json' else 'vendor/etc'
+    stock = _mkfile(device, f"{subdir}/qdcm_calib_data_{panel.replace(' ', '_')}{ext}")
+    shutil.copyfile(database, stock)
+    os.makedirs(os.path.join(device, 'data/local/tmp'), exist_ok=True)
+    return stock
+
+def _mkfile(device, path):
+    path = os.path.join(device, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def _local(device, path):
+    return os.path.join(device, path.lstrip('/'))
+
+def main(argv):
+    root = os.environ['FAKE_ADB_ROOT']
+    time.sleep(float(os.environ.get('FAKE_ADB_LATENCY', '0')))
+    serial = None
+    if argv[:1] == ['-s']:
+        serial, argv = argv[1], argv[2:]
+    command, args = argv[0], argv[1:]
+    if command == 'devices':
+        print('List of devices attached')
+        for name in sorted(os.listdir(root)):
+            # skips the markers of flaked pushes
+            if not name.startswith('.') and os.path.isdir(os.path.join(root, name)):
+                print(f'{name}\tdevice')
+        return 0
+    device = os.path.join(root, serial or '')
+    if serial is None or not os.path.isdir(device):
+        print(f"adb: device '{serial}' not found", file=sys.stderr)
+        return 1
+    if command == 'pull':
+        shutil.copyfile(_local(device, args[0]), args[1])
+    elif command == 'push':
+        marker = os.path.join(root, f'.{serial}.flaked')
+        if serial in os.environ.get('FAKE_ADB_FLAKY', '').split(',') and not os.path.exists(marker):
+            open(marker, 'w').close()
+            print('adb: error: failed to copy: connection reset', file=sys.stderr)
+            return 1
+        target = _local(device, args[1])
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(args[0], target)
+    elif command == 'shell':
+        script = _device_path_re.sub(device.replace('\\', '\\\\') + '/', ' '.join(args))
+        script = re.sub(r'\bsu -c\b', 'sh -c', script)
+        script = re.sub(r'\bchcon\b', 'true', script)
+        proc = subprocess.run(['sh', '-c', script], stdout=subprocess.PIPE)
+        # paths printed by the command are device paths again
+        sys.stdout.buffer.write(proc.stdout.replace(os.fsencode(device) + b'/', b'/'))
+        return proc.returncode
+    elif command != 'reboot':
+        print(f'adb: unknown command {command}', file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,75 @@
+# Data builders and reference implementations shared by the tests and the
+# benchmarks, which import this module as tests.helpers.
+
+import json
+
+import numpy as np
+
+def make_ti3(num_patches, seed=0, newline='\n'):
+    rng = np.random.default_rng(seed)
+    rgb = rng.random((num_patches, 3)) * 100
+    xyz = (rgb / 100) ** 2.2 @ np.array([[0.4124, 0.3576, 0.1805], [0.2126, 0.7152, 0.0722], [0.0193, 0.1192, 0.9505]]).T * 100
+    lines = ['CTI3   ', '', 'DESCRIPTOR "Argyll Calibration Target chart information 3"', 'ORIGINATOR "Argyll dispread"',
+             'KEYWORD "DEVICE_CLASS"', 'DEVICE_CLASS "DISPLAY"', 'COLOR_REP "RGB_XYZ"', '',
+             'NUMBER_OF_FIELDS 7', 'BEGIN_DATA_FORMAT', 'SAMPLE_ID RGB_R RGB_G RGB_B XYZ_X XYZ_Y XYZ_Z ', 'END_DATA_FORMAT', '',
+             f'NUMBER_OF_SETS {num_patches}', 'BEGIN_DATA']
+    lines += ['%d %.5f %.5f %.5f %.6f %.6f %.6f' % (i + 1, *rgb[i], *xyz[i]) for i in range(num_patches)]
+    lines += ['END_DATA', '']
+    return newline.join(lines).encode()
+
+def make_cal(size=256, newline='\n'):
+    lines = ['CAL    ', '', 'DESCRIPTOR "Argyll Device Calibration State"', 'ORIGINATOR "Argyll dispcal"',
+             'KEYWORD "DEVICE_CLASS"', 'DEVICE_CLASS "DISPLAY"', 'KEYWORD "COLOR_REP"', 'COLOR_REP "RGB"', '',
+             'KEYWORD "RGB_I"', 'NUMBER_OF_FIELDS 4', 'BEGIN_DATA_FORMAT', 'RGB_I RGB_R RGB_G RGB_B ', 'END_DATA_FORMAT', '',
+             f'NUMBER_OF_SETS {size}', 'BEGIN_DATA']
+    lines += ['%.7e %.7e %.7e %.7e ' % (v, v ** 1.1, v ** 0.95, v) for v in np.linspace(0, 1, size)]
+    lines += ['END_DATA', '']
+    return newline.join(lines).encode()
+
+# the per-byte codecs store_json.encode/decode_str replaced
+
+def legacy_encode(b):
+    buffer = bytearray()
+    offset = 0
+    if len(b) % 2 == 1:
+        buffer.extend("{:02X}".format(b[0]).encode())
+        offset = 1
+    for i in range(offset, len(b), 2):
+        buffer.extend("{:02X}{:02X}".format(b[i+1], b[i]).encode())
+    return buffer.decode()
+
+def legacy_decode_str(s: str):
+    size = len(s) // 2
+    buf = bytearray(size)
+    pos = 0
+    if size % 2 == 1:
+        buf[0] = int(s[0:2], 16)
+        pos = 2
+    for i in range(pos, len(s), 4):
+        pos = i // 2
+        buf[pos] = int(s[i+2:i+4], 16)
+        buf[pos+1] = int(s[i:i+2], 16)
+    return buf
+
+# modules read-only commands must not import, and their -X importtime output
+
+forbidden_modules = ('colour', 'pandas', 'scipy')
+
+def make_json_db(path):
+    mode = {"Applicability": {"ColorPrimaries": "sRGB", "GammaTransfer": "sRGB", "RenderIntent": 1}, "DynamicRange": "SDR"}
+    with open(path, 'w') as f:
+        json.dump({"Copyright": "", "Version": "1", "panel": {"mode0": mode}}, f)
+
+def make_xml_db(path):
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<Calib_Data>\n  <Mode Name="demo_srgb">\n'
+                '    <Feature FeatureType="7" Disable="true" DataSize="12300"></Feature>\n  </Mode>\n</Calib_Data>\n')
+
+def parse_importtime(stderr: str):
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
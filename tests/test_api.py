@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import threading
+import subprocess
+import http.client
+
+import pytest
+
+from qdcmdiy import api, store_json
+
+def _json_db():
+    mode = {"Applicability": {"ColorPrimaries": "sRGB", "GammaTransfer": "sRGB", "RenderIntent": 0}, "DynamicRange": "SDR",
+            "PostBlendGC": store_json._linear_gc_payload(), "PostBlendIGC": store_json._linear_igc_payload()}
+    return json.dumps({"Copyright": "", "Version": "1", "panel": {"mode0": mode}}, separators=(',', ':')).encode()
+
+_mode = 'gamut 1 gamma 1 intent 0 Dynamic_range SDR'
+
+@pytest.fixture(scope='module')
+def server():
+    server = api.make_server(api.Session(), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+def _post(port, path, body):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('POST', path, body)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+def test_modes(server):
+    status, body = _post(server, '/modes', _json_db())
+    assert status == 200
+    assert json.loads(body) == [_mode]
+
+@pytest.mark.parametrize('body', [
+    b'<?xml version="1.0"?><Calib_Data><Mode Name="x"><Feature',
+    b'{"Copyright":"","Version":"1"}',
+    b'{"Copyright":"","Version":"1","panel":{"mode0":',
+    b'\xff\xfe',
+    b'',
+])
+@pytest.mark.parametrize('path', ['/modes', '/patch?mode=x'])
+def test_malformed_database_is_400(server, path, body):
+    status, _ = _post(server, path, body)
+    assert status == 400
+
+def test_unknown_mode_is_404(server):
+    status, body = _post(server, '/patch?mode=nope&input-shaper=builtin:srgb-eotf', _json_db())
+    assert status == 404
+    assert b'nope' in body
+
+def test_unknown_builtin_is_400(server):
+    status, _ = _post(server, '/patch?mode=x&input-shaper=builtin:nope', _json_db())
+    assert status == 400
+
+def test_patch(server):
+    pytest.importorskip('colour')
+    status, body = _post(server, '/patch?mode=' + _mode.replace(' ', '+') + '&input-shaper=builtin:srgb-eotf', _json_db())
+    assert status == 200
+    assert api.Session().mode_names(body) == [_mode]
+
+def test_session_unknown_mode():
+    with pytest.raises(api.UnknownModeError):
+        api.Session().patch_bytes(_json_db(), 'nope', None)
+
+def test_panel_key_without_panel():
+    with pytest.raises(ValueError):
+        store_json.panel_key({"Copyright": "", "Version": "1"})
+
+def test_file_lut_cache_is_bounded(tmp_path):
+    cache = api._FileLutCache(max_luts=2)
+    loads = []
+    def loader(filename):
+        loads.append(filename)
+        return object()
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'{i}.cube'
+        path.write_text(str(i))
+        paths.append(str(path))
+        cache._load(loader, str(path))
+    assert len(cache.luts) == 2
+    # the latest version replaces the cached one instead of adding an entry
+    cache._load(loader, paths[2])
+    (tmp_path / '2.cube').write_text('changed')
+    cache._load(loader, paths[2])
+    assert len(cache.luts) == 2
+    assert loads == paths + [paths[2]]
+
+_xml_db = (b'<?xml version="1.0" encoding="utf-8"?>\n<Calib_Data><Disp_Type Name="panel"/><Mode Name="demo_srgb">'
+           b'<Feature FeatureType="7" Disable="true" DataSize="12300"></Feature>'
+           b'<Feature FeatureType="8" Disable="true" DataSize="12300"></Feature></Mode></Calib_Data>\n')
+
+def test_patch_xml_keeps_stdout_clean(server, capsys):
+    pytest.importorskip('colour')
+    status, body = _post(server, '/patch?mode=demo_srgb&input-shaper=builtin:srgb-eotf', _xml_db)
+    assert status == 200
+    assert b'Disable="false"' in body
+    assert capsys.readouterr().out == ''
+
+@pytest.mark.parametrize('host', ['127.0.0.1', '127.0.0.2', 'localhost', '::1'])
+def test_loopback_hosts(host):
+    assert api._is_loopback(host)
+
+@pytest.mark.parametrize('host', ['0.0.0.0', '', '192.168.1.2', '::', 'example.com'])
+def test_make_server_refuses_other_hosts(host):
+    with pytest.raises(ValueError, match='refusing to listen on'):
+        api.make_server(api.Session(), host=host, port=0)
+
+def test_serve_refuses_other_hosts():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run([sys.executable, '-m', 'qdcmdiy', 'serve', '--host', '0.0.0.0', '--port', '0'], cwd=root, capture_output=True, text=True, timeout=60)
+    assert proc.returncode == 1
+    assert proc.stderr.startswith('refusing to listen on 0.0.0.0')
+    assert proc.stdout == ''
@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+
+import numpy as np
+import pytest
+
+colour = pytest.importorskip('colour')
+
+from qdcmdiy import batch, store, store_json, transfer
+from qdcmdiy.pipeline import ColorPipeline, compose
+
+_modes = ['gamut 1 gamma 1 intent 0 Dynamic_range SDR', 'gamut 1 gamma 1 intent 1 Dynamic_range SDR']
+
+def _write_db(path, version='1'):
+    def mode(intent):
+        return {"Applicability": {"ColorPrimaries": "sRGB", "GammaTransfer": "sRGB", "RenderIntent": intent}, "DynamicRange": "SDR",
+                "PostBlendGC": store_json._linear_gc_payload(), "PostBlendIGC": store_json._linear_igc_payload()}
+    with open(path, 'w') as f:
+        json.dump({"Copyright": "", "Version": version, "panel": {"mode0": mode(0), "mode1": mode(1)}}, f, separators=(',', ':'))
+
+def _write_manifest(path, databases):
+    with open(path, 'w') as f:
+        json.dump({'databases': databases}, f)
+
+@pytest.fixture
+def project(tmp_path):
+    os.makedirs(tmp_path / 'panels')
+    _write_db(tmp_path / 'panels' / 'qdcm_calib_data_a.json', '1')
+    _write_db(tmp_path / 'panels' / 'qdcm_calib_data_b.json', '2')
+    colour.io.write_LUT(colour.LUT3x1D(colour.LUT3x1D.linear_table(64) ** 2.2), str(tmp_path / 'shaper.cube'))
+    table = colour.LUT3D.linear_table(17)
+    colour.io.write_LUT(colour.LUT3D(table[..., [1, 2, 0]] ** 0.9), str(tmp_path / 'gamut.cube'))
+    return tmp_path
+
+_stages = {
+    _modes[0]: {'input-shaper': 'shaper.cube', '3dlut': 'gamut.cube', 'output-shaper': ['builtin:srgb-eotf-inverse', 'builtin:gamma-1.1']},
+    _modes[1]: {'input-shaper': 'builtin:srgb-eotf'},
+}
+
+def _expected_pipelines(project):
+    # built without the batch LUT cache
+    return {
+        _modes[0]: ColorPipeline(colour.io.read_LUT(str(project / 'shaper.cube')), colour.io.read_LUT(str(project / 'gamut.cube')),
+                                 compose([transfer.builtin('srgb-eotf-inverse'), transfer.builtin('gamma-1.1')])),
+        _modes[1]: ColorPipeline(transfer.builtin('srgb-eotf')),
+    }
+
+def _patched(filename, pipelines):
+    db = store.load(filename)
+    for mode, pipeline in pipelines.items():
+        db.get_mode(mode).set_color_pipeline(pipeline)
+    return store.dumps(db)
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _specs(job):
+    return [(spec.name, spec.input_shaper, spec.lut3d, spec.output_shaper) for spec in job.modes]
+
+def test_load_manifest(project):
+    manifest = str(project / 'manifest.json')
+    _write_manifest(manifest, [
+        {'file': 'panels/qdcm_calib_data_*.json', 'output': 'patched', 'modes': _stages},
+        {'file': ['panels/qdcm_calib_data_a.json'], 'modes': {_modes[1]: None}},
+    ])
+    jobs = batch.load_manifest(manifest)
+    panels = project / 'panels'
+    assert [(job.filename, job.output) for job in jobs] == [
+        (str(panels / 'qdcm_calib_data_a.json'), str(project / 'patched' / 'qdcm_calib_data_a.json')),
+        (str(panels / 'qdcm_calib_data_b.json'), str(project / 'patched' / 'qdcm_calib_data_b.json')),
+        (str(panels / 'qdcm_calib_data_a.json'), str(panels / 'qdcm_calib_data_a.json')),
+    ]
+    specs = [
+        (_modes[0], [str(project / 'shaper.cube')], [str(project / 'gamut.cube')], ['builtin:srgb-eotf-inverse', 'builtin:gamma-1.1']),
+        (_modes[1], ['builtin:srgb-eotf'], [], []),
+    ]
+    assert _specs(jobs[0]) == specs
+    assert _specs(jobs[1]) == specs
+    assert _specs(jobs[2]) == [(_modes[1], [], [], [])]
+
+def test_entries_with_one_output_are_merged(project):
+    manifest = str(project / 'manifest.json')
+    _write_manifest(manifest, [
+        {'file': 'panels/qdcm_calib_data_a.json', 'modes': {_modes[0]: _stages[_modes[0]]}},
+        {'file': 'panels/qdcm_calib_data_a.json', 'modes': {_modes[1]: _stages[_modes[1]]}},
+    ])
+    jobs = batch.load_manifest(manifest)
+    assert len(jobs) == 1
+    assert [spec.name for spec in jobs[0].modes] == _modes
+
+@pytest.mark.parametrize('databases, message', [
+    ([{'file': 'panels/missing_*.json', 'modes': {}}], 'No database file matches'),
+    ([{'file': 'panels/qdcm_calib_data_a.json', 'modes': {_modes[0]: {'3dlut': 'gamut.cube', 'lut': 'x.cube'}}}], 'Unknown stage'),
+    ([{'file': 'panels/qdcm_calib_data_a.json', 'output': 'patched', 'modes': {}},
+      {'file': 'qdcm_calib_data_a.json', 'output': 'patched', 'modes': {}}], 'is the output of both'),
+])
+def test_load_manifest_errors(project, databases, message):
+    _write_db(project / 'qdcm_calib_data_a.json')
+    manifest = str(project / 'manifest.json')
+    _write_manifest(manifest, databases)
+    with pytest.raises(ValueError, match=message):
+        batch.load_manifest(manifest)
+
+_yaml_manifest = f"""databases:
+  - file: panels/qdcm_calib_data_*.json
+    output: patched
+    modes:
+      {_modes[0]}:
+        input-shaper: shaper.cube
+        3dlut: gamut.cube
+        output-shaper: [builtin:srgb-eotf-inverse, builtin:gamma-1.1]
+      {_modes[1]}:
+        input-shaper: builtin:srgb-eotf
+"""
+
+def test_load_yaml_manifest(project):
+    pytest.importorskip('yaml')
+    (project / 'manifest.yaml').write_text(_yaml_manifest)
+    _write_manifest(str(project / 'manifest.json'), [{'file': 'panels/qdcm_calib_data_*.json', 'output': 'patched', 'modes': _stages}])
+    jobs = batch.load_manifest(str(project / 'manifest.yaml'))
+    expected = batch.load_manifest(str(project / 'manifest.json'))
+    assert [(job.filename, job.output, _specs(job)) for job in jobs] == [(job.filename, job.output, _specs(job)) for job in expected]
+
+def test_yaml_manifest_without_pyyaml(project, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'yaml', None)
+    (project / 'manifest.yml').write_text(_yaml_manifest)
+    with pytest.raises(ValueError, match='PyYAML is required'):
+        batch.load_manifest(str(project / 'manifest.yml'))
+
+def test_run_writes_patched_outputs(project):
+    manifest = str(project / 'manifest.json')
+    _write_manifest(manifest, [{'file': 'panels/qdcm_calib_data_*.json', 'output': 'patched', 'modes': _stages}])
+    sources = {name: _read(project / 'panels' / name) for name in ('qdcm_calib_data_a.json', 'qdcm_calib_data_b.json')}
+    batch.run(batch.load_manifest(manifest))
+    pipelines = _expected_pipelines(project)
+    for name, source in sources.items():
+        # the sources are left alone
+        assert _read(project / 'panels' / name) == source
+        assert _read(project / 'patched' / name) == _patched(str(project / 'panels' / name), pipelines)
+    decoded = store.load(str(project / 'patched' / 'qdcm_calib_data_a.json')).get_mode(_modes[1]).get_color_pipeline()
+    x = np.linspace(0, 1, 33)
+    np.testing.assert_allclose(decoded.degamma.apply(np.stack([x] * 3, axis=-1))[:, 0], transfer.srgb_eotf(x), atol=1 / 1000)
+
+def test_run_in_place(project):
+    manifest = str(project / 'manifest.json')
+    _write_manifest(manifest, [{'file': 'panels/qdcm_calib_data_b.json', 'modes': {_modes[1]: _stages[_modes[1]]}}])
+    target = str(project / 'panels' / 'qdcm_calib_data_b.json')
+    expected = _patched(target, {_modes[1]: _expected_pipelines(project)[_modes[1]]})
+    batch.run(batch.load_manifest(manifest))
+    assert _read(target) == expected
+    assert not os.path.exists(project / 'patched')
+
+@pytest.fixture
+def shared_names(monkeypatch):
+    names = []
+    init = batch.SharedLut.__init__
+    def record(self, lut):
+        init(self, lut)
+        names.append(self.name)
+    monkeypatch.setattr(batch.SharedLut, '__init__', record)
+    return names
+
+def _assert_released(names):
+    from multiprocessing import shared_memory
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+def _shm_entries():
+    return set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+
+def test_parallel_run_matches_serial(project, shared_names):
+    outputs = {}
+    before = _shm_entries()
+    for num_jobs in (1, 2):
+        manifest = str(project / f'manifest{num_jobs}.json')
+        _write_manifest(manifest, [{'file': 'panels/qdcm_calib_data_*.json', 'output': f'patched{num_jobs}', 'modes': _stages}])
+        batch.run(batch.load_manifest(manifest), num_jobs=num_jobs)
+        outputs[num_jobs] = {name: _read(project / f'patched{num_jobs}' / name) for name in os.listdir(project / f'patched{num_jobs}')}
+    assert sorted(outputs[2]) == ['qdcm_calib_data_a.json', 'qdcm_calib_data_b.json']
+    assert outputs[2] == outputs[1]
+    # the shaper and the 3D LUT went through shared memory, the builtins did not
+    assert len(shared_names) == 2
+    _assert_released(shared_names)
+    assert _shm_entries() <= before
+
+def test_parallel_run_releases_shared_memory_on_error(project, shared_names):
+    manifest = str(project / 'manifest.json')
+    _write_manifest(manifest, [{'file': 'panels/qdcm_calib_data_*.json', 'output': 'patched',
+                                'modes': {_modes[0]: _stages[_modes[0]], 'no such mode': {'3dlut': 'gamut.cube'}}}])
+    with pytest.raises(KeyError):
+        batch.run(batch.load_manifest(manifest), num_jobs=2)
+    assert shared_names
+    _assert_released(shared_names)
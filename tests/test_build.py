@@ -0,0 +1,111 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+colour = pytest.importorskip('colour')
+
+from qdcmdiy import batch, build, store_json
+
+_modes = ['gamut 1 gamma 1 intent 0 Dynamic_range SDR', 'gamut 1 gamma 1 intent 1 Dynamic_range SDR']
+
+def _write_db(path, version='1'):
+    def mode(intent):
+        return {"Applicability": {"ColorPrimaries": "sRGB", "GammaTransfer": "sRGB", "RenderIntent": intent}, "DynamicRange": "SDR",
+                "PostBlendGC": store_json._linear_gc_payload(), "PostBlendIGC": store_json._linear_igc_payload()}
+    with open(path, 'w') as f:
+        json.dump({"Copyright": "", "Version": version, "panel": {"mode0": mode(0), "mode1": mode(1)}}, f, separators=(',', ':'))
+
+def _write_shaper(path, gamma):
+    colour.io.write_LUT(colour.LUT3x1D(colour.LUT3x1D.linear_table(64) ** gamma), path)
+
+def _write_manifest(path, modes, output=None):
+    entry = {'file': 'qdcm_calib_data_panel.json', 'modes': modes}
+    if output is not None:
+        entry['output'] = output
+    with open(path, 'w') as f:
+        json.dump({'databases': [entry]}, f)
+
+_stages = {_modes[0]: {'input-shaper': 'shaper.cube'}, _modes[1]: {'input-shaper': 'builtin:srgb-eotf'}}
+
+@pytest.fixture(params=['in-place', 'output'])
+def project(tmp_path, request):
+    _write_db(tmp_path / 'qdcm_calib_data_panel.json')
+    _write_shaper(str(tmp_path / 'shaper.cube'), 2.2)
+    output = None if request.param == 'in-place' else 'patched'
+    manifest = str(tmp_path / 'manifest.json')
+    _write_manifest(manifest, _stages, output)
+    target = tmp_path / ('qdcm_calib_data_panel.json' if output is None else 'patched/qdcm_calib_data_panel.json')
+    return {'dir': tmp_path, 'manifest': manifest, 'output': str(target), 'in_place': output is None, 'out_dir': output}
+
+def _plan(manifest, force=False):
+    state = build.BuildState(build.state_filename(manifest))
+    return build.plan(batch.load_manifest(manifest), state, force)
+
+def _planned(manifest, force=False):
+    return [(item.full, sorted(spec.name for spec in item.job.modes)) for item in _plan(manifest, force)]
+
+def test_first_build_is_full_then_up_to_date(project):
+    assert _planned(project['manifest']) == [(True, sorted(_modes))]
+    assert build.build(project['manifest'], quiet=True) == 1
+    assert _planned(project['manifest']) == []
+    assert build.build(project['manifest'], quiet=True) == 0
+
+def test_changed_stage_file_patches_only_its_mode(project):
+    build.build(project['manifest'], quiet=True)
+    _write_shaper(str(project['dir'] / 'shaper.cube'), 1.8)
+    assert _planned(project['manifest']) == [(False, [_modes[0]])]
+    build.build(project['manifest'], quiet=True)
+    assert _planned(project['manifest']) == []
+
+def test_force_rebuilds_everything(project):
+    build.build(project['manifest'], quiet=True)
+    assert _planned(project['manifest'], force=True) == [(True, sorted(_modes))]
+
+def test_edited_output_is_rebuilt(project):
+    build.build(project['manifest'], quiet=True)
+    with open(project['output'], 'rb') as f:
+        built = f.read()
+    with open(project['output'], 'ab') as f:
+        f.write(b' ')
+    assert _planned(project['manifest']) == [(True, sorted(_modes))]
+    build.build(project['manifest'], quiet=True)
+    with open(project['output'], 'rb') as f:
+        rebuilt = f.read()
+    assert rebuilt == built
+
+def test_changed_source_is_rebuilt(project):
+    if project['in_place']:
+        pytest.skip('an in-place file is its own source')
+    build.build(project['manifest'], quiet=True)
+    _write_db(project['dir'] / 'qdcm_calib_data_panel.json', version='2')
+    assert _planned(project['manifest']) == [(True, sorted(_modes))]
+    build.build(project['manifest'], quiet=True)
+    with open(project['output']) as f:
+        assert json.load(f)['Version'] == '2'
+
+def test_added_mode_is_patched_alone(project):
+    _write_manifest(project['manifest'], {_modes[0]: _stages[_modes[0]]}, project['out_dir'])
+    build.build(project['manifest'], quiet=True)
+    _write_manifest(project['manifest'], _stages, project['out_dir'])
+    assert _planned(project['manifest']) == [(False, [_modes[1]])]
+
+def test_dropped_mode(project, capsys):
+    build.build(project['manifest'], quiet=True)
+    _write_manifest(project['manifest'], {_modes[0]: _stages[_modes[0]]}, project['out_dir'])
+    capsys.readouterr()
+    if project['in_place']:
+        # nothing to rebuild, but the mode is no longer tracked and the user is told
+        assert build.build(project['manifest'], quiet=True) == 0
+        assert 'no longer in the manifest' in capsys.readouterr().err
+        state = build.BuildState(build.state_filename(project['manifest']))
+        assert list(state.outputs[project['output']]['modes']) == [_modes[0]]
+        build.build(project['manifest'], quiet=True)
+        assert capsys.readouterr().err == ''
+    else:
+        # the output is rebuilt from the source without the dropped mode
+        assert _planned(project['manifest']) == [(True, [_modes[0]])]
+        build.build(project['manifest'], quiet=True)
+        state = build.BuildState(build.state_filename(project['manifest']))
+        assert list(state.outputs[project['output']]['modes']) == [_modes[0]]
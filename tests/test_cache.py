@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+import qdcmdiy
+from qdcmdiy import cache, data
+
+@pytest.fixture
+def payload_cache(tmp_path):
+    return cache.PayloadCache(str(tmp_path / 'cache'), max_bytes=250)
+
+def _sizes(payload_cache):
+    return sorted(size for _, _, size in payload_cache._entries())
+
+def test_hit_and_miss_counts(payload_cache):
+    key = payload_cache.make_key('converter', 'digest')
+    assert payload_cache.get(key) is None
+    payload_cache.put(key, 'payload')
+    assert payload_cache.get(key) == 'payload'
+    assert payload_cache.get(key) == 'payload'
+    assert (payload_cache.hits, payload_cache.misses) == (2, 1)
+    assert payload_cache.stats() == 'cache: 2 hit(s), 1 miss(es)'
+
+def test_key(monkeypatch):
+    key = cache.PayloadCache.make_key('store_json._gc_payload', 'abc')
+    assert key == cache.PayloadCache.make_key('store_json._gc_payload', 'abc')
+    assert key != cache.PayloadCache.make_key('store_json._igc_payload', 'abc')
+    assert key != cache.PayloadCache.make_key('store_json._gc_payload', 'abd')
+    monkeypatch.setattr(cache, 'payload_format_version', cache.payload_format_version + 1)
+    assert key != cache.PayloadCache.make_key('store_json._gc_payload', 'abc')
+    monkeypatch.undo()
+    monkeypatch.setattr(qdcmdiy, '__version__', qdcmdiy.__version__ + '.post1')
+    assert key != cache.PayloadCache.make_key('store_json._gc_payload', 'abc')
+
+def test_memoized_converter_uses_cache(tmp_path, monkeypatch):
+    colour = pytest.importorskip('colour')
+    from qdcmdiy import store_json
+    lut = colour.LUT3x1D(colour.LUT3x1D.linear_table(1024) ** 2.2)
+    payload_cache = cache.enable(str(tmp_path / 'cache'))
+    try:
+        def convert():
+            # only the on-disk cache remembers between runs
+            data._payload_memo.clear()
+            return store_json._gc_payload(lut)
+        payload = convert()
+        assert (payload_cache.hits, payload_cache.misses) == (0, 1)
+        assert convert() == payload
+        assert (payload_cache.hits, payload_cache.misses) == (1, 1)
+        # another converter of the same LUT is another entry
+        store_json._igc_payload(lut)
+        assert (payload_cache.hits, payload_cache.misses) == (1, 2)
+        # entries of an older payload format are not served
+        monkeypatch.setattr(cache, 'payload_format_version', cache.payload_format_version + 1)
+        assert convert() == payload
+        assert (payload_cache.hits, payload_cache.misses) == (1, 3)
+    finally:
+        cache.disable()
+        data._payload_memo.clear()
+
+def test_lru_eviction(payload_cache):
+    keys = [payload_cache.make_key('converter', str(i)) for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        payload_cache.put(key, 'x' * 100)
+        os.utime(payload_cache._path(key), (1000 + i, 1000 + i))
+    # reading the older entry makes it the most recently used
+    assert payload_cache.get(keys[0]) is not None
+    payload_cache.put(keys[2], 'y' * 100)
+    assert payload_cache.get(keys[1]) is None
+    assert payload_cache.get(keys[0]) == 'x' * 100
+    assert payload_cache.get(keys[2]) == 'y' * 100
+    assert _sizes(payload_cache) == [100, 100]
+
+def test_overwrite_counts_bytes_once(payload_cache, monkeypatch):
+    evictions = []
+    evict = payload_cache.evict
+    monkeypatch.setattr(payload_cache, 'evict', lambda: evictions.append(1) or evict())
+    a, b = payload_cache.make_key('converter', 'a'), payload_cache.make_key('converter', 'b')
+    payload_cache.put(a, 'x' * 100)
+    for size in (100, 120, 100, 80, 100):
+        payload_cache.put(b, 'y' * size)
+    assert payload_cache._total_bytes == sum(_sizes(payload_cache)) == 200
+    assert not evictions
+    assert payload_cache.get(a) == 'x' * 100
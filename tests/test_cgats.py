@@ -0,0 +1,121 @@
+import io
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from qdcmdiy import cgats, data
+from helpers import make_cal, make_ti3
+
+def _table(rows, fields='SAMPLE_ID RGB_R RGB_G RGB_B'):
+    header = f'CTI3\n\nORIGINATOR "test"\nNUMBER_OF_FIELDS {len(fields.split())}\nBEGIN_DATA_FORMAT\n{fields}\nEND_DATA_FORMAT\n\nNUMBER_OF_SETS {len(rows)}\nBEGIN_DATA\n'
+    return (header + '\n'.join(rows) + '\nEND_DATA\n').encode()
+
+_mixed = _table(['1 0 0.5 1', '2 1 1 0.25', '3 0.75 0 1'])
+
+# inputs the bulk parser reads itself, and ones it must hand to the tokenizer
+bulk_inputs = {
+    'ti3': make_ti3(50),
+    'ti3_crlf': make_ti3(50, newline='\r\n'),
+    'cal': make_cal(),
+    'cal_crlf': make_cal(newline='\r\n'),
+    'mixed_int_float': _mixed,
+    'mixed_int_float_crlf': _mixed.replace(b'\n', b'\r\n'),
+    'trailing_comment_on_markers': _mixed.replace(b'BEGIN_DATA\n', b'BEGIN_DATA # rows\n').replace(b'END_DATA\n', b'END_DATA\t# end\n'),
+}
+
+fallback_inputs = {
+    'quoted_field': _table(['1 "A1" 0.5 1', '2 "A2" 1 0.25'], 'SAMPLE_ID SAMPLE_LOC RGB_G RGB_B'),
+    'comment': _table(['1 0 0.5 1 # first patch', '2 1 1 0.25']),
+    'comment_line': _table(['1 0 0.5 1', '# between rows', '2 1 1 0.25']),
+    'non_numeric': _table(['1 A1 0.5 1', '2 A2 1 0.25'], 'SAMPLE_ID SAMPLE_LOC RGB_G RGB_B'),
+}
+
+@pytest.fixture
+def tokenizer_calls(monkeypatch):
+    calls = []
+    read_with_tokenizer = cgats._read_with_tokenizer
+    def record(f):
+        calls.append(f)
+        return read_with_tokenizer(f)
+    monkeypatch.setattr(cgats, '_read_with_tokenizer', record)
+    return calls
+
+def _read(content, parser):
+    return cgats.read(io.BytesIO(content), parser=parser)
+
+def _assert_same_table(table, expected):
+    assert table.signature == expected.signature
+    assert table.metadata == expected.metadata
+    assert table.dataframe.index.name == expected.dataframe.index.name
+    assert list(table.dataframe.columns) == list(expected.dataframe.columns)
+    pd.testing.assert_frame_equal(table.dataframe, expected.dataframe, check_exact=True)
+
+@pytest.mark.parametrize('name', sorted(bulk_inputs))
+def test_bulk_matches_tokenizer(name, tokenizer_calls):
+    expected = _read(bulk_inputs[name], 'tokenizer')
+    tokenizer_calls.clear()
+    table = _read(bulk_inputs[name], 'bulk')
+    assert not tokenizer_calls
+    _assert_same_table(table, expected)
+
+def test_bulk_dtypes():
+    df = _read(_mixed, 'bulk').dataframe
+    assert df.index.dtype == np.int64
+    assert list(df.dtypes) == [np.float64, np.float64, np.float64]
+    assert _read(make_ti3(5), 'bulk').dataframe.index.dtype == np.int64
+
+@pytest.mark.parametrize('name', sorted(fallback_inputs))
+def test_bulk_falls_back_to_tokenizer(name, tokenizer_calls):
+    expected = _read(fallback_inputs[name], 'tokenizer')
+    tokenizer_calls.clear()
+    table = _read(fallback_inputs[name], 'bulk')
+    assert len(tokenizer_calls) == 1
+    _assert_same_table(table, expected)
+
+@pytest.mark.parametrize('parser', ['bulk', 'tokenizer'])
+def test_missing_data_block(parser):
+    with pytest.raises(ValueError):
+        _read(b'CTI3\n\nORIGINATOR "test"\n', parser)
+
+def test_unknown_parser():
+    with pytest.raises(ValueError):
+        _read(_mixed, 'fast')
+
+def _write(tmp_path, content, name='table.ti3'):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+@pytest.mark.parametrize('name', sorted(bulk_inputs) + ['quoted_field', 'comment'])
+def test_mapped_matches_read(tmp_path, monkeypatch, name):
+    # small chunks, so columns are decoded in several pieces
+    monkeypatch.setattr(cgats.MappedCGATSTable, 'decode_chunk_rows', 7)
+    content = bulk_inputs.get(name) or fallback_inputs[name]
+    expected = _read(content, 'tokenizer')
+    with cgats.read_mapped(_write(tmp_path, content)) as table:
+        assert len(table) == len(expected.dataframe)
+        names = list(expected.dataframe.columns)
+        columns = table.get_columns(names)
+        expected_columns = expected.get_columns(names)
+        assert columns.dtype == expected_columns.dtype
+        np.testing.assert_array_equal(columns, expected_columns)
+        np.testing.assert_array_equal(table.get_column(table.fields[0]), np.asarray(expected.dataframe.index))
+        _assert_same_table(table, expected)
+
+def test_mapped_rejects_ragged_data(tmp_path):
+    with pytest.raises(ValueError):
+        cgats.read_mapped(_write(tmp_path, _table(['1 0 0.5 1', '2 1 1'])))
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_load_argyll_cal(tmp_path, newline):
+    colour = pytest.importorskip('colour')
+    content = make_cal(newline=newline)
+    lut = data.load_argyll_cal(_write(tmp_path, content, 'test.cal'))
+    # as read before the mapped table, through the tokenizer and the dataframe
+    expected = colour.LUT3x1D(np.asarray(_read(content, 'tokenizer').dataframe[['RGB_R', 'RGB_G', 'RGB_B']]))
+    assert isinstance(lut, colour.LUT3x1D)
+    assert lut.table.dtype == expected.table.dtype
+    np.testing.assert_array_equal(lut.table, expected.table)
+    np.testing.assert_array_equal(lut.domain, expected.domain)
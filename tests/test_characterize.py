@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+colour = pytest.importorskip('colour')
+pytest.importorskip('scipy')
+
+from qdcmdiy import characterize
+
+# a display with Display P3 primaries, D65 white and a pure 2.2 gamma, so an
+# sRGB source is inside its gamut and the inverse is known in closed form
+_display = colour.RGB_COLOURSPACES['Display P3'].matrix_RGB_to_XYZ
+_srgb = colour.RGB_COLOURSPACES['sRGB'].matrix_RGB_to_XYZ
+
+def _analytic_inverse(rgb):
+    return np.clip(rgb @ (np.linalg.inv(_display) @ _srgb).T, 0, 1) ** (1 / 2.2)
+
+def _write_ti3(path, rgb, xyz, fields='SAMPLE_ID RGB_R RGB_G RGB_B XYZ_X XYZ_Y XYZ_Z'):
+    lines = ['CTI3', '', 'DESCRIPTOR "Argyll Calibration Target chart information 3"', 'ORIGINATOR "Argyll dispread"',
+             'DEVICE_CLASS "DISPLAY"', 'COLOR_REP "RGB_XYZ"', '',
+             f'NUMBER_OF_FIELDS {len(fields.split())}', 'BEGIN_DATA_FORMAT', fields, 'END_DATA_FORMAT', '',
+             f'NUMBER_OF_SETS {len(rgb)}', 'BEGIN_DATA']
+    lines += ['%d %.4f %.4f %.4f %.6f %.6f %.6f' % (i + 1, *rgb[i] * 100, *xyz[i]) for i in range(len(rgb))]
+    lines += ['END_DATA', '']
+    path.write_text('\n'.join(lines))
+    return str(path)
+
+@pytest.fixture(scope='module')
+def ti3(tmp_path_factory):
+    # an 11x11x11 patch set measured on the model display, in cd/m^2 with a 100 cd/m^2 white
+    rgb = colour.LUT3D.linear_table(11).reshape((-1, 3))
+    xyz = rgb ** 2.2 @ _display.T * 100
+    return _write_ti3(tmp_path_factory.mktemp('ti3') / 'display.ti3', rgb, xyz)
+
+def test_read_ti3(ti3):
+    rgb, xyz = characterize.read_ti3(ti3)
+    assert rgb.shape == xyz.shape == (11 ** 3, 3)
+    np.testing.assert_allclose(rgb, colour.LUT3D.linear_table(11).reshape((-1, 3)), atol=1e-9)
+    np.testing.assert_allclose(xyz, rgb ** 2.2 @ _display.T * 100, atol=1e-6)
+
+def test_inverse_lut_matches_analytic_inverse(ti3):
+    model = characterize.InverseModel.from_ti3(ti3, source='sRGB')
+    np.testing.assert_allclose(model.white_xy, colour.CCS_ILLUMINANTS['CIE 1931 2 Degree Standard Observer']['D65'], atol=1e-4)
+    lut = model.sample_3d(17)
+    expected = _analytic_inverse(colour.LUT3D.linear_table(17))
+    error = np.abs(lut.table - expected)
+    # local linear fits over 0.1 steps cannot follow x^(1/2.2) where a channel
+    # is close to 0: within 0.03 of full scale there, within 0.005 on average
+    assert error.max() < 0.03
+    assert error.mean() < 0.005
+    # white and black are measured patches
+    np.testing.assert_allclose(lut.table[-1, -1, -1], 1, atol=1e-4)
+    np.testing.assert_allclose(lut.table[0, 0, 0], 0, atol=2e-3)
+    # what the display shows with the inverted values, relative to white
+    shown = lut.table ** 2.2 @ _display.T
+    np.testing.assert_allclose(shown, colour.LUT3D.linear_table(17) @ _srgb.T, atol=0.01)
+
+def test_inverse_of_source_display_is_identity_on_grey():
+    # a measured sRGB display only needs its 2.2 gamma undone
+    rgb = colour.LUT3D.linear_table(9).reshape((-1, 3))
+    model = characterize.InverseModel(rgb, rgb ** 2.2 @ _srgb.T * 100, source='sRGB')
+    grey = np.linspace(0.1, 1, 10)[:, np.newaxis] * np.ones(3)
+    np.testing.assert_allclose(model.apply(grey), grey ** (1 / 2.2), atol=0.01)
+
+def test_digest(ti3):
+    model = characterize.InverseModel.from_ti3(ti3)
+    assert model.digest() == characterize.InverseModel.from_ti3(ti3).digest()
+    assert model.digest() != characterize.InverseModel.from_ti3(ti3, source='Display P3').digest()
+    assert model.digest() != characterize.InverseModel.from_ti3(ti3, neighbours=20).digest()
+
+def test_read_ti3_requires_rgb_and_xyz(tmp_path):
+    rgb = np.zeros((3, 3))
+    path = _write_ti3(tmp_path / 'lab.ti3', rgb, rgb, fields='SAMPLE_ID RGB_R RGB_G RGB_B LAB_L LAB_A LAB_B')
+    with pytest.raises(ValueError, match='must have RGB_R/G/B and XYZ_X/Y/Z fields'):
+        characterize.read_ti3(path)
+
+def test_inverse_model_arguments():
+    rgb = colour.LUT3D.linear_table(3).reshape((-1, 3))
+    with pytest.raises(ValueError, match='Unknown colourspace'):
+        characterize.InverseModel(rgb, rgb, source='nope')
+    with pytest.raises(ValueError, match='need at least 16 measurements, got 8'):
+        characterize.InverseModel(rgb[:8], rgb[:8])
@@ -0,0 +1,164 @@
+import os
+import sys
+import asyncio
+import hashlib
+import subprocess
+
+import pytest
+
+from qdcmdiy import api, deploy
+from test_api import _json_db, _mode
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_stock_path = '/vendor/etc/display/qdcm_calib_data_test_panel.json'
+
+class FakeTransport:
+    # fails the first pull_failures pulls of each device with the given exception
+    def __init__(self, pull_failures=0, failure=OSError, digest=None, latency=0):
+        self.pull_failures = pull_failures
+        self.failure = failure
+        self.digest = digest
+        self.latency = latency
+        self.pulls = {}
+        self.pushed = {}
+        self.active = 0
+        self.max_active = 0
+
+    async def devices(self):
+        return ['dev0']
+
+    async def shell(self, serial, command):
+        if 'qcom,mdss-dsi-panel-name' in command:
+            return b'test_panel\0'
+        if 'for f in' in command:
+            return _stock_path.encode() + b'\n'
+        if 'sha256sum' in command:
+            digest = self.digest or hashlib.sha256(self.pushed[serial]).hexdigest()
+            return f'{digest}  /data/adb/modules/qdcm-diy/system{_stock_path}\n'.encode()
+        raise AssertionError(command)
+
+    async def pull(self, serial, remote):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            self.pulls[serial] = self.pulls.get(serial, 0) + 1
+            if self.pulls[serial] <= self.pull_failures:
+                raise self.failure(f'pull {self.pulls[serial]} failed')
+            return _json_db()
+        finally:
+            self.active -= 1
+
+    async def push(self, serial, data, remote):
+        self.pushed[serial] = data
+
+    async def reboot(self, serial):
+        pass
+
+@pytest.fixture(scope='module')
+def session():
+    pytest.importorskip('colour')
+    session = api.Session()
+    return session, session.pipeline(input_shaper='builtin:srgb-eotf')
+
+def _deployer(session, transport, mode=_mode, **kwargs):
+    return deploy.Deployer(transport, session[0], mode, session[1], **kwargs)
+
+def test_deploy(session):
+    transport = FakeTransport()
+    result = asyncio.run(_deployer(session, transport).deploy('dev0'))
+    assert result.error is None
+    assert result.panel == 'test_panel'
+    assert result.remote_path == '/data/adb/modules/qdcm-diy/system' + _stock_path
+    assert transport.pushed['dev0'] == session[0].patch_bytes(_json_db(), _mode, session[1])
+
+@pytest.mark.parametrize('failure', [OSError, TimeoutError])
+def test_retry_backoff(session, monkeypatch, failure):
+    delays = []
+    sleep = asyncio.sleep
+    async def record_sleep(seconds, *args):
+        delays.append(seconds)
+        await sleep(0)
+    monkeypatch.setattr(deploy.asyncio, 'sleep', record_sleep)
+    transport = FakeTransport(pull_failures=2, failure=failure)
+    result = asyncio.run(_deployer(session, transport, retries=2, backoff=0.5).deploy('dev0'))
+    assert result.error is None
+    assert result.retries == 2
+    assert transport.pulls['dev0'] == 3
+    assert delays == [0.5, 1.0]
+
+def test_retries_exhausted(session):
+    transport = FakeTransport(pull_failures=3, failure=TimeoutError)
+    result = asyncio.run(_deployer(session, transport, retries=1, backoff=0).deploy('dev0'))
+    assert result.retries == 1
+    assert transport.pulls['dev0'] == 2
+    assert result.error == 'TimeoutError: pull 2 failed'
+
+def test_adb_timeout():
+    transport = deploy.AdbTransport(f'"{sys.executable}" -c "import time; time.sleep(10)"', timeout=0.2)
+    with pytest.raises(TimeoutError, match='timed out'):
+        asyncio.run(transport.devices())
+
+@pytest.mark.parametrize('num_jobs', [1, 3])
+def test_jobs_bound(session, num_jobs):
+    transport = FakeTransport(latency=0.05)
+    results = asyncio.run(_deployer(session, transport).run([f'dev{i}' for i in range(8)], num_jobs))
+    assert all(result.error is None for result in results)
+    assert transport.max_active == num_jobs
+
+def test_sha256_mismatch(session):
+    transport = FakeTransport(digest='0' * 64)
+    result = asyncio.run(_deployer(session, transport, retries=0).deploy('dev0'))
+    assert 'does not match the patched file after install' in result.error
+
+def test_unknown_mode(session):
+    result = asyncio.run(_deployer(session, FakeTransport(), mode='nope').deploy('dev0'))
+    assert result.error == "unknown mode 'nope'"
+
+def test_other_key_error_is_not_unknown_mode(session, monkeypatch):
+    def patch_bytes(*args):
+        raise KeyError('PostBlendGC')
+    monkeypatch.setattr(session[0], 'patch_bytes', patch_bytes)
+    result = asyncio.run(_deployer(session, FakeTransport()).deploy('dev0'))
+    assert result.error == "KeyError: 'PostBlendGC'"
+
+def test_exit_status(tmp_path):
+    pytest.importorskip('colour')
+    from fake_adb import make_device
+    database = tmp_path / 'stock.json'
+    database.write_bytes(_json_db())
+    root = tmp_path / 'devices'
+    make_device(str(root), 'dev0', 'Test Panel', str(database))
+    make_device(str(root), 'dev1', 'Test Panel', str(database))
+    command = [sys.executable, '-m', 'qdcmdiy', 'deploy', '--mode', _mode, '--input-shaper', 'builtin:srgb-eotf',
+               '--adb', f'"{sys.executable}" "{os.path.join(_root, "tests", "fake_adb.py")}"']
+    env = dict(os.environ, FAKE_ADB_ROOT=str(root), FAKE_ADB_FLAKY='dev0')
+
+    proc = subprocess.run(command, cwd=_root, env=env, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    assert 'deployed to 2 of 2 device(s)' in proc.stdout
+    assert 'dev0: push failed, retrying' in proc.stderr
+
+    # the marker of the flaked push is no device, and a device without a stock file fails the run
+    os.remove(root / 'dev1' / 'vendor/etc/display/qdcm_calib_data_Test_Panel.json')
+    proc = subprocess.run(command, cwd=_root, env=env, capture_output=True, text=True)
+    assert proc.returncode == 1
+    assert 'deployed to 1 of 2 device(s)' in proc.stdout
+    assert 'dev1: failed' in proc.stdout and 'no calibration file for panel Test_Panel' in proc.stdout
+
+def test_no_devices(tmp_path):
+    (tmp_path / 'devices').mkdir()
+    command = [sys.executable, '-m', 'qdcmdiy', 'deploy', '--mode', _mode,
+               '--adb', f'"{sys.executable}" "{os.path.join(_root, "tests", "fake_adb.py")}"']
+    proc = subprocess.run(command, cwd=_root, env=dict(os.environ, FAKE_ADB_ROOT=str(tmp_path / 'devices')), capture_output=True, text=True)
+    assert proc.returncode == 1
+    assert proc.stderr == 'no devices connected\n'
+    assert proc.stdout == ''
+
+def test_no_devices_error():
+    class NoDevices(FakeTransport):
+        async def devices(self):
+            return []
+    with pytest.raises(deploy.NoDevicesError, match='no devices connected'):
+        deploy.deploy(_mode, transport=NoDevices())
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from qdcmdiy import store_json
+from helpers import legacy_decode_str, legacy_encode
+
+_sizes = [0, 1, 2, 3, 4, 5, 255, 256, 4097, 12344, 12345]
+
+@pytest.mark.parametrize('size', _sizes)
+def test_round_trip(size):
+    rng = np.random.default_rng(size)
+    for _ in range(5):
+        payload = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+        encoded = store_json.encode(payload)
+        assert len(encoded) == 2 * size
+        assert store_json.decode_str(encoded) == payload
+
+@pytest.mark.parametrize('size', _sizes)
+def test_matches_legacy(size):
+    rng = np.random.default_rng(1000 + size)
+    for _ in range(5):
+        payload = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+        encoded = store_json.encode(payload)
+        assert encoded == legacy_encode(payload)
+        assert store_json.decode_str(encoded) == legacy_decode_str(encoded)
+
+def test_decode_lowercase():
+    encoded = store_json.encode(b'\x01\xab\xcd')
+    assert encoded == '01CDAB'
+    assert store_json.decode_str(encoded.lower()) == b'\x01\xab\xcd'
+
+def test_nested_json_round_trip():
+    jdoc = {"enable": True, "lutR": list(range(17)), "name": "x"}
+    assert store_json.decode_nested_json(store_json.encode_nested_json(jdoc)) == jdoc
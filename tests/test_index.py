@@ -0,0 +1,166 @@
+import os
+import json
+import hashlib
+
+import pytest
+
+from qdcmdiy import index, store_json
+
+def _payload(**fields):
+    return store_json.encode_nested_json({"displayID": 0, **fields, "lutR": list(range(200))})
+
+_gc_on = _payload(bitsRounding=10, enable=True)
+_igc_off = _payload(ditherEnable=True, enable=False)
+_sha = lambda text: hashlib.sha256(text.encode()).hexdigest()
+
+def _json_db(gc=_gc_on):
+    srgb = {"Applicability": {"ColorPrimaries": "sRGB", "GammaTransfer": "sRGB", "RenderIntent": 0}, "DynamicRange": "SDR",
+            "PostBlendGC": gc, "PostBlendIGC": _igc_off, "Label": "short strings are not payloads"}
+    # a mode patch --mode cannot address
+    custom = {"Applicability": {"ColorPrimaries": "Custom"}, "PostBlendGC": gc}
+    return json.dumps({"Copyright": "", "Version": "1", "panel_a": {"mode0": srgb, "mode1": custom, "count": 2}})
+
+def _xml_db(payload='00ff10ef'):
+    return ('<?xml version="1.0" encoding="utf-8"?>\r\n<Calib_Data><Disp_Type Name="panel_x"/>\r\n'
+            f'<Mode Name="native" ModeID="0"><Feature FeatureType="3" DataSize="4">{payload}</Feature>'
+            '<Feature FeatureType="8" Disable="true" DataSize="2">abcd</Feature></Mode>\r\n'
+            # the same name again, both must be listed
+            '<Mode Name="native" ModeID="1"><Feature FeatureType="3" DataSize="2">1234</Feature></Mode>\r\n'
+            '<Mode Name="srgb" ModeID="2"/></Calib_Data>\r\n')
+
+def _rows(conn, path):
+    return sorted(conn.execute('SELECT panel, mode_key, mode, feature, enabled, size, hash FROM inventory WHERE path = ?', (path,)),
+                  key=lambda row: tuple('' if value is None else str(value) for value in row))
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(text.encode())
+    return str(path)
+
+@pytest.fixture
+def fleet(tmp_path):
+    return {
+        'json': _write(tmp_path / 'fleet' / 'a' / 'qdcm_calib_data_a.json', _json_db()),
+        'xml': _write(tmp_path / 'fleet' / 'b' / 'qdcm_calib_data_b.xml', _xml_db()),
+    }
+
+@pytest.fixture
+def scans(monkeypatch):
+    calls = []
+    scan_file = index.scan_file
+    def record(path):
+        calls.append(path)
+        return scan_file(path)
+    monkeypatch.setattr(index, 'scan_file', record)
+    return calls
+
+def _update(conn, tmp_path, capsys):
+    index.update(conn, [str(tmp_path / 'fleet')], num_jobs=1)
+    return capsys.readouterr().out.split(' in ')[0]
+
+def test_json_rows(tmp_path, fleet, capsys):
+    conn = index.connect(str(tmp_path / 'index.sqlite'))
+    _update(conn, tmp_path, capsys)
+    assert conn.execute('SELECT format, panel, size, error FROM files WHERE path = ?', (fleet['json'],)).fetchall() == [
+        ('json', 'panel_a', os.path.getsize(fleet['json']), None)]
+    assert _rows(conn, fleet['json']) == [
+        ('panel_a', 'mode0', 'gamut 1 gamma 1 intent 0 Dynamic_range SDR', 'PostBlendGC', 1, len(_gc_on) // 2, _sha(_gc_on)),
+        ('panel_a', 'mode0', 'gamut 1 gamma 1 intent 0 Dynamic_range SDR', 'PostBlendIGC', 0, len(_igc_off) // 2, _sha(_igc_off)),
+        ('panel_a', 'mode1', None, 'PostBlendGC', 1, len(_gc_on) // 2, _sha(_gc_on)),
+    ]
+
+def test_xml_rows(tmp_path, fleet, capsys):
+    conn = index.connect(str(tmp_path / 'index.sqlite'))
+    _update(conn, tmp_path, capsys)
+    assert _rows(conn, fleet['xml']) == [
+        ('panel_x', '0', 'native', '3', 1, 4, _sha('00ff10ef')),
+        ('panel_x', '0', 'native', '8', 0, 2, _sha('abcd')),
+        ('panel_x', '1', 'native', '3', 1, 2, _sha('1234')),
+    ]
+    # modes without features are still listed
+    assert conn.execute('SELECT key, name FROM modes JOIN files ON files.id = modes.file_id WHERE path = ? ORDER BY key', (fleet['xml'],)).fetchall() == [
+        ('0', 'native'), ('1', 'native'), ('2', 'srgb')]
+
+def test_broken_file_is_recorded(tmp_path, capsys):
+    path = _write(tmp_path / 'fleet' / 'qdcm_calib_data_bad.json', '{"Copyright": "", "Version": "1"}')
+    conn = index.connect(str(tmp_path / 'index.sqlite'))
+    _update(conn, tmp_path, capsys)
+    (error,), = conn.execute('SELECT error FROM files WHERE path = ?', (path,)).fetchall()
+    assert error == 'ValueError: No panel object in JSON database'
+    assert _rows(conn, path) == []
+
+def test_incremental_update(tmp_path, fleet, scans, capsys):
+    conn = index.connect(str(tmp_path / 'index.sqlite'))
+    assert _update(conn, tmp_path, capsys) == 'indexed 2 file(s), 0 unchanged, 0 removed'
+    assert sorted(scans) == sorted(fleet.values())
+
+    # unchanged size and mtime are not read again
+    scans.clear()
+    assert _update(conn, tmp_path, capsys) == 'indexed 0 file(s), 2 unchanged, 0 removed'
+    assert scans == []
+
+    # same size, new mtime and content
+    st = os.stat(fleet['xml'])
+    _write(tmp_path / 'fleet' / 'b' / 'qdcm_calib_data_b.xml', _xml_db('ffffffff'))
+    os.utime(fleet['xml'], ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert _update(conn, tmp_path, capsys) == 'indexed 1 file(s), 1 unchanged, 0 removed'
+    assert scans == [fleet['xml']]
+    assert _rows(conn, fleet['xml'])[0][-1] == _sha('ffffffff')
+
+    # a different size is enough, whatever the mtime
+    scans.clear()
+    st = os.stat(fleet['json'])
+    _write(tmp_path / 'fleet' / 'a' / 'qdcm_calib_data_a.json', _json_db(gc=_payload(enable=False)))
+    os.utime(fleet['json'], ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert _update(conn, tmp_path, capsys) == 'indexed 1 file(s), 1 unchanged, 0 removed'
+    assert scans == [fleet['json']]
+    assert {row[4] for row in _rows(conn, fleet['json'])} == {0}
+
+    # deleted files go with their modes and features
+    scans.clear()
+    os.unlink(fleet['json'])
+    assert _update(conn, tmp_path, capsys) == 'indexed 0 file(s), 1 unchanged, 1 removed'
+    assert scans == []
+    assert conn.execute('SELECT path FROM files').fetchall() == [(fleet['xml'],)]
+    assert conn.execute('SELECT COUNT(*) FROM modes').fetchone() == (3,)
+    assert conn.execute('SELECT COUNT(*) FROM features').fetchone() == (3,)
+
+def test_update_keeps_files_outside_roots(tmp_path, fleet, capsys):
+    conn = index.connect(str(tmp_path / 'index.sqlite'))
+    _update(conn, tmp_path, capsys)
+    index.update(conn, [str(tmp_path / 'fleet' / 'b')], num_jobs=1)
+    assert capsys.readouterr().out.startswith('indexed 0 file(s), 1 unchanged, 0 removed')
+    assert len(conn.execute('SELECT path FROM files').fetchall()) == 2
+
+def test_parallel_update_matches_serial(tmp_path, fleet, capsys):
+    serial = index.connect(str(tmp_path / 'serial.sqlite'))
+    _update(serial, tmp_path, capsys)
+    parallel = index.connect(str(tmp_path / 'parallel.sqlite'))
+    index.update(parallel, [str(tmp_path / 'fleet')], num_jobs=2)
+    for path in fleet.values():
+        assert _rows(parallel, path) == _rows(serial, path)
+
+def _span(payload):
+    text = json.dumps({"Copyright": "", "Version": "1", "panel": {"mode": {"Feature": payload}}})
+    return text, store_json.scan_header(text)["panel"]["mode"]["Feature"]
+
+@pytest.mark.parametrize('fields, expected', [
+    ({"enable": True}, True),
+    ({"enable": False}, False),
+    # an odd byte count leaves the first byte unswapped
+    ({"ab": 1, "enable": True}, True),
+    # past the decoded prefix
+    ({"lutB": list(range(200)), "enable": True}, True),
+    ({"lutB": list(range(200)), "enable": False}, False),
+    ({"ditherEnable": True}, None),
+    ({"lutB": list(range(200))}, None),
+])
+def test_payload_enabled(fields, expected):
+    payload = store_json.encode_nested_json({**fields, "pad": "x" * 200})
+    text, span = _span(payload)
+    assert store_json.payload_enabled(text, span) is expected
+
+def test_payload_enabled_matches_decoding():
+    for payload in [store_json._linear_gc_payload(), store_json._linear_igc_payload(), _gc_on, _igc_off]:
+        text, span = _span(payload)
+        assert store_json.payload_enabled(text, span) is store_json.decode_nested_json(payload)["enable"]
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+colour = pytest.importorskip('colour')
+from colour.algebra.interpolation import table_interpolation_tetrahedral, table_interpolation_trilinear
+
+from qdcmdiy import interp
+
+_references = {'tetrahedral': table_interpolation_tetrahedral, 'trilinear': table_interpolation_trilinear}
+_tolerances = {np.float64: 1e-12, np.float32: 1e-5}
+
+def _lut3d(size):
+    rng = np.random.default_rng(size)
+    return colour.LUT3D(np.clip(colour.LUT3D.linear_table(size) ** 0.8 + rng.normal(0, 0.01, (size, size, size, 3)), 0, 1))
+
+def _inputs(n, low=-0.25, high=1.25):
+    # includes values outside [0, 1] and the exact grid ends
+    rng = np.random.default_rng(n)
+    rgb = rng.uniform(low, high, (n, 3))
+    rgb[:4] = [[0, 0, 0], [1, 1, 1], [1, 0, 0.5], [-1, 2, 1]]
+    return rgb
+
+@pytest.mark.parametrize('method', sorted(_references))
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+@pytest.mark.parametrize('size', [2, 17, 33])
+def test_apply_lut3d_matches_colour(method, dtype, size):
+    lut = _lut3d(size)
+    rgb = _inputs(5000)
+    expected = lut.apply(rgb, interpolator=_references[method])
+    actual = interp.apply_lut3d(lut.table, rgb, method, dtype=dtype)
+    assert actual.dtype == dtype
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=_tolerances[dtype])
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+@pytest.mark.parametrize('size', [2, 257, 1024])
+def test_apply_lut3x1d_matches_colour(dtype, size):
+    lut = colour.LUT3x1D(colour.LUT3x1D.linear_table(size) ** np.array([1.7, 1.0, 0.45]))
+    rgb = _inputs(5000)
+    expected = lut.apply(rgb)
+    actual = interp.apply_lut3x1d(lut.table, rgb, dtype=dtype)
+    assert actual.dtype == dtype
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=_tolerances[dtype] * 10)
+
+@pytest.mark.parametrize('method', sorted(_references))
+def test_apply_lut3d_chunk_boundary(method):
+    lut = _lut3d(17)
+    rgb = _inputs(2500).reshape((50, 50, 3))
+    whole = interp.apply_lut3d(lut.table, rgb, method, chunk_size=1 << 16)
+    chunked = interp.apply_lut3d(lut.table, rgb, method, chunk_size=999)
+    assert chunked.shape == rgb.shape
+    np.testing.assert_array_equal(chunked, whole)
+    np.testing.assert_allclose(chunked, lut.apply(rgb, interpolator=_references[method]), rtol=0, atol=1e-12)
+
+def test_apply_lut3x1d_chunk_boundary():
+    lut = colour.LUT3x1D(colour.LUT3x1D.linear_table(1024) ** 2.2)
+    rgb = _inputs(2500).reshape((50, 50, 3))
+    chunked = interp.apply_lut3x1d(lut.table, rgb, chunk_size=999)
+    assert chunked.shape == rgb.shape
+    np.testing.assert_array_equal(chunked, interp.apply_lut3x1d(lut.table, rgb))
+    np.testing.assert_allclose(chunked, lut.apply(rgb), rtol=0, atol=1e-12)
+
+def test_apply_lut3d_unknown_method():
+    with pytest.raises(ValueError):
+        interp.apply_lut3d(_lut3d(2).table, _inputs(10), 'cubic')
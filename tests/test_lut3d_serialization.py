@@ -0,0 +1,94 @@
+import json
+import hashlib
+
+import numpy as np
+import pytest
+
+colour = pytest.importorskip('colour')
+
+from qdcmdiy import store_json, store_xml
+from qdcmdiy.pipeline import ColorPipeline
+
+# Golden outputs of the original per-entry loops and dict converters (before
+# vectorization), as length, SHA-256 and a literal prefix of the serialized
+# text. JSON payloads are compared as their decoded JSON text.
+
+def _luts():
+    return {
+        'identity': colour.LUT3D(size=17),
+        'gamma': colour.LUT3D(colour.LUT3D.linear_table(17) ** np.array([0.8, 1.25, 1 / 2.2])),
+    }
+
+_xml_head = '0000000000000000000000003113000000000000000000000000000000000000'
+
+golden_xml = {
+    'identity': (235856, 'c56997d047e789df43c35616f962d7b49320477f6622076fea3a6d31f72a4237'),
+    'gamma': (235856, '9eaaf6ecf37b941fa2d90eadda7e9ea5b264ffd5910fa5238a783549be37abe5'),
+}
+
+golden_json = {
+    'identity': (80274, 'c6ffc25dc8b6ef3f7a85c5c197b06cc1373db89f585a2aafed2b20e588bb5fd3',
+                 '{"displayID":0,"enable":true,"mapCoarse":["0,0,0","1024,0,0","2048,0,0","3072,0,0","4096,0,0","0,1024,0","1024,1024,0","'),
+    'gamma': (80827, 'a61bfaa48cc263e546cd8a34ba37d6fdd43c42f2d15c21d93fe120f87c04919c',
+              '{"displayID":0,"enable":true,"mapCoarse":["0,0,0","1351,0,0","2353,0,0","3254,0,0","4096,0,0","0,724,0","1351,724,0","23'),
+}
+
+def _sha256(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+@pytest.mark.parametrize('name', sorted(golden_xml))
+def test_lut3d_to_xml_golden(name):
+    text = store_xml.lut3d_to_xml(_luts()[name])
+    assert text.startswith(_xml_head)
+    assert (len(text), _sha256(text)) == golden_xml[name]
+
+def _payload_text(payload):
+    return bytes(store_json.decode_str(payload)).decode()
+
+@pytest.mark.parametrize('name', sorted(golden_json))
+def test_gamut_payload_golden(name):
+    text = _payload_text(store_json.write_payload('PostBlendGamut', _luts()[name]))
+    length, digest, head = golden_json[name]
+    assert text.startswith(head)
+    assert (len(text), _sha256(text)) == (length, digest)
+
+def test_gamut_payload_entry_order():
+    # red varies fastest
+    jdoc = store_json.decode_nested_json(store_json.write_payload('PostBlendGamut', _luts()['gamma']))
+    assert jdoc['mapCoarse'][:8] == ['0,0,0', '1351,0,0', '2353,0,0', '3254,0,0', '4096,0,0', '0,724,0', '1351,724,0', '2353,724,0']
+    assert jdoc['mapFine'][-3:] == ['3681,4096,4096', '3890,4096,4096', '4096,4096,4096']
+
+def test_linear_3dlut_payload_golden():
+    payload = store_json._linear_3dlut_payload()
+    assert (len(payload), _sha256(payload)) == (160550, 'f0044f471b57083592471b38551e214c6111cb6a683423c9006e68297122415d')
+    assert store_json.decode_nested_json(payload)['enable'] is False
+
+# hex payloads, encode_nested_json() of the original dict converters
+golden_shaper = {
+    ('identity', 'PostBlendIGC'): (7474, '234a1b1bf67b9e89fe14b246f9d26377f1369cb4fd20ef0a0d68c1c29a04c194'),
+    ('identity', 'PostBlendGC'): (24208, 'eb2dc9c7cb338318826ae44877a15e234f467bf5625e501a2a1d28c3f11d983b'),
+    ('gamma', 'PostBlendIGC'): (7330, '345d02dca2da5279505d09062a491cf4e1ab72c6be52e9068269c6a3626069b4'),
+    ('gamma', 'PostBlendGC'): (23710, 'c0973dcb0811e33837191338c0612037c410bf94eaf6d920a1afcbedda29ae1b'),
+}
+
+@pytest.mark.parametrize('name, feature', sorted(golden_shaper))
+def test_shaper_payload_golden(name, feature):
+    lut = {
+        'identity': colour.LUT3x1D(size=1024),
+        'gamma': colour.LUT3x1D(colour.LUT3x1D.linear_table(1024) ** np.array([2.2, 1.0, 0.45])),
+    }[name]
+    payload = store_json.write_payload(feature, lut)
+    assert (len(payload), _sha256(payload)) == golden_shaper[name, feature]
+
+def test_patched_mode_uses_written_payloads():
+    lut3d, shaper = _luts()['gamma'], colour.LUT3x1D(colour.LUT3x1D.linear_table(1024) ** 2.2)
+    db = store_json.QdcmDatabaseJson(text=json.dumps({"Copyright": "", "Version": "1", "panel": {"mode0": {
+        "Applicability": {"ColorPrimaries": "sRGB", "GammaTransfer": "sRGB", "RenderIntent": 0}, "DynamicRange": "SDR"}}}))
+    db.get_mode(db.get_mode_names()[0]).set_color_pipeline(ColorPipeline(shaper, lut3d, shaper))
+    mode = db.jdoc['panel']['mode0']
+    for feature, lut in [('PostBlendIGC', shaper), ('PostBlendGamut', lut3d), ('PostBlendGC', shaper)]:
+        assert mode[feature] == store_json.write_payload(feature, lut)
+
+def test_write_payload_unknown_feature():
+    with pytest.raises(ValueError, match='Unknown feature'):
+        store_json.write_payload('PostBlendPCC', colour.LUT3x1D(size=1024))
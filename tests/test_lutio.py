@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+colour = pytest.importorskip('colour')
+
+from qdcmdiy import lutio
+
+def _luts():
+    table3d = colour.LUT3D.linear_table(9)
+    return {
+        '1d': colour.LUT3x1D(colour.LUT3x1D.linear_table(64) ** np.array([2.2, 1.8, 1 / 2.4]), 'shaper'),
+        '3d': colour.LUT3D(table3d[..., [1, 2, 0]] ** 0.9, 'gamut'),
+        '1d_domain': colour.LUT3x1D(colour.LUT3x1D.linear_table(16) ** 2.2, 'wide', domain=np.array([[-0.1, 0, 0], [1, 1.5, 2]])),
+        '3d_domain': colour.LUT3D(table3d * 0.5, 'half', domain=np.array([[0, 0, 0], [2, 2, 2]])),
+    }
+
+def _assert_same_lut(lut, expected):
+    assert type(lut) is type(expected)
+    assert lut.name == expected.name
+    np.testing.assert_array_equal(lut.domain, expected.domain)
+    assert lut.table.shape == expected.table.shape
+    np.testing.assert_array_equal(lut.table, expected.table)
+
+@pytest.fixture
+def colour_reads(monkeypatch):
+    calls = []
+    read_with_colour = lutio._read_with_colour
+    def record(filename):
+        calls.append(filename)
+        return read_with_colour(filename)
+    monkeypatch.setattr(lutio, '_read_with_colour', record)
+    return calls
+
+@pytest.mark.parametrize('name', sorted(_luts()))
+def test_read_cube_matches_colour(tmp_path, colour_reads, name):
+    path = str(tmp_path / f'{name}.cube')
+    colour.io.write_LUT(_luts()[name], path)
+    lut = lutio.read_cube(path)
+    assert not colour_reads
+    _assert_same_lut(lut, colour.io.read_LUT(path))
+
+def _write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_bytes(text.encode())
+    return str(path)
+
+_cube_3d = ''.join(f'{r / 2} {g / 2} {b / 2 + 0.25}\n' for b in range(3) for g in range(3) for r in range(3))
+
+@pytest.mark.parametrize('text', [
+    '# written by hand\nTITLE "hand"\nLUT_3D_SIZE 3\nDOMAIN_MIN 0 0 0\nDOMAIN_MAX 1 1 1\n\n' + _cube_3d,
+    'TITLE "hand"\r\n\tLUT_3D_SIZE\t3\r\n' + _cube_3d.replace('\n', '\r\n'),
+    'LUT_3D_SIZE 3\nDOMAIN_MIN -0.5 0 0\nDOMAIN_MAX 1.5 1 2\n' + _cube_3d,
+    'LUT_1D_SIZE 4\nDOMAIN_MAX 2 2 2\n0 0 0\n0.1 0.2 0.3\n.5 .5 .5\n1e0 1.0E0 +1\n',
+])
+def test_read_hand_written_cube(tmp_path, colour_reads, text):
+    path = _write(tmp_path, 'hand.cube', text)
+    lut = lutio.read_cube(path)
+    assert not colour_reads
+    _assert_same_lut(lut, colour.io.read_LUT(path))
+
+def test_read_cube_red_varies_fastest(tmp_path):
+    lut = lutio.read_cube(_write(tmp_path, 'order.cube', 'LUT_3D_SIZE 3\n' + _cube_3d))
+    np.testing.assert_array_equal(lut.table[1, 0, 0], [0.5, 0, 0.25])
+    np.testing.assert_array_equal(lut.table[0, 0, 2], [0, 0, 1.25])
+
+@pytest.mark.parametrize('text', [
+    # a comment inside the table
+    'LUT_3D_SIZE 3\n' + _cube_3d.replace('1.0 1.0 0.25\n', '1.0 1.0 0.25\n# blue 0.75\n'),
+    # Resolve input ranges
+    'LUT_1D_SIZE 2\nLUT_1D_INPUT_RANGE 0.0 1.0\n0 0 0\n1 1 1\n',
+    'TITLE "resolve"\nLUT_3D_SIZE 3\nLUT_3D_INPUT_RANGE 0.0 1.0\n' + _cube_3d,
+])
+def test_read_cube_falls_back_to_colour(tmp_path, colour_reads, text):
+    path = _write(tmp_path, 'fallback.cube', text)
+    lut = lutio.read_cube(path)
+    assert colour_reads == [path]
+    _assert_same_lut(lut, colour.io.read_LUT(path))
+
+def test_read_cube_wrong_count_falls_back(tmp_path, colour_reads):
+    path = _write(tmp_path, 'short.cube', 'LUT_3D_SIZE 3\n' + _cube_3d[:-12])
+    # colour cannot read it either
+    with pytest.raises(ValueError):
+        lutio.read_cube(path)
+    assert colour_reads == [path]
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('name', sorted(_luts()))
+def test_qlut_round_trip(tmp_path, name, dtype):
+    lut = _luts()[name]
+    path = str(tmp_path / f'{lut.name}.qlut')
+    lutio.write_qlut(lut, path, dtype)
+    read = lutio.read_qlut(path)
+    # colour keeps tables as float64, float32 files are converted on load
+    expected = type(lut)(lut.table.astype(dtype), lut.name, lut.domain)
+    _assert_same_lut(read, expected)
+    assert read.table.dtype == np.float64
+    if dtype == np.float64:
+        # mapped, not copied
+        assert not read.table.flags.owndata and not read.table.flags.writeable
+
+def test_qlut_header(tmp_path):
+    path = tmp_path / 'gamut.qlut'
+    lutio.write_qlut(_luts()['3d'], str(path), np.float32)
+    content = path.read_bytes()
+    assert content[:8] == b'QDCMLUT\0'
+    assert len(content) == 128 + 9 ** 3 * 3 * 4
+
+@pytest.mark.parametrize('edit', [
+    lambda content: b'NOTALUT\0' + content[8:],
+    lambda content: content[:8] + (2).to_bytes(4, 'little') + content[12:],
+    lambda content: content[:12] + (2).to_bytes(4, 'little') + content[16:],
+    lambda content: content[:20] + b'<f2\0' + content[24:],
+    lambda content: content[:100],
+])
+def test_read_qlut_rejects_other_files(tmp_path, edit):
+    path = tmp_path / 'bad.qlut'
+    lutio.write_qlut(_luts()['1d'], str(path))
+    path.write_bytes(edit(path.read_bytes()))
+    with pytest.raises(ValueError):
+        lutio.read_qlut(str(path))
+
+def test_write_qlut_rejects_other_dtypes(tmp_path):
+    with pytest.raises(AssertionError):
+        lutio.write_qlut(_luts()['1d'], str(tmp_path / 'x.qlut'), np.float16)
@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import subprocess
+
+import numpy as np
+import pytest
+
+colour = pytest.importorskip('colour')
+
+from qdcmdiy import simulate, store, store_json
+from qdcmdiy.pipeline import ColorPipeline, Trc
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _identity_db(kind):
+    # an identity IGC, 3D LUT and GC as the database stores them
+    if kind == 'xml':
+        source = b'<?xml version="1.0" encoding="utf-8"?>\n<Calib_Data><Disp_Type Name="panel"/><Mode Name="mode"></Mode></Calib_Data>\n'
+    else:
+        mode = {"Applicability": {"ColorPrimaries": "sRGB", "GammaTransfer": "sRGB", "RenderIntent": 0}, "DynamicRange": "SDR",
+                "PostBlendGC": store_json._linear_gc_payload(), "PostBlendIGC": store_json._linear_igc_payload()}
+        source = json.dumps({"Copyright": "", "Version": "1", "panel": {"mode": mode}}).encode()
+    db = store.loads(source)
+    name = db.get_mode_names()[0]
+    db.get_mode(name).set_color_pipeline(ColorPipeline(colour.LUT3x1D(size=1024), colour.LUT3D(size=17), colour.LUT3x1D(size=1024)))
+    return store.loads(store.dumps(db)).get_mode(name).get_color_pipeline()
+
+def _all_codes(bits):
+    # every code value in every channel, in mixed triples
+    codes = np.arange(1 << bits) / ((1 << bits) - 1)
+    third = len(codes) // 3
+    return [np.stack([codes, np.roll(codes, third), np.roll(codes, 2 * third)], axis=-1)]
+
+@pytest.mark.parametrize('kind', ['xml', 'json'])
+def test_identity_is_lossless_at_10_bits(kind):
+    decoded = _identity_db(kind)
+    assert decoded.gamut is not None
+    stats = simulate.simulate(simulate.DevicePipeline(decoded), None, _all_codes(10))
+    assert stats.count == 1024
+    np.testing.assert_array_equal(stats.max, 0)
+    assert stats.above(0) == 0
+
+def test_identity_xml_is_lossless_at_8_bits():
+    # 8-bit codes come out on the nearest 10-bit code; JSON's 257-entry 12-bit
+    # IGC is not exact enough for that, XML's 256-entry IGC is
+    to_10bit = Trc('10-bit', lambda rgb: simulate.quantize(rgb, 10))
+    chunks = list(simulate.code_value_grid(8, step=5)) + _all_codes(8)
+    stats = simulate.simulate(simulate.DevicePipeline(_identity_db('xml')), to_10bit, chunks)
+    assert stats.count == 52 ** 3 + 256
+    np.testing.assert_array_equal(stats.max, 0)
+
+def test_known_quantization_error():
+    # the GC lowers the top quarter of the codes by 2, code 900 by 3 and the
+    # quarter below by 1
+    codes = np.arange(1024)
+    gc = np.where(codes >= 768, codes - 2, np.where(codes >= 512, codes - 1, codes))
+    gc[900] -= 1
+    device = simulate.DevicePipeline(ColorPipeline(gamma=colour.LUT3x1D(np.stack([gc / 1023] * 3, axis=-1))))
+    rgb = np.stack([codes / 1023] * 3, axis=-1)
+    stats = simulate.simulate(device, None, [rgb[:500], rgb[500:]])
+    assert stats.count == 1024
+    np.testing.assert_allclose(stats.max, 3)
+    np.testing.assert_allclose(stats.sum / stats.count, (255 * 2 + 3 + 256) / 1024)
+    np.testing.assert_allclose(np.sqrt(stats.sum_sq / stats.count), np.sqrt((255 * 4 + 9 + 256) / 1024))
+    np.testing.assert_array_equal(stats.worst_input, 900 / 1023)
+    assert (stats.percentile(50), stats.percentile(75), stats.percentile(99), stats.percentile(100)) == (0, 1, 2, 3)
+    assert (stats.above(0), stats.above(1), stats.above(2), stats.above(3)) == (512, 256, 1, 0)
+    report = stats.report(10).splitlines()
+    assert report[0] == '1024 samples, error in 10-bit output code values'
+    assert report[2].split() == ['R', '3.000', '0.751', '1.120', '900', '900', '900']
+    assert report[-1] == 'worst channel p99 2.000, p99.9 2.000, 256 sample(s) off by more than 1 code'
+
+def test_3dlut_output_scale():
+    # 1027/4096 is 256.499 10-bit codes, read on a 0-4095 scale it would round to 257
+    lut3d = colour.LUT3D(np.full((17, 17, 17, 3), 1027 / 4096))
+    device = simulate.DevicePipeline(ColorPipeline(gamut=lut3d, gamma=colour.LUT3x1D(size=1024)))
+    np.testing.assert_array_equal(device.apply(_all_codes(8)[0]), 256 / 1023)
+
+def test_simulate_requires_mode(tmp_path):
+    proc = subprocess.run([sys.executable, '-m', 'qdcmdiy', 'simulate', str(tmp_path / 'db.json')], cwd=_root, capture_output=True, text=True)
+    assert proc.returncode == 2
+    assert 'the following arguments are required: --mode' in proc.stderr
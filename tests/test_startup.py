@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from helpers import forbidden_modules, make_json_db, make_xml_db, parse_importtime
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# loose enough for a slow machine, tight enough to catch colour/pandas creeping back in
+budget_ms = float(os.environ.get('QDCMDIY_IMPORT_BUDGET_MS', 1000))
+
+_check_modules = """
+import sys, json
+from qdcmdiy.__main__ import main
+forbidden = json.loads(sys.argv[2])
+sys.argv = ['qdcm-diy'] + json.loads(sys.argv[1])
+main()
+print(json.dumps(sorted(name for name in sys.modules if name.split('.')[0] in forbidden)), file=sys.stderr)
+"""
+
+@pytest.fixture(scope='module')
+def databases(tmp_path_factory):
+    tmpdir = tmp_path_factory.mktemp('startup')
+    json_db = str(tmpdir / 'qdcm_calib_data_test.json')
+    xml_db = str(tmpdir / 'qdcm_calib_data_test.xml')
+    make_json_db(json_db)
+    make_xml_db(xml_db)
+    return {'json': json_db, 'xml': xml_db, 'dir': str(tmpdir)}
+
+def _commands(databases):
+    return {
+        'info-json': ['info', databases['json']],
+        'info-xml': ['info', databases['xml']],
+        'index': ['index', databases['dir'], '--db', os.path.join(databases['dir'], 'index.sqlite')],
+    }
+
+@pytest.mark.parametrize('command', ['info-json', 'info-xml', 'index'])
+def test_read_only_commands_do_not_import_heavy_modules(databases, command):
+    argv = _commands(databases)[command]
+    proc = subprocess.run([sys.executable, '-c', _check_modules, json.dumps(argv), json.dumps(forbidden_modules)],
+                          capture_output=True, text=True, cwd=root)
+    assert proc.returncode == 0, proc.stderr
+    assert json.loads(proc.stderr.strip().splitlines()[-1]) == []
+
+@pytest.mark.parametrize('command', ['info-json', 'info-xml'])
+def test_import_time_budget(databases, command):
+    argv = _commands(databases)[command]
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'qdcmdiy', *argv], capture_output=True, text=True, cwd=root)
+    assert proc.returncode == 0, proc.stderr
+    modules = parse_importtime(proc.stderr)
+    assert not [name for name in modules if name.split('.')[0] in forbidden_modules]
+    total_ms = sum(self_us for self_us, _ in modules.values()) / 1000
+    assert total_ms < budget_ms
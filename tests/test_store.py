@@ -0,0 +1,88 @@
+import os
+import sys
+import stat
+import time
+import subprocess
+
+import pytest
+
+from qdcmdiy import store
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class _TextDatabase:
+    def __init__(self, text, fail=False):
+        self.text = text
+        self.fail = fail
+
+    def dump(self, io):
+        io.write(self.text[:len(self.text) // 2])
+        if self.fail:
+            raise RuntimeError("dump failed")
+        io.write(self.text[len(self.text) // 2:])
+
+def _leftovers(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.tmp'))
+
+def test_save_replaces_file(tmp_path):
+    target = tmp_path / 'db.json'
+    target.write_text('old')
+    store.save(_TextDatabase('{"new": true}'), str(target))
+    assert target.read_text() == '{"new": true}'
+    assert _leftovers(tmp_path) == []
+
+@pytest.mark.skipif(os.name == 'nt', reason='POSIX permission bits')
+@pytest.mark.parametrize('mode', [0o600, 0o640, 0o664])
+def test_save_keeps_permissions(tmp_path, mode):
+    target = tmp_path / 'db.json'
+    target.write_text('old')
+    os.chmod(target, mode)
+    store.save(_TextDatabase('new'), str(target))
+    assert stat.S_IMODE(os.stat(target).st_mode) == mode
+
+@pytest.mark.skipif(os.name == 'nt', reason='POSIX permission bits')
+def test_save_new_file_follows_umask(tmp_path):
+    umask = os.umask(0o027)
+    try:
+        store.save(_TextDatabase('new'), str(tmp_path / 'db.json'))
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(tmp_path / 'db.json').st_mode) == 0o640
+
+@pytest.mark.parametrize('exists', [True, False])
+def test_failed_dump_leaves_target_and_no_tmp(tmp_path, exists):
+    target = tmp_path / 'db.json'
+    if exists:
+        target.write_text('old')
+    with pytest.raises(RuntimeError):
+        store.save(_TextDatabase('x' * 100, fail=True), str(target))
+    assert _leftovers(tmp_path) == []
+    if exists:
+        assert target.read_text() == 'old'
+    else:
+        assert not target.exists()
+
+_lock_child = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from qdcmdiy import store
+print('waiting', flush=True)
+with store.locked(sys.argv[2]):
+    print('locked', flush=True)
+"""
+
+def test_locked_blocks_second_process(tmp_path):
+    target = str(tmp_path / 'db.json')
+    with store.locked(target):
+        child = subprocess.Popen([sys.executable, '-c', _lock_child, _root, target], stdout=subprocess.PIPE, text=True)
+        try:
+            assert child.stdout.readline() == 'waiting\n'
+            time.sleep(0.5)
+            assert child.poll() is None
+        except BaseException:
+            child.kill()
+            raise
+    assert child.stdout.readline() == 'locked\n'
+    assert child.wait(timeout=30) == 0
+    # the lock is a sidecar file, the database itself is never created
+    assert os.listdir(tmp_path) == ['.db.json.lock']
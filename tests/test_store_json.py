@@ -0,0 +1,53 @@
+import io
+import json
+
+import pytest
+
+from qdcmdiy import store_json
+from qdcmdiy.store_json import QdcmDatabaseJson
+
+def _mode(intent):
+    return {
+        "Applicability": {"ColorPrimaries": "sRGB", "GammaTransfer": "sRGB", "RenderIntent": intent},
+        "DynamicRange": "SDR",
+        "PostBlendGC": store_json._linear_gc_payload(),
+        "PostBlendIGC": store_json._linear_igc_payload(),
+    }
+
+def _canonical_db():
+    jdoc = {"Copyright": "", "Version": "1", "panel": {"mode0": _mode(0), "mode1": _mode(1)}}
+    return QdcmDatabaseJson(text=json.dumps(jdoc, indent=None, separators=(',', ':')))
+
+def _dump(db):
+    out = io.StringIO()
+    db.dump(out)
+    return out.getvalue()
+
+def _full_dump(db):
+    return json.dumps(db.jdoc, indent=None, separators=(',', ':'))
+
+def test_unchanged_dump_is_source():
+    db = _canonical_db()
+    assert db.canonical
+    assert _dump(db) == db.text
+
+@pytest.mark.parametrize('edit', [
+    lambda jdoc: jdoc.__setitem__('Version', '2'),
+    lambda jdoc: jdoc['panel']['mode1']['Applicability'].__setitem__('RenderIntent', 7),
+    lambda jdoc: jdoc['panel']['mode0'].__setitem__('DynamicRange', 'HDR'),
+    lambda jdoc: jdoc['panel']['mode0'].__setitem__('PostBlendGC', store_json._linear_igc_payload()),
+    lambda jdoc: jdoc['panel']['mode0'].__setitem__('Extra', [1, 2]),
+    lambda jdoc: jdoc['panel'].__setitem__('mode2', {}),
+    lambda jdoc: jdoc.__setitem__('panel', 'gone'),
+])
+def test_dump_after_edit_matches_full_dump(edit):
+    db = _canonical_db()
+    edit(db.jdoc)
+    assert _dump(db) == _full_dump(db)
+
+def test_dump_after_several_edits_matches_full_dump():
+    db = _canonical_db()
+    db.jdoc['Version'] = '2'
+    db.jdoc['panel']['mode1']['Applicability']['RenderIntent'] = True
+    db.jdoc['panel']['mode0']['PostBlendIGC'] = store_json._linear_gc_payload()
+    assert _dump(db) == _full_dump(db)
@@ -0,0 +1,162 @@
+import numpy as np
+import pytest
+
+colour = pytest.importorskip('colour')
+
+from qdcmdiy import store, store_xml
+from qdcmdiy.pipeline import ColorPipeline
+from qdcmdiy.store_xml import QdcmDatabaseXml
+
+_igc = colour.LUT3x1D(size=256)
+_gc = colour.LUT3x1D(size=1024)
+
+# a stock-like file: CRLF line ends, comments, mixed quoting, a self-closing
+# feature, features the patch must leave alone and a mode without GC and gamut
+_stock = '\r\n'.join([
+    '<?xml version="1.0" encoding="utf-8"?>',
+    '<!-- QDCM calibration data, do not edit -->',
+    "<Calib_Data Version='2'>",
+    "  <Disp_Type Name='test panel' />",
+    '  <Modes>',
+    "    <Mode Name='demo_srgb' ModeID='0'>",
+    '      <!-- <Feature FeatureType="7"> is commented out here -->',
+    "      <Feature FeatureType='7' Disable='true' DataSize='12300'/>",
+    f'      <Feature FeatureType="3" Disable="false" DataSize="117928">{store_xml.lut3d_to_xml(colour.LUT3D(size=17))}</Feature>',
+    "      <Feature FeatureType='8' Disable='false' DataSize='12300'>",
+    f'        {store_xml.lut3x1d_to_gc_xml(_gc)}',
+    '      </Feature>',
+    f"      <Feature FeatureType='6' Disable='false' DataSize='12300'>{store_xml.lut3x1d_to_gc_xml(_gc)}</Feature>",
+    f'      <Feature FeatureType="2" Disable="false" DataSize="272">{"00" * 272}</Feature>',
+    "      <Feature FeatureType='10' Disable='false' DataSize='4'>01000000</Feature>",
+    '    </Mode>',
+    "    <Mode Name='demo_p3' ModeID='1'>",
+    f"      <Feature FeatureType='7' Disable='false' DataSize='12300'>{store_xml.lut3x1d_to_igc_xml(_igc)}</Feature>",
+    '    </Mode>',
+    '  </Modes>',
+    '</Calib_Data>',
+    '',
+]).encode()
+
+def _pipeline(degamma=True, gamut=True, gamma=True):
+    table = colour.LUT3D.linear_table(17)
+    return ColorPipeline(
+        degamma=colour.LUT3x1D(colour.LUT3x1D.linear_table(256) ** 2.2) if degamma else None,
+        gamut=colour.LUT3D(table[..., [1, 2, 0]] ** np.array([0.8, 1.25, 1 / 2.2])) if gamut else None,
+        gamma=colour.LUT3x1D(colour.LUT3x1D.linear_table(1024) ** (1 / 2.2)) if gamma else None,
+    )
+
+def _features(db, mode):
+    return {feature.get_attribute('FeatureType'): feature for feature in db.get_mode(mode).features}
+
+def _text(db, mode, feature_type):
+    feature = _features(db, mode)[feature_type]
+    return feature.get_attribute('Disable'), feature.get_text(db.encoding).strip()
+
+def _outside(source, regions):
+    # the bytes between the given (start, end) regions
+    pos, gaps = 0, []
+    for start, end in sorted(regions):
+        gaps.append(source[pos:start])
+        pos = end
+    gaps.append(source[pos:])
+    return gaps
+
+def _patched_regions(db):
+    regions = []
+    for mode in db.modes.values():
+        regions += [(feature.start, feature.end) for feature in mode.features if feature.is_modified()]
+        if mode.new_features:
+            regions.append((mode.element.end_tag_start, mode.element.end_tag_start))
+    return regions
+
+def _rewritten_regions(patched, db):
+    # the same features in the dumped file, and the appended ones as one region
+    regions = []
+    for name, mode in patched.modes.items():
+        features = db.get_mode(name).features
+        regions += [(features[i].start, features[i].end) for i, feature in enumerate(mode.features) if feature.is_modified()]
+        appended = features[len(mode.features):]
+        assert len(appended) == len(mode.new_features)
+        if appended:
+            regions.append((appended[0].start, appended[-1].end))
+    return regions
+
+def _patch(modes):
+    db = QdcmDatabaseXml(source=_stock)
+    for mode, pipeline in modes.items():
+        db.get_mode(mode).set_color_pipeline(pipeline)
+    out = store.dumps(db)
+    return db, out, QdcmDatabaseXml(source=out)
+
+def test_unchanged_dump_is_source():
+    db = QdcmDatabaseXml(source=_stock)
+    assert db.panel_name == 'test panel'
+    assert db.get_mode_names() == ['demo_srgb', 'demo_p3']
+    assert store.dumps(db) == _stock
+
+@pytest.mark.parametrize('modes', [
+    {'demo_srgb': _pipeline()},
+    {'demo_p3': _pipeline()},
+    {'demo_srgb': _pipeline(degamma=False), 'demo_p3': _pipeline(gamma=False)},
+    {'demo_srgb': ColorPipeline(), 'demo_p3': _pipeline(degamma=False, gamma=False)},
+])
+def test_dump_changes_only_patched_features(modes):
+    patched, out, db = _patch(modes)
+    assert b'\r\n' in out and b'\n' not in out.replace(b'\r\n', b'')
+    assert _outside(out, _rewritten_regions(patched, db)) == _outside(_stock, _patched_regions(patched))
+
+def test_round_trip():
+    pipeline = _pipeline()
+    payloads = {
+        '7': store_xml.lut3x1d_to_igc_xml(pipeline.degamma),
+        '3': store_xml.lut3d_to_xml(pipeline.gamut),
+        '8': store_xml.lut3x1d_to_gc_xml(pipeline.gamma),
+    }
+    patched, _, db = _patch({'demo_srgb': pipeline, 'demo_p3': pipeline})
+    for mode in ('demo_srgb', 'demo_p3'):
+        for feature_type, payload in payloads.items():
+            assert _text(db, mode, feature_type) == ('false', payload)
+        for source in (patched, db):
+            decoded = source.get_mode(mode).get_color_pipeline()
+            assert store_xml.lut3x1d_to_igc_xml(decoded.degamma) == payloads['7']
+            assert store_xml.lut3d_to_xml(decoded.gamut) == payloads['3']
+            assert store_xml.lut3x1d_to_gc_xml(decoded.gamma) == payloads['8']
+    assert _text(db, 'demo_srgb', '6')[0] == 'true'
+    assert _text(db, 'demo_srgb', '2')[0] == 'true'
+    assert _text(db, 'demo_srgb', '10') == ('false', '01000000')
+
+def test_self_closing_feature():
+    pipeline = _pipeline()
+    _, out, db = _patch({'demo_srgb': pipeline})
+    assert b"<Feature FeatureType='7' Disable=\"false\" DataSize='12300'>" + store_xml.lut3x1d_to_igc_xml(pipeline.degamma).encode() + b'</Feature>' in out
+    assert _text(db, 'demo_p3', '7') == ('false', store_xml.lut3x1d_to_igc_xml(_igc))
+
+def test_missing_stage_disables_feature():
+    _, _, db = _patch({'demo_srgb': ColorPipeline()})
+    for feature_type in ('7', '3', '8', '6', '2'):
+        assert _text(db, 'demo_srgb', feature_type)[0] == 'true'
+    assert db.get_mode('demo_srgb').get_color_pipeline().gamut is None
+
+# behaviours fixed when the store moved off minidom
+
+def test_gc_feature_is_gated_on_gamma_and_gc_encoded():
+    pipeline = _pipeline(degamma=False)
+    _, _, db = _patch({'demo_srgb': pipeline})
+    assert _text(db, 'demo_srgb', '7')[0] == 'true'
+    assert _text(db, 'demo_srgb', '8') == ('false', store_xml.lut3x1d_to_gc_xml(pipeline.gamma))
+
+def test_appended_features_carry_their_own_payload():
+    pipeline = _pipeline()
+    _, _, db = _patch({'demo_p3': pipeline})
+    features = db.get_mode('demo_p3').features
+    assert [feature.get_attribute('FeatureType') for feature in features] == ['7', '8', '3']
+    assert [feature.get_attribute('DataSize') for feature in features[1:]] == ['12300', '117928']
+    assert _text(db, 'demo_p3', '7') == ('false', store_xml.lut3x1d_to_igc_xml(pipeline.degamma))
+    assert _text(db, 'demo_p3', '8') == ('false', store_xml.lut3x1d_to_gc_xml(pipeline.gamma))
+    assert _text(db, 'demo_p3', '3') == ('false', store_xml.lut3d_to_xml(pipeline.gamut))
+
+def test_gamut_is_appended_without_gamma():
+    pipeline = _pipeline(degamma=False, gamma=False)
+    _, _, db = _patch({'demo_p3': pipeline})
+    assert list(_features(db, 'demo_p3')) == ['7', '3']
+    assert _text(db, 'demo_p3', '3') == ('false', store_xml.lut3d_to_xml(pipeline.gamut))
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+colour = pytest.importorskip('colour')
+
+from qdcmdiy import transfer
+from qdcmdiy.pipeline import Trc
+
+_x = np.linspace(0, 1, 4097)
+
+def _arib_oetf(y):
+    # ARIB STD-B67 takes scene light on a 0-12 scale
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return colour.oetf(12 * y, 'ARIB STD-B67')
+
+references = {
+    'srgb-eotf': lambda x: colour.eotf(x, 'sRGB'),
+    'srgb-eotf-inverse': lambda y: colour.eotf_inverse(y, 'sRGB'),
+    'pq-eotf': lambda x: colour.eotf(x, 'ST 2084') / 10000,
+    'pq-eotf-inverse': lambda y: colour.eotf_inverse(y * 10000, 'ST 2084'),
+    'hlg-oetf': _arib_oetf,
+    'hlg-oetf-inverse': lambda x: colour.oetf_inverse(x, 'ARIB STD-B67') / 12,
+    'bt1886-eotf': lambda x: colour.eotf(x, 'ITU-R BT.1886'),
+    'bt1886-eotf-inverse': lambda y: colour.eotf_inverse(y, 'ITU-R BT.1886'),
+}
+
+@pytest.mark.parametrize('name', sorted(references))
+def test_matches_colour(name):
+    # ARIB STD-B67 gives its constant c to 8 digits, transfer derives it from a and b
+    atol = 1e-7 if name.startswith('hlg') else 1e-12
+    np.testing.assert_allclose(transfer.builtin(name).apply(_x), references[name](_x), rtol=1e-9, atol=atol)
+
+def test_functions_match_colour():
+    np.testing.assert_allclose(transfer.srgb_eotf(_x), colour.eotf(_x, 'sRGB'), atol=1e-12)
+    np.testing.assert_allclose(transfer.pq_eotf(_x), colour.eotf(_x, 'ST 2084') / 10000, atol=1e-12)
+    np.testing.assert_allclose(transfer.hlg_oetf(_x), _arib_oetf(_x), atol=1e-9)
+
+@pytest.mark.parametrize('forward, inverse', [
+    ('srgb-eotf', 'srgb-eotf-inverse'),
+    ('pq-eotf', 'pq-eotf-inverse'),
+    ('hlg-oetf', 'hlg-oetf-inverse'),
+    ('bt1886-eotf', 'bt1886-eotf-inverse'),
+    ('gamma-2.2', 'gamma-2.2-inverse'),
+])
+def test_round_trip(forward, inverse):
+    forward, inverse = transfer.builtin(forward), transfer.builtin(inverse)
+    # ST 2084 encodes 0 cd/m^2 as c1^m2 (7.3e-7), far below a 12-bit step
+    np.testing.assert_allclose(inverse.apply(forward.apply(_x)), _x, atol=1e-6)
+    np.testing.assert_allclose(forward.apply(inverse.apply(_x)), _x, atol=1e-9)
+
+def test_per_channel_sampling():
+    lut = transfer.builtin('builtin:pq-eotf').sample_3x1d(1024)
+    assert lut.table.shape == (1024, 3)
+    expected = transfer.pq_eotf(np.linspace(0, 1, 1024))
+    for channel in range(3):
+        np.testing.assert_allclose(lut.table[:, channel], expected, atol=1e-12)
+
+@pytest.mark.parametrize('name, exponent', [('gamma-2.2', 2.2), ('gamma-2.4-inverse', 1 / 2.4), ('gamma-1', 1.0), ('gamma-0.5', 0.5)])
+def test_gamma(name, exponent):
+    np.testing.assert_allclose(transfer.builtin(name).apply(_x), _x ** exponent, atol=1e-12)
+
+def test_builtin_names():
+    trc = transfer.builtin('builtin:srgb-eotf')
+    assert isinstance(trc, Trc)
+    assert trc.name == 'builtin:srgb-eotf'
+    assert transfer.builtin('srgb-eotf').digest() == trc.digest()
+    assert transfer.builtin('srgb-eotf-inverse').digest() != trc.digest()
+    assert transfer.builtin('gamma-2.2').digest() != transfer.builtin('gamma-2.2-inverse').digest()
+    assert transfer.is_builtin('builtin:gamma-2.2')
+    assert not transfer.is_builtin('srgb-to-linear.cube')
+    for name in transfer.builtin_names:
+        if '<N>' not in name:
+            transfer.builtin(name)
+
+@pytest.mark.parametrize('name', ['nope', 'builtin:srgb', 'gamma-', 'gamma-0', 'gamma--2', 'gamma-x', 'gamma-2.2-inverse-inverse'])
+def test_unknown_builtin(name):
+    with pytest.raises(ValueError, match='Unknown builtin transfer function'):
+        transfer.builtin(name)